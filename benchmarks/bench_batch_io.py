@@ -0,0 +1,71 @@
+"""
+Benchmark of per-packet and batched (sendmmsg/recvmmsg) socket I/O over loopback UDP:
+packets per second and system calls per packet
+
+Run from the repository root:
+    python -m benchmarks.bench_batch_io [N]
+"""
+import selectors
+import socket
+import sys
+import time
+from src.modules.transport.BatchSocket import BatchSocket
+
+
+def run(count: int, batch_size: int) -> dict:
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.setblocking(False)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.setblocking(False)
+    address = receiver.getsockname()
+    send_batch = BatchSocket(sender, batch_size)
+    recv_batch = BatchSocket(receiver, batch_size)
+    payload = b'\0' * 20
+
+    sel = selectors.DefaultSelector()
+    sel.register(sender, selectors.EVENT_WRITE)
+    sel.register(receiver, selectors.EVENT_READ)
+    queued = received = 0
+    start = time.perf_counter()
+    deadline = start + 30
+    while received < queued or queued < count:
+        if time.perf_counter() > deadline:
+            break
+        for key, mask in sel.select(timeout=0.1):
+            if key.fileobj is receiver:
+                received += len(recv_batch.recv())
+            elif queued < count:
+                while send_batch.free > 0 and queued < count:
+                    send_batch.queue(payload, address)
+                    queued += 1
+                send_batch.flush()
+        if queued >= count and send_batch.free == send_batch.batch_size and not sel.select(timeout=0.05):
+            break
+    elapsed = time.perf_counter() - start
+    sel.close()
+    sender.close()
+    receiver.close()
+    syscalls = send_batch.syscalls + recv_batch.syscalls
+    return {
+        'batch_size': batch_size,
+        'batched': send_batch.batched,
+        'sent': send_batch.packets_sent,
+        'received': received,
+        'seconds': round(elapsed, 3),
+        'pps': round(send_batch.packets_sent / elapsed),
+        'syscalls_per_packet': round(syscalls / max(1, send_batch.packets_sent), 3),
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f'{"batch":>6}{"batched":>9}{"sent":>10}{"received":>10}{"pps":>10}{"syscalls/pkt":>14}')
+    for batch_size in (1, 16, 64):
+        result = run(count, batch_size)
+        print(f'{result["batch_size"]:>6}{str(result["batched"]):>9}{result["sent"]:>10}'
+              f'{result["received"]:>10}{result["pps"]:>10}{result["syscalls_per_packet"]:>14}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of the service fingerprint database: load in a new process (imports excluded) with
+and without the on-disk cache, and banner matching with the combined pattern vs rule by rule
+
+Run from the repository root:
+    python -m benchmarks.bench_fingerprints [N]
+"""
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from src.modules.guess.FingerprintDB import FingerprintDB, default_db
+
+BANNERS = [
+    b'SSH-2.0-OpenSSH_8.9p1 Ubuntu-3ubuntu0.1\r\n',
+    b'220 (vsFTPd 3.0.3)\r\n',
+    b'220 mail.example.com ESMTP Postfix (Ubuntu)\r\n',
+    b'HTTP/1.1 200 OK\r\nDate: Mon, 01 Jan 2024 00:00:00 GMT\r\nServer: nginx/1.18.0\r\n\r\n',
+    b'HTTP/1.0 404 Not Found\r\nServer: BaseHTTP/0.6 Python/3.11.2\r\n\r\n',
+    b'+PONG\r\n',
+    b'\x16\x03\x03\x00\x02\x02\x28',
+    b'unknown service banner\r\n',
+]
+
+_LOAD = '''
+import time
+from src.modules.guess.FingerprintDB import FingerprintDB
+start = time.perf_counter()
+FingerprintDB.load(cache_dir={cache_dir!r})
+print(time.perf_counter() - start)
+'''
+
+
+def cold_load(cache_dir: str) -> float:
+    output = subprocess.run([sys.executable, '-c', _LOAD.format(cache_dir=cache_dir)],
+                            capture_output=True, text=True, check=True).stdout
+    return float(output)
+
+
+def match_rule_by_rule(rules, data: bytes):
+    for pattern in rules:
+        found = pattern.match(data)
+        if found is not None:
+            return found
+    return None
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as cache_dir:
+        no_cache = cold_load('')
+        cold_load(cache_dir)
+        cached = cold_load(cache_dir)
+    print(f'cold load without cache {no_cache * 1000:>8.2f} ms')
+    print(f'cold load with cache    {cached * 1000:>8.2f} ms')
+
+    db = default_db()
+    rules = [re.compile((f'(?{rule.flags}:{rule.pattern})' if rule.flags else rule.pattern).encode('latin-1'))
+             for rule in db.rules]
+    banners = (BANNERS * (count // len(BANNERS) + 1))[:count]
+    for name, func in (('combined pattern', db.match), ('rule by rule', lambda data: match_rule_by_rule(rules, data))):
+        start = time.perf_counter()
+        for data in banners:
+            func(data)
+        elapsed = time.perf_counter() - start
+        print(f'{name:<24}{count / elapsed:>12.0f} banners/s  ({len(rules)} rules)')
+
+
+if __name__ == '__main__':
+    main()
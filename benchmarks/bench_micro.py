@@ -0,0 +1,165 @@
+"""
+Micro-benchmarks of the per-packet hot paths: tcp package build, checksum and header parsing,
+ICMP decoding, port extraction, port range parsing, PortSet operations, DNS PTR query build and
+answer parsing and TimeDict operations.
+Every case is timed with timeit, the best of REPEAT runs is reported in ns per operation
+
+Run from the repository root:
+    python -m benchmarks.bench_micro [--repeat N] [--filter TEXT] [--json FILE]
+"""
+import argparse
+import statistics
+import struct
+import sys
+import time
+import timeit
+from src.modules.console.ArgParser import ArgParser
+from src.modules.helpers import get_port_from_data
+from src.modules.imported.TimeDict import TimeDict
+from src.modules.protocols.DNS import encode_name, parse_ptr_answer, ptr_query
+from src.modules.protocols.ICMP import ICMP
+from src.modules.protocols.TCPPackage import TCPPackage, TCPTemplate
+from src.modules.structures.PortSet import PortSet
+from src.modules.structures.TimerWheel import TimerWheel
+from benchmarks.report import write_json
+
+SOURCE, TARGET = '10.0.0.1', '10.0.0.2'
+TIMED_ENTRIES = 100_000
+
+
+def _ip_header(protocol: int, length: int, source: str, destination: str) -> bytes:
+    return struct.pack('!BBHHHBBH4s4s', 0x45, 0, length, 0, 0, 64, protocol, 0,
+                       bytes(map(int, source.split('.'))), bytes(map(int, destination.split('.'))))
+
+
+def packets() -> dict:
+    """
+    Packets as received by the scanners
+    """
+    syn = TCPPackage(SOURCE, 40000, TARGET, 80, 0x02).build()
+    syn_ack = TCPPackage(TARGET, 80, SOURCE, 40000, 0x12, 12345).build()
+    udp_probe = struct.pack('!HHHH', 40000, 53, 8, 0)
+    unreachable = struct.pack('!BBHI', 3, 3, 0, 0) + _ip_header(17, 28, SOURCE, TARGET) + udp_probe
+    query = ptr_query(1, TARGET)
+    name = encode_name('host.example.org')
+    ptr = b'\xc0\x0c' + struct.pack('!HHIH', 12, 1, 3600, len(name)) + name
+    return {
+        'syn': syn,
+        'pseudo_and_syn': struct.pack('!4s4sHH', bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2]), 6, 20) + syn,
+        'syn_ack': syn_ack,
+        'ip_syn_ack': _ip_header(6, 40, TARGET, SOURCE) + syn_ack,
+        'icmp_unreachable': _ip_header(1, 20 + len(unreachable), TARGET, SOURCE) + unreachable,
+        'ptr_answer': struct.pack('!HHHHHH', 1, 0x8180, 1, 1, 0, 0) + query[12:] + ptr,
+    }
+
+
+def cases() -> list:
+    """
+    (name, operation) of every benchmark
+    """
+    data = packets()
+    package = TCPPackage(SOURCE, 40000, TARGET, 80, 0x02)
+    template = TCPTemplate(SOURCE, TARGET, 0x02)
+    parser = ArgParser([])
+    icmp = data['icmp_unreachable']
+    single_ports = 'tcp/' + ','.join(str(port) for port in range(1, 2001, 2))
+    port_set = PortSet.parse(single_ports[4:])
+
+    def icmp_decode():
+        packet = ICMP(icmp)
+        return packet.decode_icmp_type(), packet.get_destination_port()
+
+    return [
+        ('TCPPackage.build', package.build),
+        ('TCPTemplate.build', lambda: template.build(40000, 80, 12345)),
+        ('TCPPackage.check_sum', lambda: TCPPackage.check_sum(data['pseudo_and_syn'])),
+        ('TCPPackage.tcp_head_parse', lambda: TCPPackage.tcp_head_parse(data['syn_ack'])),
+        ('ICMP decode type and port', icmp_decode),
+        ('get_port_from_data', lambda: get_port_from_data(data['ip_syn_ack'])),
+        ('parse_ports tcp/1-65535', lambda: parser.parse_ports(['tcp/1-65535'])),
+        ('parse_ports tcp+udp 1-65535', lambda: parser.parse_ports(['tcp/1-65535', 'udp/1-65535'])),
+        ('parse_ports 1000 single ports', lambda: parser.parse_ports([single_ports])),
+        ('PortSet index 1000 single ports', lambda: port_set[700]),
+        ('PortSet contains', lambda: 1999 in port_set),
+        ('PortSet difference', lambda: port_set.difference(PortSet([(500, 1500)]))),
+        ('DNS ptr_query', lambda: ptr_query(12345, TARGET)),
+        ('DNS parse_ptr_answer', lambda: parse_ptr_answer(data['ptr_answer'])),
+    ]
+
+
+def measure(operation, repeat: int) -> dict:
+    timer = timeit.Timer(operation)
+    number, _ = timer.autorange()
+    times = [elapsed / number * 1e9 for elapsed in timer.repeat(repeat, number)]
+    return {'ns_per_op': round(min(times), 1), 'median_ns_per_op': round(statistics.median(times), 1),
+            'loops': number}
+
+
+def timed_structures(count: int) -> list:
+    """
+    Insert, lookup and delete of count entries and expiry delay of TimeDict, TimerWheel for comparison
+    """
+    results = []
+
+    def run(name, func, ops):
+        start = time.perf_counter()
+        func()
+        results.append({'name': name, 'ns_per_op': round((time.perf_counter() - start) / ops * 1e9, 1),
+                        'loops': ops})
+
+    action_time = 0.5
+    time_dict = TimeDict(action_time, action_time / 4)
+    try:
+        run('TimeDict insert', lambda: [time_dict.__setitem__(i, i) for i in range(count)], count)
+        inserted = time.perf_counter()
+        run('TimeDict lookup', lambda: [i in time_dict for i in range(count)], count)
+        run('TimeDict delete', lambda: [time_dict.__delitem__(i) for i in range(0, count, 2)], count // 2)
+        while len(time_dict) > 0:
+            time.sleep(0.001)
+        # the last entry was inserted at inserted time
+        late = time.perf_counter() - inserted - action_time
+        results.append({'name': 'TimeDict expiry late by', 'ms': round(late * 1e3, 1),
+                        'entries': count - count // 2})
+    finally:
+        time_dict.destroy()
+
+    wheel = TimerWheel(action_time, lambda key, value: None)
+    run('TimerWheel insert', lambda: [wheel.__setitem__(i, i) for i in range(count)], count)
+    run('TimerWheel lookup', lambda: [i in wheel for i in range(count)], count)
+    run('TimerWheel delete', lambda: [wheel.__delitem__(i) for i in range(0, count, 2)], count // 2)
+    time.sleep(action_time)
+    run('TimerWheel expire', wheel.expire, count - count // 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the scanner hot paths')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs of every case (5 by default)')
+    parser.add_argument('--filter', type=str, default='', help='run only cases containing TEXT')
+    parser.add_argument('--json', type=str, metavar='FILE', help="write results to FILE, '-' for stdout")
+    args = parser.parse_args()
+
+    # the table goes to stderr when the report goes to stdout
+    out = sys.stderr if args.json == '-' else sys.stdout
+    results = []
+    print(f'{"case":<32}{"ns/op":>14}{"median":>14}', file=out)
+    for name, operation in cases():
+        if args.filter in name:
+            result = {'name': name, **measure(operation, args.repeat)}
+            results.append(result)
+            print(f'{name:<32}{result["ns_per_op"]:>14.1f}{result["median_ns_per_op"]:>14.1f}', file=out)
+    if not args.filter or args.filter.startswith('Time'):
+        for result in timed_structures(TIMED_ENTRIES):
+            if args.filter not in result['name']:
+                continue
+            results.append(result)
+            if 'ms' in result:
+                print(f'{result["name"]:<32}{result["ms"]:>11.1f} ms', file=out)
+            else:
+                print(f'{result["name"]:<32}{result["ns_per_op"]:>14.1f}', file=out)
+    if args.json:
+        write_json(args.json, 'micro', {'repeat': args.repeat, 'timed_entries': TIMED_ENTRIES}, results)
+
+
+if __name__ == '__main__':
+    main()
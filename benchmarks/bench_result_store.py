@@ -0,0 +1,99 @@
+"""
+Result store: writing, sorting and diffing two scans of N open or filtered ports spread over hosts
+with 20 ports each, where a fraction of the ports changed between the scans. The diff is checked
+against a diff of the json lines results log (the --checkpoint format) loaded into dicts
+
+Run from the repository root:
+    python -m benchmarks.bench_result_store [N] [CHANGED]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from src.modules.scanners.ScanEvent import ScanEvent, OPEN, FILTERED
+from src.modules.structures.ResultStore import StoreWriter, ResultStore, diff
+from src.modules.structures.TargetSet import int_to_ip
+
+PORTS_PER_HOST = 20
+FIRST_HOST = 0x0a000000
+
+
+def scan(count: int, changed: float, seed: int):
+    """
+    Result events in random order, hosts and ports of both scans are the same apart from changed ones
+    """
+    rng = random.Random(seed)
+    shuffle = random.Random(0)
+    events = []
+    for i in range(count):
+        host, port = FIRST_HOST + i // PORTS_PER_HOST, 1 + i % PORTS_PER_HOST * 997
+        state = OPEN if i % 3 else FILTERED
+        if seed and rng.random() < changed:
+            choice = rng.random()
+            if choice < 0.3:
+                continue
+            state = FILTERED if state == OPEN else OPEN
+            if choice > 0.6:
+                port += 1
+        events.append(ScanEvent('tcp' if i % 2 else 'udp', int_to_ip(host), port, state, rng.randrange(1, 200)))
+    shuffle.shuffle(events)
+    return events
+
+
+def _measure(name: str, func, count: int):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<28}{elapsed:>10.3f} s{elapsed / count * 1e9:>12.0f} ns/record')
+    return result
+
+
+def write_store(path: str, events):
+    writer = StoreWriter(path)
+    for event in events:
+        writer.add(event)
+    return writer
+
+
+def write_log(path: str, events):
+    with open(path, 'wb') as f:
+        for event in events:
+            f.write(json.dumps(list(event)).encode() + b'\n')
+
+
+def diff_logs(old_path: str, new_path: str):
+    def load(path):
+        with open(path, 'rb') as f:
+            return {(event[1], event[0], event[2]): event[3] for event in map(json.loads, f)}
+    old, new = load(old_path), load(new_path)
+    return sorted((key, old.get(key), new.get(key)) for key in old.keys() | new.keys() if old.get(key) != new.get(key))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    changed = float(sys.argv[2]) if len(sys.argv) > 2 else 0.001
+    print(f'{count} records, {count // PORTS_PER_HOST} hosts, {changed:.1%} changed')
+    old_events, new_events = scan(count, changed, 0), scan(count, changed, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {name: os.path.join(directory, name) for name in ('old', 'new', 'old.json', 'new.json')}
+        writers = [_measure(f'write {name}', lambda: write_store(paths[name], events), count)
+                   for name, events in (('old', old_events), ('new', new_events))]
+        for name, writer in zip(('old', 'new'), writers):
+            _measure(f'close and sort {name}', writer.close, count)
+        print(f'{"store size":<28}{os.path.getsize(paths["new"]) / 2 ** 20:>10.1f} MB'
+              f'{os.path.getsize(paths["new"]) / len(new_events):>12.1f} bytes/record')
+        with ResultStore(paths['old']) as old, ResultStore(paths['new']) as new:
+            changes = _measure('diff stores', lambda: list(diff(old, new)), count)
+            host = int_to_ip(FIRST_HOST + count // PORTS_PER_HOST // 2)
+            _measure('diff one host', lambda: list(diff(old, new, host)), 1)
+        write_log(paths['old.json'], old_events)
+        write_log(paths['new.json'], new_events)
+        expected = _measure('diff json logs', lambda: diff_logs(paths['old.json'], paths['new.json']), count)
+    found = sorted(((change.host, change.protocol, change.port), change.old, change.new) for change in changes)
+    print(f'{len(changes)} changes, {"same as" if found == expected else "DIFFERENT from"} json logs diff')
+
+
+if __name__ == '__main__':
+    main()
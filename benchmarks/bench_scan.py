@@ -0,0 +1,211 @@
+"""
+End-to-end scan benchmark: TCPScanner (stateful and stateless) and UDPScanner against targets in a
+network namespace behind a veth pair. tc netem adds one way latency and loss in both directions.
+Every target host has OPEN open ports (tcp listeners and udp echo servers), the other ports are closed.
+Reports probes per second, CPU time per probe, wall time and accuracy against the known port states.
+Requires root, iproute2 and, for --delay and --loss, the sch_netem kernel module
+
+Run from the repository root:
+    sudo python -m benchmarks.bench_scan [--ports N] [--hosts N] [--delay MS] [--loss PCT] [--rate PPS]
+                                         [--scans tcp,stateless,udp] [--json FILE]
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import time
+from src.modules.scanners.ScanEvent import OPEN, CLOSED
+from src.modules.scanners.TCPScanner import TCPScanner
+from src.modules.scanners.UDPScanner import UDPScanner
+from src.modules.structures.TargetSet import TargetSet, ip_to_int, int_to_ip
+from benchmarks.report import write_json
+
+NAMESPACE = 'psbench'
+HOST_INTERFACE, TARGET_INTERFACE = 'psb0', 'psb1'
+HOST_ADDRESS = '10.201.0.1'
+FIRST_TARGET = '10.201.0.2'
+FIRST_PORT = 20000
+
+SERVER = '''
+import selectors, socket, sys
+sel = selectors.DefaultSelector()
+sockets = []
+for host in sys.argv[2].split(','):
+    for port in map(int, sys.argv[1].split(',')):
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+        listener.listen(1024)
+        echo = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        echo.bind((host, port))
+        sel.register(echo, selectors.EVENT_READ)
+        sockets += [listener, echo]
+print('ready', flush=True)
+while True:
+    for key, _ in sel.select():
+        try:
+            data, address = key.fileobj.recvfrom(2048)
+            key.fileobj.sendto(data or b'echo', address)
+        except OSError:
+            pass
+'''
+
+
+def _run(*command: str, namespace: bool = False, check: bool = True):
+    if namespace:
+        command = ('ip', 'netns', 'exec', NAMESPACE) + command
+    result = subprocess.run(command, capture_output=True, text=True)
+    if check and result.returncode != 0:
+        raise RuntimeError(f'{" ".join(command)}: {result.stderr.strip()}')
+
+
+class Network:
+    """
+    Namespace with the targets, veth pair to it and the servers of the open ports
+    """
+    def __init__(self, hosts: int, open_ports, delay: float, loss: float, icmp_ratelimit: int):
+        self.targets = [int_to_ip(ip_to_int(FIRST_TARGET) + i) for i in range(hosts)]
+        self.open_ports = open_ports
+        self.delay = delay
+        self.loss = loss
+        self.icmp_ratelimit = icmp_ratelimit
+        self.server = None
+
+    def __enter__(self) -> 'Network':
+        self.remove()
+        try:
+            _run('ip', 'netns', 'add', NAMESPACE)
+            _run('ip', 'link', 'add', HOST_INTERFACE, 'type', 'veth', 'peer', 'name', TARGET_INTERFACE,
+                 'netns', NAMESPACE)
+            _run('ip', 'addr', 'add', f'{HOST_ADDRESS}/16', 'dev', HOST_INTERFACE)
+            _run('ip', 'link', 'set', HOST_INTERFACE, 'up')
+            for target in self.targets:
+                _run('ip', 'addr', 'add', f'{target}/16', 'dev', TARGET_INTERFACE, namespace=True)
+            _run('ip', 'link', 'set', TARGET_INTERFACE, 'up', namespace=True)
+            _run('ip', 'link', 'set', 'lo', 'up', namespace=True)
+            _run('ip', 'route', 'add', 'default', 'via', HOST_ADDRESS, namespace=True)
+            # port unreachables of closed udp ports are limited only when asked to
+            _run('sysctl', '-w', f'net.ipv4.icmp_ratelimit={self.icmp_ratelimit}', namespace=True)
+            _run('sysctl', '-w', 'net.ipv4.icmp_msgs_per_sec=1000000', 'net.ipv4.icmp_msgs_burst=1000000',
+                 namespace=True, check=False)
+            if self.delay or self.loss:
+                netem = ['netem', 'delay', f'{self.delay}ms', 'loss', f'{self.loss}%']
+                try:
+                    _run('tc', 'qdisc', 'add', 'dev', HOST_INTERFACE, 'root', *netem)
+                    _run('tc', 'qdisc', 'add', 'dev', TARGET_INTERFACE, 'root', *netem, namespace=True)
+                except RuntimeError as e:
+                    raise RuntimeError(f'Can not add latency and loss, is sch_netem available? {e}')
+            self.server = subprocess.Popen(
+                ['ip', 'netns', 'exec', NAMESPACE, sys.executable, '-c', SERVER,
+                 ','.join(map(str, self.open_ports)), ','.join(self.targets)],
+                stdout=subprocess.PIPE, text=True)
+            if self.server.stdout.readline().strip() != 'ready':
+                raise RuntimeError('Target servers did not start')
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        if self.server is not None:
+            self.server.kill()
+            self.server.wait()
+            self.server = None
+        self.remove()
+
+    @staticmethod
+    def remove():
+        _run('ip', 'netns', 'del', NAMESPACE, check=False)
+        _run('ip', 'link', 'del', HOST_INTERFACE, check=False)
+
+
+def scanner_class(base):
+    class BenchScanner(base):
+        probes = 0
+
+        def next_probe(self):
+            self.probes += 1
+            return super().next_probe()
+
+    return BenchScanner
+
+
+def run(name: str, network: Network, ports: range, args) -> dict:
+    targets = TargetSet.parse([','.join(network.targets)])
+    common = dict(rate=args.rate, retries=args.retries, batch_size=args.batch_size, seed=1)
+    if name == 'udp':
+        scanner = scanner_class(UDPScanner)(targets, ports, args.timeout, **common)
+    else:
+        scanner = scanner_class(TCPScanner)(targets, ports, args.timeout, stateless=name == 'stateless', **common)
+    states = {}
+    scanner.add_listener(lambda event: states.__setitem__((event.host, event.port), event.state),
+                         keep_results=False)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    scanner.start_scan()
+    elapsed = time.perf_counter() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = end_usage.ru_utime - usage.ru_utime + end_usage.ru_stime - usage.ru_stime
+
+    truth = {(host, port): OPEN if port in network.open_ports else CLOSED
+             for host in network.targets for port in ports}
+    correct = sum(states.get(key) == state for key, state in truth.items())
+    found = sum(states.get(key) == OPEN for key, state in truth.items() if state == OPEN)
+    return {
+        'scan': name,
+        'probes': scanner.probes,
+        'seconds': round(elapsed, 3),
+        'pps': round(scanner.probes / elapsed),
+        'cpu_seconds': round(cpu, 3),
+        'cpu_us_per_probe': round(cpu / max(1, scanner.probes) * 1e6, 2),
+        'correct': correct,
+        'total': len(truth),
+        'accuracy': round(correct / len(truth), 4),
+        'open_found': found,
+        'open_expected': len(network.open_ports) * len(network.targets),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end scan benchmark in a network namespace')
+    parser.add_argument('--ports', type=int, default=1000, help='ports per host (1000 by default)')
+    parser.add_argument('--hosts', type=int, default=1, help='target hosts (1 by default)')
+    parser.add_argument('--open', type=int, default=10, help='open ports per host (10 by default)')
+    parser.add_argument('--delay', type=float, default=0, metavar='MS', help='one way latency (0 by default)')
+    parser.add_argument('--loss', type=float, default=0, metavar='PCT', help='loss in each direction (0 by default)')
+    parser.add_argument('--rate', type=float, default=0, metavar='PPS', help='probes per second (unlimited by default)')
+    parser.add_argument('--timeout', type=float, default=1.0, help='scanner timeout (1s by default)')
+    parser.add_argument('--retries', type=int, default=0, help='scanner retransmissions (0 by default)')
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=64, help='scanner batch size')
+    parser.add_argument('--icmp-ratelimit', dest='icmp_ratelimit', type=int, default=0, metavar='MS',
+                        help='net.ipv4.icmp_ratelimit of the targets (0, unlimited, by default)')
+    parser.add_argument('--scans', type=str, default='tcp,stateless,udp',
+                        help='scans to run: tcp, stateless, udp (all by default)')
+    parser.add_argument('--json', type=str, metavar='FILE', help="write results to FILE, '-' for stdout")
+    args = parser.parse_args()
+
+    ports = range(FIRST_PORT, FIRST_PORT + args.ports)
+    open_ports = set(ports[::max(1, args.ports // args.open)][:args.open]) if args.open else set()
+    # the table goes to stderr when the report goes to stdout
+    out = sys.stderr if args.json == '-' else sys.stdout
+    print(f'{args.hosts} hosts x {args.ports} ports, delay {args.delay:g} ms, loss {args.loss:g}%', file=out)
+    print(f'{"scan":<12}{"time s":>10}{"probes":>10}{"probes/s":>12}{"cpu us/probe":>14}{"accuracy":>10}',
+          file=out)
+    results = []
+    try:
+        with Network(args.hosts, open_ports, args.delay, args.loss, args.icmp_ratelimit) as network:
+            for name in args.scans.split(','):
+                result = run(name, network, ports, args)
+                results.append(result)
+                print(f'{name:<12}{result["seconds"]:>10.2f}{result["probes"]:>10}{result["pps"]:>12}'
+                      f'{result["cpu_us_per_probe"]:>14.1f}{result["accuracy"]:>10.2%}', file=out)
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    if args.json:
+        parameters = {name: value for name, value in vars(args).items() if name != 'json'}
+        write_json(args.json, 'scan', parameters, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Cold start of the command line scanner: time from starting the interpreter to the first probe.
+Every run is a new process running portscanner.main(), the first call of next_probe() records the
+time and ends the process. Bare interpreter startup is measured the same way for reference.
+Requires root for the raw sockets of the scanners
+
+Run from the repository root:
+    sudo python -m benchmarks.bench_startup [--runs N] [--json FILE] [-- SCANNER ARGUMENTS]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.report import write_json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, os, sys, time
+marks = {'started': time.time()}
+import portscanner
+from src.modules.scanners.BaseScanner import BaseScanner
+marks['imported'] = time.time()
+
+
+def first_probe(self):
+    marks['first_probe'] = time.time()
+    print(json.dumps(marks), flush=True)
+    os._exit(0)
+
+
+BaseScanner.next_probe = first_probe
+sys.argv = ['portscanner.py'] + sys.argv[1:]
+portscanner.main()
+'''
+
+
+def run_child(code: str, arguments) -> dict:
+    start = time.time()
+    result = subprocess.run([sys.executable, '-c', code, *arguments], cwd=ROOT, capture_output=True, text=True)
+    end = time.time()
+    for line in result.stdout.splitlines():
+        if line.startswith('{'):
+            marks = json.loads(line)
+            return {name: (value - start) * 1e3 for name, value in marks.items()}
+    if code.strip() == 'pass':
+        return {'exited': (end - start) * 1e3}
+    raise RuntimeError(f'No probe was sent: {result.stdout.strip()} {result.stderr.strip()}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time from process start to the first probe')
+    parser.add_argument('--runs', type=int, default=10, help='processes started (10 by default)')
+    parser.add_argument('--json', type=str, metavar='FILE', help="write results to FILE, '-' for stdout")
+    parser.add_argument('scanner', nargs='*', default=['127.0.0.1', 'tcp/80'],
+                        help='scanner arguments (127.0.0.1 tcp/80 by default)')
+    args = parser.parse_args()
+
+    out = sys.stderr if args.json == '-' else sys.stdout
+    runs = {'interpreter': [run_child('pass', [])['exited'] for _ in range(args.runs)]}
+    try:
+        scans = [run_child(CHILD, args.scanner) for _ in range(args.runs)]
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    for phase in ('started', 'imported', 'first_probe'):
+        runs[phase] = [scan[phase] for scan in scans]
+
+    print(f'portscanner {" ".join(args.scanner)}, {args.runs} runs, ms since process start', file=out)
+    print(f'{"phase":<16}{"median":>10}{"best":>10}', file=out)
+    results = []
+    for phase, times in runs.items():
+        result = {'name': phase, 'median_ms': round(statistics.median(times), 1), 'best_ms': round(min(times), 1)}
+        results.append(result)
+        print(f'{phase:<16}{result["median_ms"]:>10.1f}{result["best_ms"]:>10.1f}', file=out)
+    if args.json:
+        write_json(args.json, 'startup', {'runs': args.runs, 'scanner': args.scanner}, results)
+
+
+if __name__ == '__main__':
+    main()
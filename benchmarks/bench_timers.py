@@ -0,0 +1,63 @@
+"""
+Micro-benchmark of TimeDict and TimerWheel: insert, lookup, delete and expire of N entries
+
+Run from the repository root:
+    python -m benchmarks.bench_timers [N]
+"""
+import sys
+import time
+from src.modules.imported.TimeDict import TimeDict
+from src.modules.structures.TimerWheel import TimerWheel
+
+
+def _measure(name: str, func, count: int) -> float:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<28}{elapsed:>10.3f} s{elapsed / count * 1e9:>12.0f} ns/op')
+    return elapsed
+
+
+def bench_time_dict(count: int, action_time: float):
+    expired = []
+    d = TimeDict(action_time, action_time, lambda key, value: expired.append(key))
+    _measure('TimeDict insert', lambda: [d.__setitem__(i, i) for i in range(count)], count)
+    _measure('TimeDict lookup', lambda: [i in d for i in range(count)], count)
+    _measure('TimeDict delete', lambda: [d.__delitem__(i) for i in range(0, count, 2)], count // 2)
+    start = time.perf_counter()
+    while len(d) > 0:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    print(f'{"TimeDict expire (wait)":<28}{elapsed:>10.3f} s, '
+          f'late by {elapsed - action_time:.3f} s after deadline')
+    d.destroy()
+
+
+def bench_timer_wheel(count: int, action_time: float):
+    expired = []
+    wheel = TimerWheel(action_time, lambda key, value: expired.append(key))
+    _measure('TimerWheel insert', lambda: [wheel.__setitem__(i, i) for i in range(count)], count)
+    _measure('TimerWheel lookup', lambda: [i in wheel for i in range(count)], count)
+    _measure('TimerWheel delete', lambda: [wheel.__delitem__(i) for i in range(0, count, 2)], count // 2)
+    start = time.perf_counter()
+    expire_time = 0.0
+    while len(wheel) > 0:
+        time.sleep(wheel.next_timeout() or 0)
+        expire_start = time.perf_counter()
+        wheel.expire()
+        expire_time += time.perf_counter() - expire_start
+    elapsed = time.perf_counter() - start
+    print(f'{"TimerWheel expire (wait)":<28}{elapsed:>10.3f} s, '
+          f'expire() cost {expire_time / (count // 2) * 1e9:.0f} ns/op')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    action_time = 10.0
+    print(f'{count} entries, action_time {action_time} s')
+    bench_time_dict(count, action_time)
+    bench_timer_wheel(count, action_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+JSON reports of benchmark runs, one file per run, so runs of different versions can be compared
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+
+def environment() -> dict:
+    """
+    Version of the scanner and the machine the benchmark ran on
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': f'{platform.system()} {platform.release()}',
+        'cpus': os.cpu_count(),
+    }
+
+
+def write_json(path: str, benchmark: str, parameters: dict, results: list):
+    """
+    Write report to path, '-' writes to stdout
+    """
+    report = {'benchmark': benchmark, 'environment': environment(), 'parameters': parameters, 'results': results}
+    text = json.dumps(report, indent=2)
+    if path == '-':
+        print(text)
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text + '\n')
+    print(f'report written to {path}', file=sys.stderr)
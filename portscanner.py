@@ -1,11 +1,15 @@
-import socket
+import dataclasses
+import os
 import time
 import sys
-from src.modules.console.ArgParser import ArgParser
-from src.modules.scanners.UDPScanner import UDPScanner
-from src.modules.console.ConsoleUI import ConsoleUI, add_data_to_console_column, add_filtered_udp_ports_to_console_if_open
-from src.modules.helpers import get_protocols_to_udp_port, get_protocols_to_tcp_port
-from src.modules.scanners.TCPScanner import TCPScanner
+from src.modules.console.ArgParser import ArgParser, DiffArgParser
+from src.modules.console.ConsoleUI import ConsoleUI, add_data_to_console_column
+from src.modules.scanners.DiscoveryScanner import discover
+from src.modules.scanners.ParallelScan import scan_events_parallel
+from src.modules.scanners.ScanEvent import OPEN
+from src.modules.scanners.Telemetry import Telemetry
+from src.modules.structures.ResultStore import ResultStore, StoreWriter, diff
+from src.modules.structures.TargetSet import ip_to_int
 
 
 def get_args():
@@ -19,44 +23,67 @@ def get_args():
     return args
 
 
-def start_udp_scan(console_ui, args):
-    """ Start UDP scan """
-    filtered_ports, open_ports = UDPScanner(args.ip,
-                                            args.ports['udp'],
-                                            args.timeout).start_scan()
-    for port, t in open_ports:
-        add_data_to_console_column(console_ui,
-                                   'UDP',
-                                   get_protocols_to_udp_port,
-                                   args,
-                                   port,
-                                   f'{t}')
+def add_result(console_ui, args, guesser, event):
+    """ Add scan result event, tcp ports to guess are passed to guesser, udp services are known from the scan """
+    if event.state == OPEN:
+        if guesser is not None and event.protocol == 'tcp':
+            guesser.submit(event)
+        else:
+            add_data_to_console_column(console_ui, event.protocol.upper(), args,
+                                       event.host, event.port, f'{event.rtt}', event.service)
 
-    if args.guess:
-        for port, t in filtered_ports:
-            add_filtered_udp_ports_to_console_if_open(
-                console_ui, 'UDP', get_protocols_to_udp_port, args, port, f'{t}')
+
+def add_guesses(console_ui, args, guesses):
+    """ Add guessed ports """
+    for event, protocol in guesses:
+        add_data_to_console_column(console_ui, event.protocol.upper(), args,
+                                   event.host, event.port, f'{event.rtt}', protocol)
+
+
+def discover_hosts(args):
+    """ Keep only targets that answer discovery probes, a resumed scan has done it already """
+    start = time.perf_counter()
+    live = discover(args.targets, args.discovery_timeout, args.discovery_rate, args.discovery_retries,
+                    args.batch_size)
+    message = f'Discovery: {len(live)} of {len(args.targets)} hosts up in ' \
+              f'{round(time.perf_counter() - start, 2)} seconds'
+    return dataclasses.replace(args, targets=live), message
 
 
-def start_tcp_scan(console_ui, args):
-    """ Start TCP scan """
-    tcp_ports = TCPScanner(args.ip, args.ports['tcp'],
-                           args.timeout).start_scan()
-    for port, t in tcp_ports:
-        add_data_to_console_column(console_ui, 'TCP',
-                                   get_protocols_to_tcp_port, args, port,
-                                   f'{t}')
+def start_resolver(args):
+    """ Reverse DNS of scanned hosts in the background, the resolver is imported only with --resolve """
+    from src.modules.scanners.ReverseResolver import PtrCache, ReverseResolver, default_cache_path, \
+        default_server, parse_server
+    server = args.dns_server or default_server()
+    if server is None:
+        print('No DNS server in /etc/resolv.conf, names are not resolved, use --dns-server')
+        return None
+    cache = PtrCache(default_cache_path() if args.dns_cache is None else args.dns_cache or None)
+    return ReverseResolver(parse_server(server), cache, batch_size=args.batch_size)
 
 
 def start_scan(console_ui, args):
     """ Start scan and create console UI """
     start = time.perf_counter()
-    try:
-        domain = socket.gethostbyaddr(args.ip)
-    except socket.herror:
-        domain = args.ip
-    console_ui.add_start_msg(
-        f'Starting PortScan for {domain[0]} ({args.ip})\n')
+    if args.discover and not args.resume:
+        args, message = discover_hosts(args)
+        print(message)
+        if len(args.targets) == 0:
+            print('No hosts up, nothing to scan')
+            return
+    resolver = start_resolver(args) if args.resolve else None
+    if resolver is not None and (args.discover or len(args.targets) == 1):
+        # hosts known to be up are looked up while they are scanned, otherwise hosts with open ports
+        for ip in args.targets:
+            resolver.submit(ip)
+    if len(args.targets) == 1:
+        ip = args.targets[0]
+        console_ui.add_start_msg(
+            f'Starting PortScan for {ip}\n')
+    else:
+        console_ui.add_start_msg(
+            f'Starting PortScan for {len(args.targets)} hosts ({args.targets})\n')
+        console_ui.add_column('HOST')
     console_ui.add_column('TCP|UDP')
     console_ui.add_column('PORT')
 
@@ -65,21 +92,90 @@ def start_scan(console_ui, args):
     if args.guess:
         console_ui.add_column('PROTOCOL')
 
-    if 'udp' in args.ports:
-        start_udp_scan(console_ui, args)
-    if 'tcp' in args.ports:
-        start_tcp_scan(console_ui, args)
+    console_ui.start()
+    info = []
+    guesser = None
+    if args.guess:
+        # the guesser loads the fingerprint database, only scans with -g pay for the import
+        from src.modules.guess.Guesser import Guesser
+        guesser = Guesser(args.guess_workers, args.guess_timeout, args.guess_timeout)
+    store = StoreWriter(args.store) if args.store else None
+    telemetry = None
+    names = {}
+    if args.progress or args.metrics:
+        telemetry = Telemetry({protocol: len(args.targets) * len(ports) for protocol, ports in args.ports.items()},
+                              args.progress_interval, args.progress, args.metrics, args.metrics_format)
+    events = scan_events_parallel(args, args.threads, info, telemetry.update if telemetry else None)
+    try:
+        for event in events:
+            if store is not None:
+                store.add(event)
+            add_result(console_ui, args, guesser, event)
+            if resolver is not None and event.state == OPEN:
+                resolver.submit(event.host)
+            if guesser is not None:
+                add_guesses(console_ui, args, guesser.completed())
+        if guesser is not None:
+            add_guesses(console_ui, args, guesser.wait())
+        if telemetry is not None:
+            telemetry.finish()
+        if resolver is not None:
+            # lookups submitted with the last open ports need every retransmission to fail
+            names = resolver.wait(resolver.lookup_timeout)
+    finally:
+        # saves the checkpoint of an interrupted scan before the resume hint is printed
+        events.close()
+        if resolver is not None:
+            resolver.close()
+        if guesser is not None:
+            guesser.close()
+        if store is not None:
+            store.close()
+    info.extend(f'{ip} is {name}' for ip, name in sorted(names.items(), key=lambda item: ip_to_int(item[0])))
+    for msg in info:
+        console_ui.add_info_msg(msg)
 
     console_ui.add_end_msg(
         f'PortScan done: scanned in {round(time.perf_counter() - start, 2)} seconds')
     console_ui.print()
 
 
+def diff_stores(argv):
+    """ Print ports whose state changed between two result stores """
+    args = DiffArgParser(argv).parse()
+    changes = {'+': 0, '-': 0, '~': 0}
+    try:
+        with ResultStore(args.old) as old, ResultStore(args.new) as new:
+            for change in diff(old, new, args.host):
+                line = str(change)
+                changes[line[0]] += 1
+                print(line)
+    except ValueError as e:
+        print(str(e))
+        sys.exit()
+    print(f'{changes["+"]} added, {changes["-"]} removed, {changes["~"]} changed')
+
+
 def main():
     """ Main function """
-    console_ui = ConsoleUI()
+    if sys.argv[1:2] == ['diff']:
+        diff_stores(sys.argv[2:])
+        return
     args = get_args()
-    start_scan(console_ui, args)
+    console_ui = ConsoleUI(stream=True, summary=args.summary)
+    try:
+        start_scan(console_ui, args)
+    except KeyboardInterrupt:
+        if args.checkpoint and os.path.exists(args.checkpoint):
+            print(f'Interrupted by user, continue with --resume {args.checkpoint}')
+            sys.exit()
+        raise
+    except RuntimeError as e:
+        # a worker process died, the progress saved before it can be resumed
+        print(str(e))
+        if args.checkpoint and os.path.exists(args.checkpoint):
+            print(f'Continue with --resume {args.checkpoint}')
+        sys.exit(1)
 
 
 if __name__ == '__main__':
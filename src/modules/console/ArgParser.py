@@ -1,8 +1,13 @@
+import dataclasses
 import sys
 from argparse import ArgumentParser
-from typing import List
+from typing import Dict, List
 from src.modules.console.DataArguments import DataArguments
-from ping3 import ping
+from src.modules.protocols.SynCookie import MAX_AGE
+from src.modules.scanners.Checkpoint import Checkpoint
+from src.modules.scanners.ParallelScan import MAX_WORKERS
+from src.modules.structures.PortSet import PortSet, DEFAULT_PORTS
+from src.modules.structures.TargetSet import TargetSet
 import re
 
 port_regex = re.compile(r'^(tcp|udp)\/\d+(-\d+)?')
@@ -21,60 +26,100 @@ class ArgParser:
         """
         Add arguments to the parser
         """
-        self._parser.add_argument("ip", type=str,  # required=True,
-                                  help="IP address")
+        self._parser.add_argument("ip", type=str, nargs='?',
+                                  help="targets: IP address, CIDR block (10.0.0.0/24) or range "
+                                       "(10.0.0.1-10.0.0.50, 10.0.0.1-50), comma separated")
         self._parser.add_argument("ports", type=str, metavar='PORT', nargs='*',
                                   default=['tcp', 'udp'],
                                   help="ports")
+        self._parser.add_argument("--exclude-ports", dest="exclude_ports", type=str, metavar="PORT",
+                                  action="append", default=[],
+                                  help="ports not to scan, same form as PORT, can be repeated")
         self._parser.add_argument("--timeout", "-t", dest="timeout",
                                   type=float, default=2.0,
-                                  help="response timeout (2s by default)")
-        self._parser.add_argument("--num-threads", "-j", type=int, default=100, dest="threads",
-                                  help="number of threads (100 by default)")
+                                  help="maximum response timeout, the actual one follows measured RTT "
+                                       "(2s by default)")
+        self._parser.add_argument("--num-threads", "-j", type=int, default=1, dest="threads",
+                                  help="number of worker processes, each scans its own shard (1 by default)")
         self._parser.add_argument("-v", "--verbose", action="store_true",
                                   help="verbose mode")
         self._parser.add_argument("-g", "--guess", action="store_true",
                                   help="application layer protocol definition")
-
-    def is_correct_ip(self, ip: str):
-        """ Checking the correctness of the IP address """
-        nums = ip.split('.')
-        if len(nums) != 4:
-            return False
-        for num in nums:
-            if not 0 <= int(num) <= 255 and num:
-                raise False
-        return True
+        self._parser.add_argument("--guess-workers", dest="guess_workers", type=int, default=32, metavar="N",
+                                  help="ports probed at once by -g (32 by default)")
+        self._parser.add_argument("--guess-timeout", dest="guess_timeout", type=float, default=1.0,
+                                  metavar="SEC", help="connect and read deadline of -g probes (1s by default)")
+        self._parser.add_argument("--discover", action="store_true",
+                                  help="find live hosts with ICMP echo, TCP SYN to 443 and 80 and TCP ACK to 80 "
+                                       "first, only hosts that answer are scanned")
+        self._parser.add_argument("--discovery-rate", dest="discovery_rate", type=float, default=0, metavar="PPS",
+                                  help="maximum discovery probes per second (unlimited by default)")
+        self._parser.add_argument("--discovery-timeout", dest="discovery_timeout", type=float, default=1.0,
+                                  metavar="SEC", help="timeout of discovery probes (1s by default)")
+        self._parser.add_argument("--discovery-retries", dest="discovery_retries", type=int, default=1,
+                                  metavar="N", help="retransmit unanswered discovery probes N times (1 by default)")
+        self._parser.add_argument("--resolve", action="store_true",
+                                  help="look up names of hosts with open ports (every live host with --discover) "
+                                       "by reverse DNS, while the scan runs")
+        self._parser.add_argument("--dns-server", dest="dns_server", type=str, metavar="IP[:PORT]",
+                                  help="DNS server of --resolve (first nameserver of /etc/resolv.conf by default)")
+        self._parser.add_argument("--dns-cache", dest="dns_cache", type=str, metavar="FILE",
+                                  help="reverse names cache of --resolve, kept for the TTL of the records "
+                                       "($XDG_CACHE_HOME/portscanner/ptr-cache.json by default, '' disables it)")
+        self._parser.add_argument("--stateless", action="store_true",
+                                  help="match tcp replies by SYN cookie without per-port state")
+        self._parser.add_argument("--rate", type=float, default=0, metavar="PPS",
+                                  help="maximum probes per second (unlimited by default)")
+        self._parser.add_argument("--adaptive", action="store_true",
+                                  help="adapt number of probes in flight to the observed drops")
+        self._parser.add_argument("-iL", "--input-file", dest="input_file", type=str,
+                                  help="read additional targets from file")
+        self._parser.add_argument("--seed", type=int,
+                                  help="seed of the randomized host x port order (random by default)")
+        self._parser.add_argument("--batch-size", dest="batch_size", type=int, default=64, metavar="N",
+                                  help="packets per sendmmsg/recvmmsg call, 1 disables batching (64 by default)")
+        self._parser.add_argument("--transport", choices=["socket", "packet"], default="socket",
+                                  help="tcp transport: raw socket or AF_PACKET rings (socket by default)")
+        self._parser.add_argument("--interface", "-e", type=str,
+                                  help="network interface of packet transport")
+        self._parser.add_argument("--retries", type=int, default=0, metavar="N",
+                                  help="retransmit unanswered probes N times (0 by default)")
+        self._parser.add_argument("--summary", action="store_true",
+                                  help="print sorted table of all results after the scan")
+        self._parser.add_argument("--checkpoint", type=str, metavar="FILE",
+                                  help="save scan progress and results to FILE periodically")
+        self._parser.add_argument("--checkpoint-interval", dest="checkpoint_interval", type=float, default=10.0,
+                                  metavar="SEC", help="seconds between checkpoints (10 by default)")
+        self._parser.add_argument("--resume", type=str, metavar="FILE",
+                                  help="continue the scan saved in checkpoint FILE, targets, ports and scan "
+                                       "options are taken from it")
+        self._parser.add_argument("--store", type=str, metavar="FILE",
+                                  help="write results to binary result store FILE, compare stores with "
+                                       "'diff OLD NEW'")
+        self._parser.add_argument("--progress", action="store_true",
+                                  help="print probes sent, probes per second and ETA to stderr periodically")
+        self._parser.add_argument("--progress-interval", dest="progress_interval", type=float, default=1.0,
+                                  metavar="SEC", help="seconds between progress lines and metrics updates "
+                                                      "(1 by default)")
+        self._parser.add_argument("--metrics", type=str, metavar="FILE",
+                                  help="write scan counters to FILE periodically and at the end")
+        self._parser.add_argument("--metrics-format", dest="metrics_format", choices=["json", "prometheus"],
+                                  default="json", help="format of --metrics: json or prometheus text "
+                                                       "(json by default)")
 
     def is_correct_port(self, port: str):
         """ Checking the correctness of the port """
         return port_regex.match(port) or port in ['tcp', 'udp']
 
-    def parse_ports(self, ports: List[str]):
+    def parse_ports(self, ports: List[str]) -> Dict[str, PortSet]:
         """
         Parsing ports of the form: tcp/*, udp/*, tcp/*-*, * - number
         """
         new_ports = {}
         for p in ports:
-            if p.find('/') == -1:
-                new_ports[p] = {x for x in range(1, 1001)}
-            else:
-                temp = p.split('/')
-                if temp[0] not in new_ports:
-                    new_ports[temp[0]] = set()
-                for port in temp[1].split(','):
-                    if '-' in port:
-                        number_one, number_two = map(int, port.split('-'))
-                        if not (0 < number_one < 65536 and 0 < number_two < 65536):
-                            raise ValueError('Port should be less 65536 and more 0')
-                        for portt in range(number_one, number_two + 1):
-                            new_ports[temp[0]].add(portt)
-                    else:
-                        if not 0 < int(port) < 65536:
-                            raise ValueError(
-                                'Port should be less 65536 and more 0')
-                        new_ports[temp[0]].add(int(port))
-
+            protocol, _, spec = p.partition('/')
+            parsed = PortSet.parse(spec) if spec else PortSet([DEFAULT_PORTS])
+            new_ports[protocol] = new_ports[protocol].union(parsed) if protocol in new_ports else parsed
         return new_ports
 
     def parse(self):
@@ -82,21 +127,82 @@ class ArgParser:
         Parsing arguments
         """
         args = self._parser.parse_args(self._args)
+        if args.dns_server:
+            from src.modules.scanners.ReverseResolver import parse_server
+            parse_server(args.dns_server)
+        if args.resume:
+            return self.parse_resume(args)
+        if args.ip is None:
+            raise ValueError('No targets to scan.')
 
-        if not self.is_correct_ip(args.ip):
-            raise ValueError(f'IP address {args.ip} is not correct.')
+        targets = TargetSet.parse([args.ip])
+        if args.input_file:
+            try:
+                targets = targets.union(TargetSet.from_file(args.input_file))
+            except OSError as e:
+                raise ValueError(f'Can not read targets: {e}')
+        if len(targets) == 0:
+            raise ValueError('No targets to scan.')
+        if args.transport == 'packet' and not args.interface:
+            raise ValueError('Packet transport requires --interface.')
+        if args.stateless and not 0 < args.timeout < MAX_AGE:
+            raise ValueError(f'Stateless scan requires --timeout less than {MAX_AGE} seconds, '
+                             f'the SYN cookie send time wraps after it.')
+        if args.threads > MAX_WORKERS:
+            raise ValueError(f'Number of worker processes {args.threads} is not correct, '
+                             f'at most {MAX_WORKERS} are supported.')
 
-        if not ping(args.ip, timeout=args.timeout):
-            raise ValueError(f'Host {args.ip} seems down.')
-
-        for port in args.ports:
+        for port in args.ports + args.exclude_ports:
             if not self.is_correct_port(port):
                 raise ValueError(f"Port {port} is not correct.")
 
         try:
             ports = self.parse_ports(args.ports)
+            for protocol, excluded in self.parse_ports(args.exclude_ports).items():
+                if protocol in ports:
+                    ports[protocol] = ports[protocol].difference(excluded)
         except ValueError as e:
             print(str(e))
             sys.exit()
+        if not any(ports.values()):
+            raise ValueError('No ports to scan.')
+
+        return DataArguments(targets, ports, args.timeout, args.verbose, args.guess, args.threads,
+                             args.stateless, args.rate, args.adaptive, args.retries, args.seed,
+                             args.batch_size, args.transport, args.interface, args.summary,
+                             args.guess_workers, args.guess_timeout, args.checkpoint, args.checkpoint_interval,
+                             store=args.store, progress=args.progress, progress_interval=args.progress_interval,
+                             metrics=args.metrics, metrics_format=args.metrics_format, resolve=args.resolve,
+                             dns_server=args.dns_server, dns_cache=args.dns_cache, discover=args.discover,
+                             discovery_rate=args.discovery_rate, discovery_timeout=args.discovery_timeout,
+                             discovery_retries=args.discovery_retries)
+
+    def parse_resume(self, args):
+        """
+        Arguments of the scan saved in checkpoint, output options are taken from the command line
+        """
+        checkpoint = Checkpoint.load(args.resume)
+        return dataclasses.replace(checkpoint.args, verbose=args.verbose, guess=args.guess, summary=args.summary,
+                                   guess_workers=args.guess_workers, guess_timeout=args.guess_timeout,
+                                   checkpoint=args.resume, checkpoint_interval=args.checkpoint_interval,
+                                   resume=True, store=args.store or checkpoint.args.store, progress=args.progress,
+                                   progress_interval=args.progress_interval, metrics=args.metrics,
+                                   metrics_format=args.metrics_format, resolve=args.resolve,
+                                   dns_server=args.dns_server, dns_cache=args.dns_cache)
+
 
-        return DataArguments(args.ip, ports, args.timeout, args.verbose, args.guess, args.threads)
+class DiffArgParser:
+    """ Argument Parser of the diff command """
+    def __init__(self, args):
+        self._parser = ArgumentParser(prog="Port Scanner diff",
+                                      description="Compare result stores of two scans")
+        self._parser.add_argument("old", type=str, help="result store of the earlier scan")
+        self._parser.add_argument("new", type=str, help="result store of the later scan")
+        self._parser.add_argument("--host", type=str, help="compare only this host")
+        self._args = args
+
+    def parse(self):
+        """
+        Parsing arguments
+        """
+        return self._parser.parse_args(self._args)
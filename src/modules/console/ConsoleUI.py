@@ -1,13 +1,24 @@
-from prettytable import PrettyTable, PLAIN_COLUMNS
+from typing import Any, Dict, List
+from src.modules.structures.TargetSet import ip_to_int
 
 
 class ConsoleUI:
     """ ConsoleUI class """
-    def __init__(self):
+    def __init__(self, stream: bool = False, summary: bool = True):
+        """
+        :param stream: print rows as soon as they are added
+        :param summary: print table of all rows sorted by row keys at the end
+        """
         self.start_msg = ''
         self.column = {}
         self.end_msg = ''
+        self.info_msgs = []
         self.columns = []
+        self.stream = stream
+        self.summary = summary
+        self.keys = []
+        self.rows = 0
+        self.started = False
 
     def add_column(self, name: str):
         """ Add column to console ui """
@@ -18,6 +29,33 @@ class ConsoleUI:
         """ Add value to column """
         self.column[name].append(value)
 
+    def add_row(self, values: Dict[str, Any], key: Any = None):
+        """
+        Add row of column values, the row is printed now in stream mode
+        :param key: sort key of the row in the summary table
+        """
+        self.rows += 1
+        if self.stream:
+            self.start()
+            self._print_row([values.get(column, '') for column in self.columns])
+        if self.summary:
+            for column in self.columns:
+                self.add_value_to_column(column, values.get(column, ''))
+            self.keys.append(key)
+
+    def _print_row(self, values: List[Any]):
+        print(''.join(f'{value!s:<{max(len(column), 8) + 8}}' for column, value in zip(self.columns, values)).rstrip(),
+              flush=True)
+
+    def start(self):
+        """ Print start message and, in stream mode, table header """
+        if self.started:
+            return
+        self.started = True
+        print(self.start_msg, flush=True)
+        if self.stream:
+            self._print_row(self.columns)
+
     def add_start_msg(self, msg: str):
         """ Add start message """
         self.start_msg = msg
@@ -26,40 +64,37 @@ class ConsoleUI:
         """ Add end message """
         self.end_msg = msg
 
+    def add_info_msg(self, msg: str):
+        """ Add message printed before end message """
+        self.info_msgs.append(msg)
+
     def print(self):
-        """ Print full console answer """
-        print(self.start_msg)
-        pretty_table = PrettyTable(self.columns)
-        pretty_table.set_style(PLAIN_COLUMNS)
-        temp = list(zip(*[self.column[column] for column in self.columns]))
-        pretty_table.add_rows(temp)
-        if len(temp) > 0:
-            print(pretty_table)
-        else:
+        """ Print full console answer, rows printed in stream mode are not repeated without summary """
+        self.start()
+        if self.rows == 0:
             print('Nothing found')
+        elif self.summary:
+            from prettytable import PrettyTable, PLAIN_COLUMNS
+            pretty_table = PrettyTable(self.columns)
+            pretty_table.set_style(PLAIN_COLUMNS)
+            temp = list(zip(*[self.column[column] for column in self.columns]))
+            if all(key is not None for key in self.keys):
+                temp = [row for _, row in sorted(zip(self.keys, temp), key=lambda item: item[0])]
+            pretty_table.add_rows(temp)
+            if self.stream:
+                print()
+            print(pretty_table)
         print()
+        for msg in self.info_msgs:
+            print(msg)
         print(self.end_msg)
 
 
-def add_data_to_console_column(console_ui, transport_protocol, get_protocol_func, args, port, t=''):
-    """ Add data to console column """
-    console_ui.add_value_to_column('TCP|UDP', transport_protocol)
-    console_ui.add_value_to_column('PORT', port)
-    if args.verbose:
-        console_ui.add_value_to_column('[TIME, ms]', t)
-
-    if args.guess:
-        protocol = get_protocol_func(port, args.ip)
-        console_ui.add_value_to_column('PROTOCOL', protocol)
+def _row_key(transport_protocol, ip, port):
+    return ip_to_int(ip), transport_protocol, port
 
 
-def add_filtered_udp_ports_to_console_if_open(console_ui, transport_protocol, get_protocol_func,
-                                              args, port, t=''):
-    """ Add filtered udp ports to console if open """
-    protocol = get_protocol_func(port, args.ip)
-    if protocol:
-        console_ui.add_value_to_column('TCP|UDP', transport_protocol)
-        console_ui.add_value_to_column('PORT', port)
-        if args.verbose:
-            console_ui.add_value_to_column('[TIME, ms]', t)
-        console_ui.add_value_to_column('PROTOCOL', protocol)
+def add_data_to_console_column(console_ui, transport_protocol, args, ip, port, t='', protocol=''):
+    """ Add data to console column """
+    row = {'HOST': ip, 'TCP|UDP': transport_protocol, 'PORT': port, '[TIME, ms]': t, 'PROTOCOL': protocol}
+    console_ui.add_row(row, _row_key(transport_protocol, ip, port))
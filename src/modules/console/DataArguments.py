@@ -1,5 +1,7 @@
 from dataclasses import dataclass
-from typing import Dict, Set
+from typing import Dict, Optional
+from src.modules.structures.PortSet import PortSet
+from src.modules.structures.TargetSet import TargetSet
 
 
 @dataclass
@@ -7,9 +9,35 @@ class DataArguments:
     """
     This class is used to store all the data arguments
     """
-    ip: str
-    ports: Dict[str, Set[int]]
+    targets: TargetSet
+    ports: Dict[str, PortSet]
     timeout: float
     verbose: bool
     guess: bool
     threads: int
+    stateless: bool = False
+    rate: float = 0
+    adaptive: bool = False
+    retries: int = 0
+    seed: Optional[int] = None
+    batch_size: int = 64
+    transport: str = 'socket'
+    interface: Optional[str] = None
+    summary: bool = False
+    guess_workers: int = 32
+    guess_timeout: float = 1.0
+    checkpoint: Optional[str] = None
+    checkpoint_interval: float = 10.0
+    resume: bool = False
+    store: Optional[str] = None
+    progress: bool = False
+    progress_interval: float = 1.0
+    metrics: Optional[str] = None
+    metrics_format: str = 'json'
+    resolve: bool = False
+    dns_server: Optional[str] = None
+    dns_cache: Optional[str] = None
+    discover: bool = False
+    discovery_rate: float = 0
+    discovery_timeout: float = 1.0
+    discovery_retries: int = 1
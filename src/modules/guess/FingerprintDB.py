@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fingerprints.json')
+# bump when the cached form changes
+CACHE_VERSION = 4
+_TEMPLATE = re.compile(r'\$(\d)')
+
+
+@dataclass(frozen=True)
+class Probe:
+    """
+    Payload sent to a port, empty payload only waits for a banner
+    """
+    name: str
+    protocol: str
+    payload: bytes
+    ports: Tuple[int, ...] = ()
+    only_ports: bool = False
+    """ send only to ports, otherwise ports are only tried first """
+
+
+class Rule(NamedTuple):
+    service: str
+    product: str
+    version: str
+    info: str
+    pattern: str
+    flags: str
+    groups: int
+    first: Optional[FrozenSet[int]]
+    """ bytes the rule can match first, None if any """
+    probes: Tuple[str, ...]
+    """ names of probes whose answers the rule matches, empty for any """
+
+
+class Fingerprint(NamedTuple):
+    service: str
+    product: str
+    version: str
+    info: str
+
+    def __str__(self):
+        details = ' '.join(value for value in (self.product, self.version) if value)
+        if self.info:
+            details = f'{details}, {self.info}' if details else self.info
+        return f'{self.service} ({details})' if details else self.service
+
+
+def _first_bytes(items, ignore_case: bool) -> Optional[FrozenSet[int]]:
+    """
+    Bytes a parsed pattern can start with, None if it is not known
+    """
+    for op, arg in items:
+        if op == sre_parse.AT:
+            continue
+        if op == sre_parse.LITERAL:
+            first = {arg}
+        elif op == sre_parse.IN:
+            first = set()
+            for item_op, item_arg in arg:
+                if item_op == sre_parse.LITERAL:
+                    first.add(item_arg)
+                elif item_op == sre_parse.RANGE:
+                    first.update(range(item_arg[0], item_arg[1] + 1))
+                else:
+                    return None
+        elif op == sre_parse.SUBPATTERN:
+            return _first_bytes(arg[-1], ignore_case)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and arg[0] > 0:
+            return _first_bytes(arg[2], ignore_case)
+        elif op == sre_parse.BRANCH:
+            first = set()
+            for branch in arg[1]:
+                branch_first = _first_bytes(branch, ignore_case)
+                if branch_first is None:
+                    return None
+                first |= branch_first
+            return frozenset(first)
+        else:
+            return None
+        if ignore_case:
+            first |= {ord(chr(byte).swapcase()) for byte in first if chr(byte).isalpha()}
+        return frozenset(first)
+    return None
+
+
+class FingerprintDB:
+    """
+    Data-driven service identification: probes to send and match rules that extract product and version.
+    Rules that can match the first byte of an answer are combined into one alternation of named groups,
+    so an answer is matched against all candidate rules in one pass and the first rule in file order wins.
+    Alternations are compiled on first use for each first byte. The parsed rules are cached on disk
+    keyed by the database file, so loading neither parses json nor compiles any pattern.
+    Rules are regular expressions over bytes read as latin-1 matched at the start of the answer,
+    backreferences are not supported
+    """
+    def __init__(self, probes: List[Probe], rules: List[Rule]):
+        self.probes = probes
+        self.rules = rules
+        self.combined: Dict[Tuple[Optional[str], int], Tuple[re.Pattern, Dict[str, Tuple[int, Rule]]]] = {}
+
+    @classmethod
+    def compile(cls, data: dict) -> 'FingerprintDB':
+        """
+        Build database from parsed json
+        """
+        probes = [Probe(probe['name'], probe['protocol'],
+                        bytes.fromhex(probe['payload_hex']) if 'payload_hex' in probe
+                        else probe.get('payload', '').encode('latin-1'),
+                        tuple(probe.get('ports', ())), probe.get('only_ports', False))
+                  for probe in data['probes']]
+        rules = []
+        for match in data['matches']:
+            pattern = match['pattern']
+            flags = match.get('flags', '')
+            groups = re.compile(pattern.encode('latin-1')).groups
+            rules.append(Rule(match['service'], match.get('product', ''), match.get('version', ''),
+                              match.get('info', ''), pattern, flags, groups,
+                              _first_bytes(sre_parse.parse(pattern.encode('latin-1')), 'i' in flags),
+                              tuple(match.get('probes', ()))))
+        return cls(probes, rules)
+
+    def _combine(self, probe: Optional[str], first: int) -> Tuple[re.Pattern, Dict[str, Tuple[int, Rule]]]:
+        """
+        Alternation of the rules that can match answer to probe starting with first byte
+        """
+        parts = []
+        names = {}
+        group = 1
+        for i, rule in enumerate(self.rules):
+            if rule.first is not None and first not in rule.first:
+                continue
+            if rule.probes and probe not in rule.probes:
+                continue
+            scoped = f'(?{rule.flags}:{rule.pattern})' if rule.flags else f'(?:{rule.pattern})'
+            parts.append(f'(?P<r{i}>{scoped})')
+            names[f'r{i}'] = (group, rule)
+            group += rule.groups + 1
+        # a never matching pattern when no rule can match
+        combined = re.compile('|'.join(parts).encode('latin-1') if parts else rb'(?!)'), names
+        self.combined[probe, first] = combined
+        return combined
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_PATH, cache_dir: Optional[str] = None) -> 'FingerprintDB':
+        """
+        Load database, the parsed rules are read from and written to cache_dir
+        :param cache_dir: cache directory, $XDG_CACHE_HOME/portscanner by default, '' disables cache
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                                     'portscanner')
+        cache_path = None
+        if cache_dir:
+            stat = os.stat(path)
+            key = f'{CACHE_VERSION}:{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}'
+            cache_path = os.path.join(cache_dir, f'fingerprints-{hashlib.sha1(key.encode()).hexdigest()[:16]}.json')
+            try:
+                with open(cache_path, encoding='utf-8') as f:
+                    return cls._from_cache(json.load(f))
+            except (OSError, ValueError, TypeError, KeyError):
+                pass
+
+        with open(path, encoding='utf-8') as f:
+            db = cls.compile(json.load(f))
+        if cache_path is not None:
+            db._save(cache_path)
+        return db
+
+    @classmethod
+    def _from_cache(cls, data: dict) -> 'FingerprintDB':
+        """
+        Database from _to_cache() form, the cache is plain json so a tampered file can not run code
+        """
+        probes = [Probe(name, protocol, bytes.fromhex(payload), tuple(ports), only_ports)
+                  for name, protocol, payload, ports, only_ports in data['probes']]
+        rules = [Rule(service, product, version, info, pattern, flags, groups,
+                      frozenset(first) if first is not None else None, tuple(probes))
+                 for service, product, version, info, pattern, flags, groups, first, probes in data['rules']]
+        return cls(probes, rules)
+
+    def _to_cache(self) -> dict:
+        return {
+            'probes': [[probe.name, probe.protocol, probe.payload.hex(), list(probe.ports), probe.only_ports]
+                       for probe in self.probes],
+            'rules': [[*rule[:7], sorted(rule.first) if rule.first is not None else None, list(rule.probes)]
+                      for rule in self.rules],
+        }
+
+    def _save(self, cache_path: str):
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._to_cache(), f)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+
+    def match(self, data: bytes, probe: str = None) -> Optional[Fingerprint]:
+        """
+        Identify service by its answer
+        :param probe: name of the probe that was answered, rules restricted to other probes are skipped
+        """
+        if not data:
+            return None
+        pattern, names = self.combined.get((probe, data[0])) or self._combine(probe, data[0])
+        found = pattern.match(data)
+        if found is None:
+            return None
+        group, rule = names[found.lastgroup]
+        values = found.groups()[group:group + rule.groups]
+
+        def fill(template: str) -> str:
+            return _TEMPLATE.sub(lambda m: (values[int(m.group(1)) - 1] or b'').decode('latin-1')
+                                 if 0 < int(m.group(1)) <= len(values) else '', template).strip()
+
+        return Fingerprint(rule.service, fill(rule.product), fill(rule.version), fill(rule.info))
+
+    def payloads(self, protocol: str = 'udp') -> Dict[int, Probe]:
+        """
+        Probe for every port listed by probes of protocol, the first probe listing a port wins
+        """
+        table = {}
+        for probe in self.probes:
+            if probe.protocol == protocol:
+                for port in probe.ports:
+                    table.setdefault(port, probe)
+        return table
+
+    def probes_for(self, protocol: str, port: int) -> List[Probe]:
+        """
+        Probes to send to port: probes for this port first, then the others in database order
+        """
+        probes = [probe for probe in self.probes if probe.protocol == protocol]
+        return [probe for probe in probes if port in probe.ports] + \
+               [probe for probe in probes if port not in probe.ports and not probe.only_ports]
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_db() -> FingerprintDB:
+    """
+    Database shipped with the scanner, loaded on first use
+    """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = FingerprintDB.load()
+    return _default
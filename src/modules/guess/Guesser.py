@@ -0,0 +1,75 @@
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, List, Tuple
+from src.modules.helpers import get_protocols_to_tcp_port, get_protocols_to_udp_port
+from src.modules.scanners.ScanEvent import ScanEvent
+
+Guess = Tuple[ScanEvent, str]
+
+
+class Guesser:
+    """
+    Application protocol guessing as a pipeline stage: ports are submitted as soon as the scanner
+    reports them and probed concurrently by a bounded pool of workers, every connection
+    has connect and read deadlines. Finished guesses are collected in completion order
+    """
+    def __init__(self, workers: int = 32, connect_timeout: float = 1.0, read_timeout: float = 1.0):
+        """
+        :param workers: maximum number of ports probed at once
+        :param connect_timeout: tcp connect deadline, seconds
+        :param read_timeout: answer deadline, seconds
+        """
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='guess')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.finished: 'queue.Queue[Guess]' = queue.Queue()
+        self.futures = set()
+        self.pending = 0
+
+    def submit(self, event: ScanEvent):
+        """
+        Start guessing protocol of the port of event
+        """
+        if event.protocol == 'tcp':
+            future = self.pool.submit(get_protocols_to_tcp_port, event.port, event.host,
+                                      self.connect_timeout, self.read_timeout)
+        else:
+            future = self.pool.submit(get_protocols_to_udp_port, event.port, event.host, self.read_timeout)
+        self.pending += 1
+        self.futures.add(future)
+        future.add_done_callback(lambda done, event=event: self._finish(event, done))
+
+    def _finish(self, event: ScanEvent, future: Future):
+        self.futures.discard(future)
+        protocol = '' if future.cancelled() or future.exception() is not None else future.result()
+        self.finished.put((event, protocol))
+
+    def completed(self) -> List[Guess]:
+        """
+        Guesses finished so far, does not block
+        """
+        guesses = []
+        while True:
+            try:
+                guesses.append(self.finished.get_nowait())
+            except queue.Empty:
+                break
+        self.pending -= len(guesses)
+        return guesses
+
+    def wait(self) -> Iterator[Guess]:
+        """
+        Wait for the remaining guesses, they are yielded as they finish
+        """
+        while self.pending > 0:
+            guess = self.finished.get()
+            self.pending -= 1
+            yield guess
+
+    def close(self):
+        """
+        Cancel guesses that have not started
+        """
+        for future in list(self.futures):
+            future.cancel()
+        self.pool.shutdown(wait=False)
@@ -1,39 +1,30 @@
 import struct
 import socket
+import time
+from typing import List, Tuple
+from src.modules.guess.FingerprintDB import default_db
 
-_HTTP_REQUESTS = b'GET / HTTP/1.1\r\nUser-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0.0.0 Safari/537.36 OPR/92.0.0.0\r\n\r\n\r\n'
-_DNS_PACKAGE = b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
-_DNS_RESPONSE_PACKAGE = b'\x00\x00\x80\x01\x00\x00\x00\x00\x00\x00\x00\x00'
 
-
-def is_dns_on_udp(ip: str, port: int) -> bool:
+def _udp_exchange(ip: str, port: int, requests: List[bytes], read_timeout: float = 0.5) -> List[bytes]:
     """
-    Checking to dns protocol on udp port
+    Send all requests from one udp socket and collect answers until the deadline
     """
+    answers = []
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-        sock.settimeout(0.5)
-        sock.sendto(_DNS_PACKAGE, (ip, port))
         try:
-            data = sock.recv(2048)
-        except socket.timeout:
-            return False
-
-        return data == _DNS_RESPONSE_PACKAGE
-
+            for request in requests:
+                sock.sendto(request, (ip, port))
+            deadline = time.monotonic() + read_timeout
+            while len(answers) < len(requests):
+                sock.settimeout(max(0.0, deadline - time.monotonic()))
+                answers.append(sock.recv(2048))
+        except OSError:
+            pass
+    return answers
 
-def is_dns_on_tcp(ip: str, port: int) -> bool:
-    """
-    Checking to dns protocol on tcp port
-    """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.connect((ip, port))
-        sock.send(_DNS_PACKAGE)
-        try:
-            data = sock.recv(1024)
-        except ConnectionResetError:
-            return False
 
-        return data == _DNS_RESPONSE_PACKAGE
+def _is_echo(request: bytes, data: bytes) -> bool:
+    return len(data) > 0 and request.startswith(data)
 
 
 def get_port_from_data(data: bytes) -> int:
@@ -42,75 +33,66 @@ def get_port_from_data(data: bytes) -> int:
     return struct.unpack('!H', data[ip_header_len:ip_header_len + 2])[0]
 
 
-def is_http_on_tcp(ip: str, port: int) -> bool:
-    """
-    Checking to http
-    """
-    if port == 443:
-        return False
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.connect((ip, port))
-        sock.send(_HTTP_REQUESTS)
-        try:
-            data = sock.recv(1024)
-        except ConnectionResetError:
-            return False
-
-        return data.decode().find('HTTP') != -1 and data.decode().find('HTTPS') == -1
-
-
-def is_echo_on_udp(ip: str, port: int) -> bool:
+def _recv(sock: socket.socket) -> Tuple[bytes, bool]:
     """
-    Checking to echo protocol on udo port
+    :return: first chunk of data and whether the connection is still open
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-        sock.settimeout(0.5)
-        sock.sendto(b'echo', (ip, port))
-        try:
-            data, conn = sock.recvfrom(1024)
-        except socket.timeout:
-            return False
+    try:
+        data = sock.recv(1024)
+    except socket.timeout:
+        return b'', True
+    except OSError:
+        return b'', False
+    return data, len(data) > 0
 
-        return data == b'echo'
 
-
-def is_echo_on_tcp(ip: str, port: int) -> bool:
+def get_protocols_to_udp_port(port: int, ip: str, read_timeout: float = 0.5) -> str:
     """
-    Checking to echo protocol on tcp port
+    Get protocol on udp port, fingerprint database probes and ECHO probe are sent together from one socket
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.connect((ip, port))
-        sock.settimeout(2)
-        sock.send(b'echo')
-        try:
-            data = sock.recv(1024)
-        except socket.timeout:
-            return False
-
-        return data == b'echo'
-
-
-def get_protocols_to_udp_port(port: int, ip: str) -> str:
-    """
-    Get protocol on udp port
-    """
-    if is_dns_on_udp(ip, port):
-        return 'DNS'
-    elif is_echo_on_udp(ip, port):
+    db = default_db()
+    probes = db.probes_for('udp', port)
+    answers = _udp_exchange(ip, port, [probe.payload for probe in probes] + [b'echo'], read_timeout)
+    for data in answers:
+        for probe in probes:
+            fingerprint = db.match(data, probe.name)
+            if fingerprint is not None:
+                return str(fingerprint)
+    if any(data == b'echo' or any(data == probe.payload for probe in probes) for data in answers):
         return 'ECHO'
-    else:
-        return ''
+    return ''
 
 
-def get_protocols_to_tcp_port(port: int, ip: str) -> str:
+def get_protocols_to_tcp_port(port: int, ip: str, connect_timeout: float = 1.0, read_timeout: float = 1.0) -> str:
     """
-    Get protocol on tcp port
+    Get protocol on tcp port with fingerprint database probes, probes for the port go first.
+    Connection of the banner probe is reused by the next probe, an echo service returns the probe itself
     """
-    if is_echo_on_tcp(ip, port):
-        return 'ECHO'
-    elif is_http_on_tcp(ip, port):
-        return 'HTTP'
-    elif is_dns_on_tcp(ip, port):
-        return 'DNS'
-    else:
-        return ''
+    db = default_db()
+    sock = None
+    try:
+        for probe in db.probes_for('tcp', port):
+            if sock is None:
+                try:
+                    sock = socket.create_connection((ip, port), timeout=connect_timeout)
+                except OSError:
+                    return ''
+                sock.settimeout(read_timeout)
+            try:
+                sock.sendall(probe.payload)
+            except OSError:
+                data, alive = b'', False
+            else:
+                data, alive = _recv(sock)
+            if data:
+                if probe.payload and _is_echo(probe.payload, data):
+                    return 'ECHO'
+                fingerprint = db.match(data, probe.name)
+                return str(fingerprint) if fingerprint is not None else ''
+            if probe.payload or not alive:
+                sock.close()
+                sock = None
+    finally:
+        if sock is not None:
+            sock.close()
+    return ''
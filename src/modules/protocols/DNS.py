@@ -0,0 +1,105 @@
+import struct
+from typing import NamedTuple, Optional, Tuple
+
+TYPE_SOA = 6
+TYPE_PTR = 12
+CLASS_IN = 1
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+FLAG_RESPONSE = 0x8000
+FLAG_RECURSION = 0x0100
+MAX_POINTERS = 64
+""" compression pointers followed in one name, more is a loop """
+
+_HEADER = struct.Struct('!HHHHHH')
+_QUESTION = struct.Struct('!HH')
+_RECORD = struct.Struct('!HHIH')
+_SOA_MINIMUM = struct.Struct('!I')
+
+
+class PtrAnswer(NamedTuple):
+    query_id: int
+    rcode: int
+    question: str
+    name: Optional[str]
+    """ first PTR name of the answer, None if there is none """
+    ttl: int
+    """ seconds the answer may be cached, 0 if it must not be """
+
+
+def reverse_pointer(ip: str) -> str:
+    """
+    Name of the PTR record of ip: 4.3.2.1.in-addr.arpa for 1.2.3.4
+    """
+    return '.'.join(reversed(ip.split('.'))) + '.in-addr.arpa'
+
+
+def encode_name(name: str) -> bytes:
+    return b''.join(bytes([len(label)]) + label for label in name.encode('ascii').split(b'.') if label) + b'\0'
+
+
+def ptr_query(query_id: int, ip: str) -> bytes:
+    """
+    Recursive PTR query of ip
+    """
+    return _HEADER.pack(query_id, FLAG_RECURSION, 1, 0, 0, 0) + encode_name(reverse_pointer(ip)) + \
+        _QUESTION.pack(TYPE_PTR, CLASS_IN)
+
+
+def read_name(data: bytes, offset: int) -> Tuple[str, int]:
+    """
+    Read possibly compressed name at offset
+    :return: name without the trailing dot and offset after the name
+    """
+    labels = []
+    end = None
+    for _ in range(MAX_POINTERS):
+        length = data[offset]
+        if length >= 0xc0:
+            if end is None:
+                end = offset + 2
+            offset = (length & 0x3f) << 8 | data[offset + 1]
+            continue
+        if length == 0:
+            return '.'.join(labels), offset + 1 if end is None else end
+        labels.append(data[offset + 1:offset + 1 + length].decode('ascii', 'replace'))
+        offset += length + 1
+    raise ValueError('DNS name has a compression loop')
+
+
+def parse_ptr_answer(data: bytes) -> Optional[PtrAnswer]:
+    """
+    Parse response to ptr_query(), None if data is not a well formed response.
+    Negative answers may be cached for the smaller of the SOA record TTL and its minimum field (RFC 2308)
+    """
+    try:
+        query_id, flags, questions, answers, authorities, _ = _HEADER.unpack_from(data)
+        if not flags & FLAG_RESPONSE or questions != 1:
+            return None
+        question, offset = read_name(data, _HEADER.size)
+        offset += _QUESTION.size
+        name, ttl = None, None
+        for _ in range(answers):
+            _, offset = read_name(data, offset)
+            kind, klass, record_ttl, length = _RECORD.unpack_from(data, offset)
+            offset += _RECORD.size
+            # CNAMEs of classless delegations (RFC 2317) come first, the shortest TTL limits the answer
+            ttl = record_ttl if ttl is None else min(ttl, record_ttl)
+            if kind == TYPE_PTR and klass == CLASS_IN and name is None:
+                name = read_name(data, offset)[0]
+            offset += length
+        if name is None:
+            ttl = 0
+            for _ in range(authorities):
+                _, offset = read_name(data, offset)
+                kind, _, record_ttl, length = _RECORD.unpack_from(data, offset)
+                offset += _RECORD.size
+                if kind == TYPE_SOA:
+                    # the minimum is the last field of SOA data
+                    minimum = _SOA_MINIMUM.unpack_from(data, offset + length - _SOA_MINIMUM.size)[0]
+                    ttl = min(record_ttl, minimum)
+                    break
+                offset += length
+        return PtrAnswer(query_id, flags & 0xf, question.lower(), name, ttl)
+    except (struct.error, IndexError, ValueError):
+        return None
@@ -1,4 +1,8 @@
 import struct
+from src.modules.protocols.TCPPackage import TCPPackage
+
+ECHO_REPLY = 0
+ECHO_REQUEST = 8
 
 
 class ICMP:
@@ -19,3 +23,18 @@ class ICMP:
         """
         port = struct.unpack('!H', self.data[50:][0:2])
         return port[0]
+
+    def get_echo_identifier(self) -> int:
+        """
+        Decoding the identifier of an echo reply
+        """
+        return struct.unpack('!H', self.data[24:26])[0]
+
+    @staticmethod
+    def echo_request(identifier: int, sequence: int = 0) -> bytes:
+        """
+        Build ICMP echo request without payload
+        """
+        package = struct.pack('!BBHHH', ECHO_REQUEST, 0, 0, identifier, sequence)
+        checksum = TCPPackage.check_sum(package)
+        return package[:2] + struct.pack('H', checksum) + package[4:]
@@ -0,0 +1,68 @@
+import os
+import struct
+import time
+from hashlib import blake2b
+from socket import inet_aton
+from typing import Optional
+
+
+"""
+SYN cookie layout (sequence number of the probe)
+
+    0                   1                   2                   3
+    0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
+   +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+   |      Send time, ms mod 2^16   |  MAC(ip, port, src port, time) |
+   +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+"""
+
+_MAC_INPUT = struct.Struct('!4sHHH')
+MAX_AGE = 0xffff / 1000
+""" the 16 bit millisecond send time wraps after this many seconds """
+
+
+class SynCookie:
+    """
+    Keyed sequence numbers for stateless SYN scanning.
+    A reply is valid only if its acknowledgment is cookie + 1, the send time is
+    recovered from the cookie itself, so no per-probe state is kept
+    """
+    def __init__(self, max_age: float, key: bytes = None):
+        """
+        :param max_age: replies older than max_age seconds are rejected, less than MAX_AGE
+        :param key: secret key, random by default
+        """
+        if not 0 < max_age < MAX_AGE:
+            raise ValueError(f'SYN cookie max age should be more 0 and less {MAX_AGE} seconds')
+        self.max_age = max_age
+        self.max_age_ms = int(max_age * 1000)
+        self.key = key or os.urandom(16)
+
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.perf_counter() * 1000)
+
+    def _mac(self, ip: str, port: int, from_port: int, stamp: int) -> int:
+        data = _MAC_INPUT.pack(inet_aton(ip), port, from_port, stamp)
+        return int.from_bytes(blake2b(data, digest_size=2, key=self.key).digest(), 'big')
+
+    def make(self, ip: str, port: int, from_port: int) -> int:
+        """
+        Make sequence number for probe from from_port to (ip, port)
+        """
+        stamp = self._now_ms() & 0xffff
+        return (stamp << 16) | self._mac(ip, port, from_port, stamp)
+
+    def check(self, ip: str, port: int, from_port: int, acknowledgment: int) -> Optional[float]:
+        """
+        Check acknowledgment of reply from (ip, port) to from_port
+        :return: time to answer in seconds or None if reply does not match any probe
+        """
+        cookie = (acknowledgment - 1) & 0xffffffff
+        stamp = cookie >> 16
+        if cookie & 0xffff != self._mac(ip, port, from_port, stamp):
+            return None
+        elapsed = (self._now_ms() - stamp) & 0xffff
+        if elapsed > self.max_age_ms:
+            return None
+        return elapsed / 1000
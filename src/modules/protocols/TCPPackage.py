@@ -2,6 +2,10 @@ from dataclasses import dataclass
 import struct
 from socket import inet_aton, IPPROTO_TCP
 from array import array
+from typing import Sequence, Tuple
+
+numpy = None
+""" imported by the first batch large enough for it, False if it is not installed """
 
 
 """
@@ -46,12 +50,14 @@ class TCPData:
 
 class TCPPackage:
     """ TCP package data """
-    def __init__(self, from_host: str, from_port: int, to_host: str, to_port: int, flags: int = 0):
+    def __init__(self, from_host: str, from_port: int, to_host: str, to_port: int, flags: int = 0,
+                 sequence: int = 0):
         self.from_host = from_host
         self.from_port = from_port
         self.to_host = to_host
         self.to_port = to_port
         self.flags = flags
+        self.sequence = sequence
 
     def build(self) -> bytes:
         """
@@ -61,7 +67,7 @@ class TCPPackage:
             '!HHIIBBHHH',
             self.from_port,  # Source Port
             self.to_port,  # Destination Port
-            0,  # Sequence Number
+            self.sequence,  # Sequence Number
             0,  # Acknoledgement Number
             5 << 4,  # Data offset
             self.flags,  # Flags
@@ -106,3 +112,112 @@ class TCPPackage:
         flag_fin = offset_flags & 1
         return TCPData(from_port, to_port, sequence, acknowledgment, flag_urg, flag_ack,
                        flag_psh, flag_rst, flag_syn, flag_fin)
+
+
+_HEADER_LEN = 20
+_CHECKSUM_OFFSET = 16
+_PROBE_FIELDS = struct.Struct('!HHI')
+_CHECKSUM_FIELD = struct.Struct('!H')
+_ADDRESS_WORDS = struct.Struct('!HH')
+_NUMPY_MIN_BATCH = 64
+
+
+def _fold(value: int) -> int:
+    """
+    Fold a 32+ bit sum into 16 bits with end-around carry
+    """
+    value = (value >> 16) + (value & 0xffff)
+    value += value >> 16
+    return value & 0xffff
+
+
+def _address_sum(ip: str) -> int:
+    """
+    Sum of the two 16 bit words of an IPv4 address, its part of the pseudo header sum
+    """
+    high, low = _ADDRESS_WORDS.unpack(inet_aton(ip))
+    return high + low
+
+
+def _load_numpy() -> bool:
+    """
+    Import numpy on first use, it takes longer to import than a small scan takes to run
+    """
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+    return numpy is not False
+
+
+class TCPTemplate:
+    """
+    Precomputed tcp header for one source and its default target.
+
+    The header and the one's complement sum of the pseudo header are computed once,
+    every probe then only patches ports and sequence number into a preallocated
+    buffer and updates the checksum incrementally (RFC 1624), so the output is
+    byte-for-byte equal to TCPPackage(...).build(). The target is only part of the
+    checksum, so one template builds packages to any target from the same source
+    """
+    def __init__(self, from_host: str, to_host: str, flags: int = 0):
+        self.from_host = from_host
+        self.to_host = to_host
+        self.flags = flags
+        header = TCPPackage(from_host, 0, to_host, 0, flags).build()
+        self._header = header[:_CHECKSUM_OFFSET] + b'\0\0' + header[_CHECKSUM_OFFSET + 2:]
+        # Sum of the pseudo header without the target and the header with zeroed ports, sequence and checksum
+        self._source_sum = _fold(_address_sum(from_host) + IPPROTO_TCP + _HEADER_LEN +
+                                 sum(struct.unpack('!10H', self._header)))
+        self._base_sum = _fold(self._source_sum + _address_sum(to_host))
+        self._buffer = bytearray(self._header)
+
+    def build(self, from_port: int, to_port: int, sequence: int = 0, to_host: str = None) -> bytearray:
+        """
+        Build tcp package into the template buffer.
+        NOTE: the returned buffer is reused by the next call, send it before building another one
+        :param to_host: target of the package, the template target by default
+        """
+        buffer = self._buffer
+        _PROBE_FIELDS.pack_into(buffer, 0, from_port, to_port, sequence)
+        base_sum = self._base_sum if to_host is None else self._source_sum + _address_sum(to_host)
+        checksum = ~_fold(base_sum + from_port + to_port + (sequence >> 16) + (sequence & 0xffff))
+        _CHECKSUM_FIELD.pack_into(buffer, _CHECKSUM_OFFSET, checksum & 0xffff)
+        return buffer
+
+    def build_batch(self, probes: Sequence[Tuple[int, int, int]], use_numpy: bool = True) -> bytearray:
+        """
+        Build several tcp packages into one contiguous buffer, package i is at [i * 20:(i + 1) * 20]
+        :param probes: (from_port, to_port, sequence) for every package
+        :param use_numpy: vectorize with numpy if it is installed and the batch is large enough
+        """
+        count = len(probes)
+        buffer = bytearray(self._header) * count
+        if use_numpy and count >= _NUMPY_MIN_BATCH and _load_numpy():
+            self._patch_numpy(buffer, probes)
+            return buffer
+        base_sum = self._base_sum
+        for i, (from_port, to_port, sequence) in enumerate(probes):
+            offset = i * _HEADER_LEN
+            _PROBE_FIELDS.pack_into(buffer, offset, from_port, to_port, sequence)
+            checksum = ~_fold(base_sum + from_port + to_port + (sequence >> 16) + (sequence & 0xffff))
+            _CHECKSUM_FIELD.pack_into(buffer, offset + _CHECKSUM_OFFSET, checksum & 0xffff)
+        return buffer
+
+    def _patch_numpy(self, buffer: bytearray, probes: Sequence[Tuple[int, int, int]]):
+        """
+        Patch ports, sequence numbers and checksums of a batch with numpy
+        """
+        fields = numpy.array(probes, dtype=numpy.uint64).reshape(-1, 3)
+        words = numpy.frombuffer(buffer, dtype='>u2').reshape(-1, _HEADER_LEN // 2)
+        sequence = fields[:, 2]
+        words[:, 0] = fields[:, 0]
+        words[:, 1] = fields[:, 1]
+        words[:, 2] = sequence >> 16
+        words[:, 3] = sequence & 0xffff
+        total = self._base_sum + fields[:, 0] + fields[:, 1] + (sequence >> 16) + (sequence & 0xffff)
+        total = (total >> 16) + (total & 0xffff)
+        total += total >> 16
+        words[:, _CHECKSUM_OFFSET // 2] = ~total & 0xffff
@@ -0,0 +1,183 @@
+import asyncio
+import socket
+from typing import Callable, Dict, Iterable, List, Union
+from src.modules.scanners.BaseScanner import BaseScanner
+from src.modules.scanners.Pacer import Pacer
+from src.modules.scanners.ParallelScan import ScanResults
+from src.modules.scanners.ScanEngine import ScanEngine
+from src.modules.scanners.ScanEvent import ScanEvent
+from src.modules.scanners.TCPScanner import TCPScanner
+from src.modules.scanners.UDPScanner import UDPScanner
+from src.modules.structures.TargetSet import TargetSet
+from src.modules.transport.BpfFilter import tcp_reply_filter, icmp_unreachable_filter
+from src.modules.transport.SharedSocket import SocketPool
+
+
+class AsyncTCPScanner(TCPScanner):
+    """ Tcp scanner on the shared raw tcp socket of the event loop """
+    def __init__(self, pool: SocketPool, targets: Union[TargetSet, str], ports: Iterable[int], timeout: float,
+                 **kwargs):
+        """
+        :param pool: shared sockets of the event loop
+        Other parameters are the same as in TCPScanner, 'packet' transport is not supported
+        """
+        self.pool = pool
+        super().__init__(targets, ports, timeout, **kwargs)
+
+    def create_raw_tcp_socket(self):
+        return self.pool.acquire(self, 'tcp',
+                                 lambda: socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP),
+                                 lambda intervals: tcp_reply_filter(intervals, self.SOURCE_PORTS))
+
+    def update_filter(self):
+        self.filtered = self.pool.shared(self.tcp_socket).update_filter()
+
+    def close(self):
+        self.port_states.destroy()
+        self.pool.release(self)
+
+
+class AsyncUDPScanner(UDPScanner):
+    """ Udp scanner on the shared udp and raw icmp sockets of the event loop """
+    def __init__(self, pool: SocketPool, targets: Union[TargetSet, str], ports: Iterable[int], timeout: float,
+                 **kwargs):
+        """
+        :param pool: shared sockets of the event loop
+        Other parameters are the same as in UDPScanner
+        """
+        self.pool = pool
+        super().__init__(targets, ports, timeout, **kwargs)
+
+    def create_udp_socket(self):
+        return self.pool.acquire(self, 'udp', lambda: socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+
+    def create_raw_icmp_socket(self):
+        return self.pool.acquire(self, 'icmp',
+                                 lambda: socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP),
+                                 icmp_unreachable_filter)
+
+    def update_filter(self):
+        self.filtered = self.pool.shared(self.icmp_socket).update_filter()
+
+    def close(self):
+        self.port_states.destroy()
+        self.pool.release(self)
+
+
+class AsyncScanEngine(ScanEngine):
+    """
+    ScanEngine driven by event loop callbacks (add_reader/add_writer and timers) instead of
+    its own selector loop. Scanners use the shared sockets of the loop, so any number of
+    engines run concurrently in one loop without opening sockets of their own
+    """
+    def __init__(self, scanners: List[BaseScanner], pool: SocketPool, pacer: Pacer = None):
+        """
+        :param scanners: scanners created with pool
+        :param pool: shared sockets of the event loop
+        :param pacer: shared pacer, pacer of the first scanner by default
+        """
+        super().__init__(scanners, pacer)
+        self.pool = pool
+        self.loop = pool.loop
+        self.active = list(self.scanners)
+        self.timer = None
+        self.done = None
+
+    async def run(self):
+        """
+        Scan until every scanner is finished, scanners are closed when they finish
+        """
+        self.done = self.loop.create_future()
+        for scanner in self.scanners:
+            self.writing[scanner] = False
+            self.pool.watch(scanner, self._step)
+        self._step()
+        try:
+            await self.done
+        finally:
+            if self.timer is not None:
+                self.timer.cancel()
+            for scanner in self.active:
+                scanner.close()
+            self.active.clear()
+
+    def _writer(self, scanner: BaseScanner):
+        def send() -> bool:
+            try:
+                if self._send(scanner):
+                    return True
+            except OSError as e:
+                self._fail(e)
+            self.writing[scanner] = False
+            self._schedule()
+            return False
+        return send
+
+    def _fail(self, error: BaseException):
+        if not self.done.done():
+            self.done.set_exception(error)
+
+    def _schedule(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        timeout = self._select_timeout(self.active)
+        if timeout is not None and not self.done.done():
+            self.timer = self.loop.call_later(timeout, self._step)
+
+    def _step(self):
+        """
+        Expire timed out probes, close finished scanners and start sending when pacer allows
+        """
+        if self.done.done():
+            return
+        try:
+            for scanner in list(self.active):
+                scanner.port_states.expire()
+                if scanner.is_finished():
+                    self.active.remove(scanner)
+                    scanner.close()
+                elif not self.writing[scanner] and self._send(scanner):
+                    self.writing[scanner] = True
+                    self.pool.shared(scanner.write_socket).want_write(scanner, self._writer(scanner))
+        except OSError as e:
+            self._fail(e)
+            return
+        if not self.active:
+            self.done.set_result(None)
+        self._schedule()
+
+
+async def scan(targets: Union[TargetSet, str], ports: Dict[str, Iterable[int]], timeout: float = 2.0,
+               stateless: bool = False, rate: float = 0, adaptive: bool = False, retries: int = 0,
+               seed: int = None, batch_size: int = 64,
+               on_event: Callable[[ScanEvent], None] = None) -> ScanResults:
+    """
+    Scan targets in the running event loop. Concurrent scans share the raw sockets of the loop
+    :param targets: TargetSet or string with comma separated addresses, networks and ranges
+    :param ports: {'tcp': ports, 'udp': ports}
+    :param on_event: called with every result event as soon as the port state is final
+    Other parameters are the same as in TCPScanner and UDPScanner
+    """
+    pool = SocketPool.for_loop(asyncio.get_running_loop(), batch_size)
+    scanners = {}
+    try:
+        if 'udp' in ports:
+            scanners['udp'] = AsyncUDPScanner(pool, targets, ports['udp'], timeout, rate=rate, adaptive=adaptive,
+                                              retries=retries, seed=seed, batch_size=batch_size)
+        if 'tcp' in ports:
+            scanners['tcp'] = AsyncTCPScanner(pool, targets, ports['tcp'], timeout, stateless=stateless,
+                                              rate=rate, adaptive=adaptive, retries=retries, seed=seed,
+                                              batch_size=batch_size)
+    except BaseException:
+        for scanner in scanners.values():
+            scanner.close()
+        raise
+    results = ScanResults()
+    for scanner in scanners.values():
+        scanner.add_listener(results.add, keep_results=False)
+        if on_event is not None:
+            scanner.add_listener(on_event)
+    await AsyncScanEngine(list(scanners.values()), pool).run()
+    results.sort()
+    return results
@@ -1,52 +1,333 @@
 import selectors
+import time
 from abc import ABC, abstractmethod
-from typing import Set
+from typing import Iterable, Iterator, Any, Callable, Dict, Tuple, Optional, Union, List
 import socket
-import logging
-from collections import namedtuple
-from src.modules.imported.TimeDict import TimeDict
+from collections import namedtuple, deque
+from src.modules.structures.LruDict import LruDict
+from src.modules.structures.TimerWheel import TimerWheel
+from src.modules.structures.PortSet import PortSet
+from src.modules.structures.TargetSet import TargetSet, ip_to_int
+from src.modules.structures.Permutation import Permutation
+from src.modules.scanners.Pacer import Pacer
+from src.modules.scanners.RttEstimator import RttEstimator
+from src.modules.scanners.ScanEvent import ScanEvent
+from src.modules.scanners.ScanEngine import ScanEngine
+from src.modules.scanners.Telemetry import new_counters, RETRANSMITS, RECEIVED, MATCHED, TIMEOUTS, STATE_COUNTERS
+from src.modules.transport.BatchSocket import BatchSocket
 
-logger = logging.getLogger()
 TimedValue = namedtuple('TimedValue', ['time', 'value'])
+Probe = Tuple[str, int]
+
+
+def sorted_results(results: Iterable[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+    """
+    Sort (host, port, time) results by address and port
+    """
+    return sorted(results, key=lambda result: (ip_to_int(result[0]), result[1]))
 
 
 class BaseScanner(ABC):
     """ Base class for scanners """
+    PROTOCOL = ''
+    RTT_SUBNETS = 4096
+    """ /24 subnets with a round trip time estimate, the least recently used one is forgotten beyond it """
 
-    def __init__(self, ip, ports: Set[int], timeout: float):
+    def __init__(self, targets: Union[TargetSet, str], ports: Iterable[int], timeout: float, rate: float = 0,
+                 adaptive: bool = False, retries: int = 0, seed: int = None, batch_size: int = 64,
+                 shard: Tuple[int, int] = (0, 1)):
         """
         Initialize scanner
+        :param targets: hosts to scan, TargetSet or string with comma separated addresses, networks and ranges
+        :param ports: ports to scan on every host, PortSet or any iterable of ports
+        :param seed: seed of the host x port permutation, random by default
+        :param batch_size: maximum number of packets per sendmmsg/recvmmsg call
+        :param shard: (index, count) - scan only every count-th probe of the permutation starting at index,
+                      scanners with the same seed and different indexes scan disjoint parts
         """
-        self.localhost = \
-            [l for l in
-             ([ip for ip in socket.gethostbyname_ex(socket.gethostname())[2] if
-               not ip.startswith("127.")][:1],
-              [[(s.connect(('8.8.8.8', 53)), s.getsockname()[0], s.close()) for
-                s in
-                [socket.socket(socket.AF_INET, socket.SOCK_DGRAM)]][0][1]]) if
-             l][0][0]
-        self.port_states = TimeDict(timeout, timeout)
+        self.localhost: Optional[str] = None
+        """ source address of all probes, chosen per target from the routing table when None """
+        self.port_states = TimerWheel(timeout, self._expired)
+        self.pacer = Pacer(rate, adaptive)
         self.timeout = timeout
-        self.ip = ip
-        self.ports = ports
+        self.retries = retries
+        self.retransmit = deque()
+        self.rtt: LruDict = LruDict(self.RTT_SUBNETS)
+        """ /24 subnet -> RttEstimator, hosts of a subnet are usually behind the same path """
+        self.targets = targets if isinstance(targets, TargetSet) else TargetSet.parse([targets])
+        self.ports = PortSet.from_ports(ports)
+        self.permutation = Permutation(len(self.targets) * len(self.ports), seed)
+        self.shard = shard
+        self.position = shard[0]
+        self.batch_size = batch_size
+        self.batches: Dict[socket.socket, BatchSocket] = {}
+        self.listeners: List[Callable[[ScanEvent], None]] = [self.store_result]
+        self.counters = new_counters()
 
     @abstractmethod
     def write_package(self, sock: selectors.SelectorKey.fileobj):
         """
-        Send package to (ip, port) specified in sock
+        Queue package to (ip, port) into batch of sock, it is sent by batch(sock).flush()
+        """
+        pass
+
+    @abstractmethod
+    def handle_package(self, sock: selectors.SelectorKey.fileobj, data: bytes, address: Tuple[str, int],
+                       finish: float):
+        """
+        Handle package received from address on sock at finish time
         """
         pass
 
     @abstractmethod
+    def store_result(self, event: ScanEvent):
+        """
+        Keep result event for results()
+        """
+        pass
+
+    def add_listener(self, listener: Callable[[ScanEvent], None], keep_results: bool = True):
+        """
+        Call listener with every result event
+        :param keep_results: keep results for results(), memory grows with the number of results
+        """
+        if not keep_results and self.store_result in self.listeners:
+            self.listeners.remove(self.store_result)
+        self.listeners.append(listener)
+
+    def emit(self, probe: Probe, state: str, time_to_answer: Optional[float] = None, service: str = ''):
+        """
+        Report final state of probe
+        """
+        event = ScanEvent(self.PROTOCOL, probe[0], probe[1], state,
+                          0 if time_to_answer is None else round(time_to_answer * 1000), service)
+        self.counters[STATE_COUNTERS[state]] += 1
+        for listener in self.listeners:
+            listener(event)
+
+    def update_filter(self):
+        """
+        Attach kernel filters that pass only replies from the current targets
+        """
+        pass
+
+    def set_targets(self, targets: TargetSet):
+        """
+        Replace targets before the scan starts, kernel filters are regenerated
+        """
+        self.targets = targets
+        self.permutation = Permutation(len(self.targets) * len(self.ports), self.permutation.seed)
+        self.position = self.shard[0]
+        self.update_filter()
+
+    def filter_stats(self) -> str:
+        """
+        Packets received by the host and delivered to the scanner
+        """
+        return ''
+
+    def batch(self, sock: socket.socket) -> BatchSocket:
+        """
+        Batched I/O wrapper of scanner socket
+        """
+        batch = self.batches.get(sock)
+        if batch is None:
+            batch = self.batches[sock] = BatchSocket(sock, self.batch_size, on_error=self.on_send_error)
+        return batch
+
     def read_package(self, sock: selectors.SelectorKey.fileobj):
         """
-        Recv package from (ip, port) specified in sock
+        Recv all waiting packages from sock
+        """
+        packages = self.batch(sock).recv()
+        finish = time.perf_counter()
+        self.counters[RECEIVED] += len(packages)
+        for data, address in packages:
+            self.handle_package(sock, data, address, finish)
+
+    @abstractmethod
+    def sockets(self) -> List[socket.socket]:
+        """
+        Sockets of the scanner, probes are sent to write_socket
         """
         pass
 
     @abstractmethod
+    def results(self):
+        """
+        Scan results
+        """
+        pass
+
     def start_scan(self):
         """
         Start scanning
         """
+        ScanEngine([self]).run()
+        return self.results()
+
+    def is_finished(self) -> bool:
+        """
+        All ports are sent and answered or timed out
+        """
+        return not self.has_probes() and len(self.port_states) == 0
+
+    def has_probes(self) -> bool:
+        """
+        There are ports to send or to retransmit
+        """
+        return self.position < len(self.permutation) or len(self.retransmit) > 0
+
+    def probe_ready(self) -> bool:
+        """
+        A probe can be sent now, scanners pacing their targets may hold probes back
+        """
+        return self.has_probes()
+
+    def probe_delay(self) -> Optional[float]:
+        """
+        Seconds until a held back probe can be sent, None if no probe is held back
+        """
+        return None
+
+    def next_probe(self) -> Tuple[Probe, int]:
+        """
+        Next (host, port) to send in permutation order, retransmissions go first
+        :return: (host, port) and attempt number
+        """
+        if self.retransmit:
+            return self.retransmit.popleft()
+        index = self.permutation[self.position]
+        self.position += self.shard[1]
+        hosts = len(self.targets)
+        return (self.targets[index % hosts], self.ports[index // hosts]), 0
+
+    def pending_probes(self) -> Iterator[Probe]:
+        """
+        Probes taken from the permutation whose state is not final yet
+        """
+        yield from self.port_states
+        for probe, _ in self.retransmit:
+            yield probe
+
+    def snapshot(self) -> dict:
+        """
+        Progress of the scan for a checkpoint: permutation position and pending probes as [host, port],
+        the state of pending probes is not known, they are sent again on restore
+        """
+        return {'position': self.position, 'pending': [[host, port] for host, port in self.pending_probes()]}
+
+    def restore(self, state: dict):
+        """
+        Continue the scan from snapshot() of a scanner with the same targets, ports, seed and shard
+        """
+        self.position = state['position']
+        self.retransmit.extend(((host, port), 0) for host, port in state['pending'])
+
+    def rtt_estimator(self, ip: str) -> RttEstimator:
+        """
+        Round trip time estimator of the /24 subnet of the target
+        """
+        subnet = ip.rpartition('.')[0]
+        estimator = self.rtt.get(subnet)
+        if estimator is None:
+            estimator = self.rtt[subnet] = RttEstimator(self.timeout)
+        return estimator
+
+    def max_timeout(self) -> float:
+        """
+        Largest first-attempt timeout over the subnets seen recently
+        """
+        return max((estimator.timeout() for estimator in self.rtt.values()), default=self.timeout)
+
+    def probe_sent(self, probe: Probe, attempt: int):
+        """
+        Remember probe in flight with timeout from the target round trip time
+        """
+        timeout = self.rtt_estimator(probe[0]).timeout(attempt)
+        self.port_states.set(probe, TimedValue(time.perf_counter(), attempt), timeout)
+        if attempt:
+            self.counters[RETRANSMITS] += 1
+
+    def probe_answered(self, probe: Probe, finish: float) -> Optional[float]:
+        """
+        Forget answered probe
+        :return: time to answer in seconds, None if the probe is not in flight
+        """
+        state = self.port_states.pop(probe)
+        if state is None:
+            return None
+        self.counters[MATCHED] += 1
+        time_to_answer = finish - state.time
+        if state.value == 0:
+            # Karn's algorithm: retransmitted probes are ambiguous and not sampled
+            self.rtt_estimator(probe[0]).sample(time_to_answer)
+        self.pacer.on_reply()
+        return time_to_answer
+
+    def select_timeout(self):
+        """
+        Time until the next in-flight probe expires
+        """
+        return self.port_states.next_timeout()
+
+    def _expired(self, key: Any, value: Any):
+        self.counters[TIMEOUTS] += 1
+        self.on_timeout(key, value)
+
+    def on_timeout(self, key: Any, value: Any):
+        """
+        Probe was not answered in time, retransmit it if attempts are left
+        """
+        self.pacer.on_timeout()
+        if value.value < self.retries:
+            self.retransmit.append((key, value.value + 1))
+        else:
+            self.on_no_answer(key)
+
+    def on_send_error(self, probe: Probe, code: int):
+        """
+        Probe could not be sent to its target (e.g. a broadcast address or no route), it is not retransmitted
+        """
+        if self.port_states.pop(probe) is not None:
+            self.on_no_answer(probe)
+
+    def on_no_answer(self, probe: Probe):
+        """
+        Probe was not answered after all retransmissions
+        """
         pass
+
+    def sample(self) -> List[int]:
+        """
+        Counters of the scanner followed by kernel drops of its sockets and ports taken from the scan order
+        """
+        values = self.counters.tolist()
+        values.append(sum(batch.dropped() for batch in self.batches.values()))
+        values.append((self.position - self.shard[0]) // self.shard[1])
+        return values
+
+    def register(self, sel: selectors.BaseSelector):
+        """
+        Register scanner sockets in selector with the scanner as data, write_socket for reading and writing
+        """
+        for sock in self.sockets():
+            events = selectors.EVENT_READ
+            if sock is self.write_socket:
+                events |= selectors.EVENT_WRITE
+            sel.register(sock, events, self)
+
+    def unregister(self, sel: selectors.BaseSelector):
+        """
+        Unregister scanner sockets from selector
+        """
+        for sock in self.sockets():
+            sel.unregister(sock)
+
+    def close(self):
+        """
+        Close scanner sockets
+        """
+        self.port_states.destroy()
+        for sock in self.sockets():
+            sock.close()
@@ -0,0 +1,138 @@
+import dataclasses
+import json
+import os
+from typing import Dict, Iterator
+from src.modules.console.DataArguments import DataArguments
+from src.modules.scanners.ScanEvent import ScanEvent, CLOSED
+from src.modules.structures.PortSet import PortSet
+from src.modules.structures.TargetSet import TargetSet
+
+CHECKPOINT_VERSION = 1
+
+
+def args_to_dict(args: DataArguments) -> dict:
+    """
+    Scan configuration in json form
+    """
+    data = dataclasses.asdict(args)
+    data['targets'] = [list(interval) for interval in args.targets.intervals]
+    data['ports'] = {protocol: [list(interval) for interval in ports.intervals]
+                     for protocol, ports in args.ports.items()}
+    return data
+
+
+def args_from_dict(data: dict) -> DataArguments:
+    """
+    Scan configuration from args_to_dict() form
+    """
+    data = dict(data)
+    data['targets'] = TargetSet((start, end) for start, end in data['targets'])
+    data['ports'] = {protocol: PortSet((first, last) for first, last in ranges)
+                     for protocol, ranges in data['ports'].items()}
+    names = {field.name for field in dataclasses.fields(DataArguments)}
+    return DataArguments(**{name: value for name, value in data.items() if name in names})
+
+
+class Checkpoint:
+    """
+    Scan progress saved to a small json file: configuration, and for every shard and scanner the
+    permutation position and the pending (in flight, waiting for retransmission) probes.
+    Results are appended to a log next to it (path + '.results', one json event per line) as they
+    arrive, the checkpoint keeps the length of the log it is consistent with, so writing a checkpoint
+    does not depend on the number of results. The log is flushed to disk before the checkpoint and the
+    checkpoint is replaced atomically, so a crash leaves either the previous or the new one
+    """
+    def __init__(self, path: str, args: DataArguments, shards: Dict[int, Dict[str, dict]] = None,
+                 results_length: int = 0, complete: bool = False):
+        """
+        :param path: checkpoint file
+        :param args: scan configuration, the seed must be set
+        :param shards: shard index -> protocol -> scanner snapshot
+        :param results_length: length of the results log in bytes
+        """
+        self.path = path
+        self.args = args
+        self.shards = shards or {}
+        self.results_length = results_length
+        self.complete = complete
+        self.log = None
+        self._config = None
+
+    @property
+    def results_path(self) -> str:
+        return self.path + '.results'
+
+    @classmethod
+    def load(cls, path: str) -> 'Checkpoint':
+        """
+        Read checkpoint, raises ValueError if it can not be read
+        """
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != CHECKPOINT_VERSION:
+                raise ValueError(f'unsupported version {data.get("version")}')
+            shards = {int(shard): state for shard, state in data['shards'].items()}
+            return cls(path, args_from_dict(data['args']), shards, data['results'], data['complete'])
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'Can not read checkpoint {path}: {e}')
+
+    def results(self) -> Iterator[ScanEvent]:
+        """
+        Result events saved before the checkpoint
+        """
+        try:
+            with open(self.results_path, 'rb') as f:
+                data = f.read(self.results_length)
+        except FileNotFoundError:
+            return
+        for line in data.splitlines():
+            yield ScanEvent(*json.loads(line))
+
+    def open(self):
+        """
+        Open results log for appending, results after the checkpoint are dropped
+        """
+        self.log = open(self.results_path, 'ab')
+        self.log.truncate(self.results_length)
+        self.log.seek(self.results_length)
+
+    def record(self, event: ScanEvent):
+        """
+        Append result event to the log, closed ports are not kept
+        """
+        if event.state != CLOSED:
+            self.log.write(json.dumps(list(event)).encode() + b'\n')
+
+    def update(self, shard: int, state: Dict[str, dict]):
+        """
+        Save progress of shard, events before it must be recorded already
+        """
+        self.shards[shard] = state
+        self.save()
+
+    def save(self, complete: bool = False):
+        """
+        Write checkpoint for the recorded results and the last progress of every shard
+        """
+        self.complete = complete
+        if self.log is not None:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.results_length = self.log.tell()
+        if self._config is None:
+            self._config = args_to_dict(self.args)
+        data = {'version': CHECKPOINT_VERSION, 'args': self._config,
+                'shards': {str(shard): state for shard, state in self.shards.items()},
+                'results': self.results_length, 'complete': complete}
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, separators=(',', ':')))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
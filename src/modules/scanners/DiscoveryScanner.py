@@ -0,0 +1,186 @@
+import os
+import selectors
+import socket
+import struct
+import sys
+from random import randint
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from src.modules.protocols.ICMP import ICMP, ECHO_REPLY
+from src.modules.protocols.TCPPackage import TCPPackage, TCPTemplate
+from src.modules.scanners.BaseScanner import BaseScanner, Probe
+from src.modules.scanners.ScanEngine import ScanEngine
+from src.modules.scanners.ScanEvent import ScanEvent, OPEN
+from src.modules.structures.TargetSet import TargetSet, ip_to_int
+from src.modules.transport.BpfFilter import tcp_reply_filter, icmp_echo_reply_filter, attach_filter
+from src.modules.transport.Routes import source_address
+
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+_IP_HEADER = struct.Struct('!BBHHHBBH4s4s')
+SO_SNDBUFFORCE = getattr(socket, 'SO_SNDBUFFORCE', 32)
+SEND_BUFFER = 4 * 1024 * 1024
+""" probes to on-link addresses nobody owns wait for ARP, about 3 seconds, and are charged to the send buffer """
+
+
+class Method(NamedTuple):
+    name: str
+    protocol: int
+    port: int = 0
+    flags: int = 0
+
+
+METHODS = (
+    Method('echo', socket.IPPROTO_ICMP),
+    Method('syn/443', socket.IPPROTO_TCP, 443, TCP_SYN),
+    Method('syn/80', socket.IPPROTO_TCP, 80, TCP_SYN),
+    Method('ack/80', socket.IPPROTO_TCP, 80, TCP_ACK),
+)
+""" probes sent to every host, hosts that drop ICMP echo usually answer one of the tcp probes """
+
+
+class DiscoveryScanner(BaseScanner):
+    """
+    Host discovery on the scanner engine: every target gets an ICMP echo request, TCP SYN to 443 and 80
+    and TCP ACK to 80 in one randomized pass. Any answer (echo reply, SYN-ACK or RST) marks the host
+    up, its remaining probes are not sent. Probes are (host, method) with methods numbered from 1 in
+    place of ports. All probes are sent with full IP headers through one IPPROTO_RAW socket,
+    answers are read from raw ICMP and TCP sockets with kernel filters
+    """
+    PROTOCOL = 'host'
+    SOURCE_PORTS = (40001, 40999)
+
+    def __init__(self, targets: Union[TargetSet, str], timeout: float = 1.0, rate: float = 0, retries: int = 1,
+                 seed: int = None, batch_size: int = 64):
+        """
+        :param targets: hosts to check
+        :param timeout: timeout of every probe
+        :param rate: maximum probes per second, 0 is unlimited
+        :param retries: retransmissions of unanswered probes
+        """
+        super().__init__(targets, range(1, len(METHODS) + 1), timeout, rate, False, retries, seed, batch_size)
+        self.identifier = os.getpid() & 0xffff
+        self.echo = ICMP.echo_request(self.identifier)
+        self.templates: Dict[Tuple[str, int], TCPTemplate] = {}
+        """ (source address, flags) -> template, the target is patched into every package """
+        self.live: Dict[str, Tuple[int, str]] = {}
+        """ host -> time to answer in ms and method that found it """
+        self.ready: Optional[Tuple[Probe, int]] = None
+        try:
+            self.raw_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+            self.icmp_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        except PermissionError:
+            print('Requires root privileges')
+            sys.exit()
+        for sock in self.sockets():
+            sock.setblocking(False)
+        try:
+            self.raw_socket.setsockopt(socket.SOL_SOCKET, SO_SNDBUFFORCE, SEND_BUFFER)
+        except OSError:
+            self.raw_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        # whole networks are usually given, sending to their broadcast address must not fail the scan
+        self.raw_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.write_socket = self.raw_socket
+        self.update_filter()
+
+    def update_filter(self):
+        """
+        Pass only echo replies with our identifier and SYN-ACK or RST to our source ports from targets
+        """
+        attach_filter(self.icmp_socket, icmp_echo_reply_filter(self.targets.intervals, self.identifier))
+        attach_filter(self.tcp_socket, tcp_reply_filter(self.targets.intervals, self.SOURCE_PORTS))
+
+    def packet(self, ip: str, method: Method) -> bytes:
+        """
+        IP packet of method to ip, the kernel fills in the IP checksum and identification
+        """
+        source = source_address(ip)
+        if method.protocol == socket.IPPROTO_ICMP:
+            payload = self.echo
+        else:
+            template = self.templates.get((source, method.flags))
+            if template is None:
+                template = self.templates[source, method.flags] = TCPTemplate(source, ip, method.flags)
+            payload = template.build(randint(*self.SOURCE_PORTS), method.port, to_host=ip)
+        header = _IP_HEADER.pack(0x45, 0, 20 + len(payload), 0, 0, 64, method.protocol, 0,
+                                 socket.inet_aton(source), socket.inet_aton(ip))
+        return header + payload
+
+    def write_package(self, sock: selectors.SelectorKey.fileobj):
+        if self.probe_ready():
+            probe, attempt = self.next_probe()
+            self.batch(sock).queue(self.packet(probe[0], METHODS[probe[1] - 1]), (probe[0], 0))
+            self.probe_sent(probe, attempt)
+
+    def has_probes(self) -> bool:
+        return super().has_probes() or self.ready is not None
+
+    def probe_ready(self) -> bool:
+        """
+        Take the next probe of a host that has not answered yet
+        """
+        while self.ready is None and super().has_probes():
+            probe, attempt = super().next_probe()
+            if probe[0] not in self.live:
+                self.ready = probe, attempt
+        return self.ready is not None
+
+    def next_probe(self) -> Tuple[Probe, int]:
+        if not self.probe_ready():
+            raise IndexError('no probe can be sent now')
+        probe, self.ready = self.ready, None
+        return probe
+
+    def handle_package(self, sock: selectors.SelectorKey.fileobj, data: bytes, address: Tuple[str, int],
+                       finish: float):
+        """
+        Any answer of a host that was not seen yet marks it up, answers after the timeout count as well
+        """
+        host = address[0]
+        if host in self.live or host not in self.targets:
+            return
+        if sock is self.icmp_socket:
+            icmp = ICMP(data)
+            if icmp.decode_icmp_type() != ECHO_REPLY or icmp.get_echo_identifier() != self.identifier:
+                return
+            method = 1
+        else:
+            tcp_package = TCPPackage.tcp_head_parse(data[20:])
+            if not self.SOURCE_PORTS[0] <= tcp_package.to_port <= self.SOURCE_PORTS[1]:
+                return
+            # RST without ACK only answers the ACK probe
+            syn = 2 if tcp_package.from_port == 443 else 3
+            method = syn if tcp_package.flag_ack else 4
+        self.host_up(host, method, finish)
+
+    def host_up(self, host: str, method: int, finish: float):
+        """
+        Forget probes of host in flight and report it up
+        """
+        time_to_answer = self.probe_answered((host, method), finish)
+        for other in range(1, len(METHODS) + 1):
+            if other != method:
+                self.port_states.pop((host, other))
+        self.emit((host, method), OPEN, time_to_answer, METHODS[method - 1].name)
+
+    def store_result(self, event: ScanEvent):
+        self.live[event.host] = (event.rtt, event.service)
+
+    def sockets(self) -> List[socket.socket]:
+        return [self.raw_socket, self.icmp_socket, self.tcp_socket]
+
+    def results(self) -> TargetSet:
+        """
+        :return: hosts that answered
+        """
+        return TargetSet((ip_to_int(host), ip_to_int(host)) for host in self.live)
+
+
+def discover(targets: TargetSet, timeout: float = 1.0, rate: float = 0, retries: int = 1,
+             batch_size: int = 64) -> TargetSet:
+    """
+    Hosts of targets that answer any discovery probe
+    """
+    scanner = DiscoveryScanner(targets, timeout, rate, retries, batch_size=batch_size)
+    ScanEngine([scanner]).run()
+    return scanner.results()
@@ -0,0 +1,131 @@
+from collections import deque
+from typing import Dict, Optional
+from src.modules.scanners.Pacer import TokenBucket
+
+PACED = 'paced'
+RELEASED = 'released'
+
+
+class IcmpRateLimit:
+    """
+    ICMP error budget of one target. Hosts and routers send port unreachables from a token bucket
+    (Linux: icmp_ratelimit, one per second per destination after a burst of 6), so once the burst
+    is spent closed ports go silent and look filtered.
+    Limiting is suspected when a probe times out after the target answered other probes with
+    unreachables. Probes to the target are then paced by a token bucket whose rate starts at the
+    Linux default and grows with every unreachable like TCP slow start, up to twice the observed rate
+    of unreachables so that it cannot run away from the answers. Silent probes are re-probed;
+    a re-probe answered by an unreachable proves that the target dropped the first one, and if that
+    one was paced the rate is set to the observed rate, i.e. the token rate of the target while its
+    bucket is empty, and only grows slowly after that.
+    If re-probes of silent ports are never answered, the ports are filtered rather than rate
+    limited and pacing is released
+    """
+    INITIAL_RATE = 1.0
+    """ unreachables per second when limiting is suspected """
+    MIN_RATE = 0.5
+    SLOW_START = 2.0
+    """ limit of the rate until the first paced probe is lost, times the observed rate """
+    GROWTH = 1.05
+    """ limit of the rate after that """
+    WINDOW = 1.0
+    """ seconds over which the rate of unreachables is observed """
+    HEADROOM = 0.9
+    """ fraction of the measured rate to send at """
+    VERIFY = 8
+    """ silent re-probes without any recovered probe that release pacing """
+    REPROBES = 3
+    """ extra attempts of silent probes to a limited target """
+
+    def __init__(self):
+        self.state = None
+        self.rate = None
+        self.bucket: Optional[TokenBucket] = None
+        self.paced_since = None
+        self.slow_start = True
+        self.arrivals = deque(maxlen=4096)
+        """ arrival times of unreachables """
+        self.suspects: Dict[int, Optional[float]] = {}
+        """ re-probed silent ports with send time of the last silent probe if it was paced """
+        self.last_cut = 0.0
+        self.recovered = 0
+        self.silent_again = 0
+
+    def _set_rate(self, rate: float):
+        self.rate = max(self.MIN_RATE, rate)
+        self.bucket.rate = self.rate
+
+    def _observed(self, now: float) -> float:
+        """
+        Unreachables per second in the last WINDOW seconds
+        """
+        count = 0
+        for arrival in reversed(self.arrivals):
+            if arrival < now - self.WINDOW:
+                break
+            count += 1
+        return count / self.WINDOW
+
+    def on_error(self, port: int, sent: float, now: float):
+        """
+        Probe to port sent at sent time was answered by port unreachable
+        """
+        self.arrivals.append(now)
+        recovered = port in self.suspects
+        lost = self.suspects.pop(port, None)
+        self.recovered += recovered
+        if self.state != PACED:
+            return
+        # the sending rate while it is below the target rate, the target rate above it
+        observed = self._observed(now)
+        if lost is not None and lost >= self.last_cut:
+            # the target dropped a paced probe, so its bucket is empty; probes sent before the cut do not cut again
+            self.slow_start = False
+            self.last_cut = now
+            self._set_rate(observed * self.HEADROOM)
+        elif sent >= self.paced_since:
+            # grow towards the limit, the rate gets ahead of the answers by at most that factor
+            limit = max(observed, self.INITIAL_RATE) * (self.SLOW_START if self.slow_start else self.GROWTH)
+            self._set_rate(max(self.rate, min(self.rate * 1.25, limit)))
+
+    def on_silent(self, port: int, sent: float, now: float, attempt: int, retries: int) -> bool:
+        """
+        Probe to port sent at sent time was not answered
+        :param attempt: attempt number of the probe
+        :param retries: retransmissions allowed without rate limiting
+        :return: True if the probe is to be sent again when the target allows
+        """
+        if not self.arrivals or self.state == RELEASED:
+            return False
+        if port in self.suspects:
+            self.silent_again += 1
+            if self.recovered == 0 and self.silent_again >= self.VERIFY:
+                self.state = RELEASED
+                self.suspects.clear()
+                return False
+        elif self.state is None:
+            self.state = PACED
+            self.rate = self.INITIAL_RATE
+            self.bucket = TokenBucket(self.rate, 1)
+            self.paced_since = now
+        if attempt >= retries + self.REPROBES:
+            self.suspects.pop(port, None)
+            return False
+        self.suspects[port] = sent if sent >= self.paced_since else None
+        return True
+
+    def admit(self) -> bool:
+        """
+        Take permission to send a probe to the target
+        """
+        return self.state != PACED or self.bucket.consume()
+
+    def delay(self) -> float:
+        """
+        Seconds until admit() can succeed
+        """
+        return self.bucket.delay() if self.state == PACED else 0.0
+
+    @property
+    def limited(self) -> bool:
+        return self.state == PACED
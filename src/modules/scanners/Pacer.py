@@ -0,0 +1,149 @@
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """ Token bucket limiting the number of probes per second """
+    def __init__(self, rate: float, burst: float = None):
+        """
+        :param rate: tokens (probes) per second
+        :param burst: bucket size, 1/100 of a second of traffic by default
+        """
+        self.rate = rate
+        self.burst = burst or max(1.0, rate / 100)
+        self.tokens = self.burst
+        self.last = time.perf_counter()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def consume(self) -> bool:
+        """
+        Take one token if there is one
+        """
+        self._refill(time.perf_counter())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self) -> float:
+        """
+        Seconds until the next token
+        """
+        self._refill(time.perf_counter())
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Pacer:
+    """
+    Send rate control for the scan loop: optional token bucket (--rate) and optional
+    adaptive in-flight window (--adaptive) that grows like TCP slow start / congestion
+    avoidance while replies keep coming and halves when the reply ratio of the last
+    window falls below the best one seen, i.e. when probes or replies are being dropped
+    """
+    def __init__(self, rate: float = 0, adaptive: bool = False, window: float = 16,
+                 max_window: float = 65536, drop_threshold: float = 0.1):
+        """
+        :param rate: maximum probes per second, 0 is unlimited
+        :param adaptive: limit the number of probes in flight by the congestion window
+        :param window: initial congestion window
+        :param max_window: maximum congestion window
+        :param drop_threshold: drop estimate at which the window is decreased
+        """
+        self.bucket = TokenBucket(rate) if rate > 0 else None
+        self.adaptive = adaptive
+        self.window = window
+        self.max_window = max_window
+        self.threshold = max_window
+        self.drop_threshold = drop_threshold
+        self.drop_rate = 0.0
+        self.best_ratio = 0.0
+        self.epoch_replies = 0
+        self.epoch_total = 0
+        self.in_flight = 0
+        self.recovery = 0
+        self.sent = 0
+        self.start = time.perf_counter()
+        self.send_rate = 0.0
+        self._rate_mark = (self.start, 0)
+
+    def can_send(self, in_flight: int) -> bool:
+        """
+        Take permission to send one probe
+        :param in_flight: number of probes waiting for an answer
+        """
+        self.in_flight = in_flight
+        if self.window_full(in_flight):
+            return False
+        if self.bucket is not None and not self.bucket.consume():
+            return False
+        return True
+
+    def window_full(self, in_flight: int) -> bool:
+        """
+        Only replies or timeouts can allow the next probe
+        """
+        return self.adaptive and in_flight >= int(self.window)
+
+    def delay(self) -> Optional[float]:
+        """
+        Seconds until the bucket allows the next probe, None if it is not rate limited
+        """
+        if self.bucket is None:
+            return None
+        return self.bucket.delay()
+
+    def on_send(self):
+        """ Probe was sent """
+        self.sent += 1
+        now = time.perf_counter()
+        mark_time, mark_sent = self._rate_mark
+        if now - mark_time >= 1:
+            self.send_rate = (self.sent - mark_sent) / (now - mark_time)
+            self._rate_mark = (now, self.sent)
+
+    def on_reply(self):
+        """ Probe was answered """
+        if self.recovery > 0:
+            self.recovery -= 1
+            return
+        if self.window < self.threshold:
+            self.window += 1
+        else:
+            self.window += 1 / self.window
+        self.window = min(self.window, self.max_window)
+        self.epoch_replies += 1
+        self._end_of_probe()
+
+    def on_timeout(self):
+        """ Probe was not answered """
+        if self.recovery > 0:
+            self.recovery -= 1
+            return
+        self._end_of_probe()
+
+    def _end_of_probe(self):
+        self.epoch_total += 1
+        if self.epoch_total < self.window:
+            return
+        ratio = self.epoch_replies / self.epoch_total
+        # best ratio slowly decays so that a part of the range with many filtered ports is not taken for drops
+        self.best_ratio = max(self.best_ratio * 0.95, ratio)
+        self.drop_rate = 1 - ratio / self.best_ratio if self.best_ratio else 0.0
+        if self.adaptive and self.drop_rate > self.drop_threshold:
+            self.threshold = max(2.0, self.window / 2)
+            self.window = self.threshold
+            # probes sent with the old window are not counted, like one decrease per RTT in TCP
+            self.recovery = self.in_flight
+        self.epoch_replies = 0
+        self.epoch_total = 0
+
+    def stats(self) -> str:
+        """
+        Current send rate, window and drop estimate
+        """
+        elapsed = time.perf_counter() - self.start
+        rate = self.send_rate or (self.sent / elapsed if elapsed else 0.0)
+        return f'rate {rate:.0f} pps, window {self.window:.0f}, drops {self.drop_rate * 100:.1f}%'
@@ -0,0 +1,290 @@
+import dataclasses
+import multiprocessing
+import queue as queue_module
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Tuple
+from src.modules.console.DataArguments import DataArguments
+from src.modules.scanners.BaseScanner import BaseScanner, sorted_results
+from src.modules.scanners.Checkpoint import Checkpoint
+from src.modules.scanners.ScanEngine import ScanEngine
+from src.modules.scanners.ScanEvent import ScanEvent, OPEN, FILTERED
+from src.modules.scanners.Telemetry import Sample
+from src.modules.scanners.TCPScanner import TCPScanner
+from src.modules.scanners.UDPScanner import UDPScanner
+
+Result = Tuple[str, int, int]
+Progress = Dict[str, dict]
+# workers send collected events at least this often, seconds
+FLUSH_INTERVAL = 0.1
+# counters of the scanners are sampled this often, seconds
+SAMPLE_INTERVAL = 0.25
+# every worker scans tcp from its own source port range, which is at least one port wide
+MAX_WORKERS = TCPScanner.SOURCE_PORTS[1] - TCPScanner.SOURCE_PORTS[0] + 1
+# the queue is polled this often for workers that died without reporting, seconds
+LIVENESS_INTERVAL = 0.5
+
+
+@dataclass
+class ScanResults:
+    """
+    Results of a scan, (host, port, time to answer in ms)
+    """
+    tcp_open: List[Result] = field(default_factory=list)
+    udp_open: List[Result] = field(default_factory=list)
+    udp_filtered: List[Result] = field(default_factory=list)
+    services: Dict[Tuple[str, str, int], str] = field(default_factory=dict)
+    """ (protocol, host, port) -> service identified during the scan """
+    info: List[str] = field(default_factory=list)
+
+    def add(self, event: ScanEvent):
+        """ Add result event, closed ports are not kept """
+        result = (event.host, event.port, event.rtt)
+        if event.service:
+            self.services[event.protocol, event.host, event.port] = event.service
+        if event.state == OPEN:
+            (self.tcp_open if event.protocol == 'tcp' else self.udp_open).append(result)
+        elif event.state == FILTERED and event.protocol == 'udp':
+            self.udp_filtered.append(result)
+
+    def sort(self):
+        """ Sort results by address and port """
+        self.tcp_open = sorted_results(self.tcp_open)
+        self.udp_open = sorted_results(self.udp_open)
+        self.udp_filtered = sorted_results(self.udp_filtered)
+
+
+def create_scanners(args: DataArguments, shard: Tuple[int, int] = (0, 1),
+                    resume: Progress = None) -> Dict[str, BaseScanner]:
+    """
+    Create scanners of one shard, the shard gets its part of the rate budget
+    :param resume: progress of the shard from a checkpoint, scanners continue from it
+    """
+    rate = args.rate / shard[1]
+    scanners = {}
+    if 'udp' in args.ports:
+        scanners['udp'] = UDPScanner(args.targets, args.ports['udp'], args.timeout, rate,
+                                     args.adaptive, args.retries, args.seed, args.batch_size, shard)
+    if 'tcp' in args.ports:
+        scanners['tcp'] = TCPScanner(args.targets, args.ports['tcp'], args.timeout, args.stateless,
+                                     rate, args.adaptive, args.retries, args.seed,
+                                     args.batch_size, args.transport, args.interface, shard)
+    for protocol, state in (resume or {}).items():
+        if protocol in scanners:
+            scanners[protocol].restore(state)
+    return scanners
+
+
+def _progress(engine: ScanEngine) -> Progress:
+    """
+    Snapshots of the scanners of one shard by protocol
+    """
+    return {scanner.PROTOCOL: scanner.snapshot() for scanner in engine.scanners}
+
+
+def _sample(engine: ScanEngine) -> Sample:
+    """
+    Counters of the scanners of one shard by protocol
+    """
+    return {scanner.PROTOCOL: scanner.sample() for scanner in engine.scanners}
+
+
+def _engine_info(engine: ScanEngine, args: DataArguments, shard: Tuple[int, int]) -> List[str]:
+    if not args.verbose:
+        return []
+    prefix = f'[worker {shard[0]}] ' if shard[1] > 1 else ''
+    return [prefix + engine.pacer.stats()] + [prefix + scanner.filter_stats() for scanner in engine.scanners]
+
+
+def scan_events(args: DataArguments, shard: Tuple[int, int] = (0, 1), info: List[str] = None,
+                resume: Progress = None, on_progress: Callable[[int, Progress], None] = None,
+                on_sample: Callable[[int, Sample], None] = None) -> Iterator[ScanEvent]:
+    """
+    Scan one shard in this process, result events are yielded as soon as port states are final
+    :param info: list to add verbose statistics to when the scan is done
+    :param resume: progress of the shard from a checkpoint
+    :param on_progress: called with shard index and progress every args.checkpoint_interval seconds
+                        and at the end, after the events before it were yielded
+    :param on_sample: called with shard index and counters of the scanners every SAMPLE_INTERVAL seconds
+                      and at the end
+    """
+    engine = ScanEngine(list(create_scanners(args, shard, resume).values()))
+    if on_progress is None and on_sample is None:
+        yield from engine.events()
+    else:
+        pending = deque()
+        for scanner in engine.scanners:
+            scanner.add_listener(pending.append, keep_results=False)
+        last_progress = last_sample = time.perf_counter()
+        for _ in engine.steps():
+            while pending:
+                yield pending.popleft()
+            now = time.perf_counter()
+            if on_progress is not None and now - last_progress >= args.checkpoint_interval:
+                on_progress(shard[0], _progress(engine))
+                last_progress = now
+            if on_sample is not None and now - last_sample >= SAMPLE_INTERVAL:
+                on_sample(shard[0], _sample(engine))
+                last_sample = now
+        if on_progress is not None:
+            on_progress(shard[0], _progress(engine))
+        if on_sample is not None:
+            on_sample(shard[0], _sample(engine))
+    if info is not None:
+        info.extend(_engine_info(engine, args, shard))
+
+
+def _worker(args: DataArguments, shard: Tuple[int, int], queue: multiprocessing.Queue, resume: Progress,
+            samples: bool):
+    try:
+        engine = ScanEngine(list(create_scanners(args, shard, resume).values()))
+        events = []
+        for scanner in engine.scanners:
+            scanner.add_listener(events.append, keep_results=False)
+        last_flush = last_progress = last_sample = time.perf_counter()
+        for _ in engine.steps():
+            now = time.perf_counter()
+            if events and now - last_flush >= FLUSH_INTERVAL:
+                queue.put((shard[0], 'events', events[:]))
+                events.clear()
+                last_flush = now
+            if samples and now - last_sample >= SAMPLE_INTERVAL:
+                queue.put((shard[0], 'sample', _sample(engine)))
+                last_sample = now
+            if args.checkpoint and now - last_progress >= args.checkpoint_interval:
+                # progress follows the events before it in the queue
+                queue.put((shard[0], 'events', events[:]))
+                events.clear()
+                queue.put((shard[0], 'progress', _progress(engine)))
+                last_progress = now
+        queue.put((shard[0], 'events', events))
+        queue.put((shard[0], 'progress', _progress(engine)))
+        if samples:
+            queue.put((shard[0], 'sample', _sample(engine)))
+        queue.put((shard[0], 'done', _engine_info(engine, args, shard)))
+    except BaseException as e:
+        queue.put((shard[0], 'error', f'{type(e).__name__}: {e}'))
+
+
+def scan_events_parallel(args: DataArguments, workers: int, info: List[str] = None,
+                         on_sample: Callable[[int, Sample], None] = None) -> Iterator[ScanEvent]:
+    """
+    Scan with several worker processes, each owns a disjoint shard of the host x port permutation,
+    its own sockets and 1/workers of the rate budget. Result events of all workers are yielded as they arrive.
+    With args.checkpoint the progress is saved to the checkpoint periodically, with args.resume the scan
+    continues from it and the results saved in it are yielded first
+    :param info: list to add verbose statistics and worker errors to
+    :param on_sample: called with shard index and counters of its scanners a few times a second
+    """
+    info = [] if info is None else info
+    if args.seed is None and (workers > 1 or args.checkpoint):
+        # every worker and a resumed scan must walk the same permutation
+        args = dataclasses.replace(args, seed=random.getrandbits(64))
+    if not args.checkpoint:
+        yield from _scan_events(args, workers, info, on_sample=on_sample)
+        return
+
+    saved = set()
+    if args.resume:
+        checkpoint = Checkpoint.load(args.checkpoint)
+        checkpoint.args = args
+        for event in checkpoint.results():
+            saved.add((event.protocol, event.host, event.port))
+            yield event
+    else:
+        checkpoint = Checkpoint(args.checkpoint, args)
+    checkpoint.open()
+    complete = False
+    try:
+        if not args.resume:
+            # a scan interrupted before the first progress update is resumed from the start
+            checkpoint.save()
+        for event in _scan_events(args, workers, info, checkpoint.shards, checkpoint.update, on_sample):
+            # probes pending at the checkpoint may have been answered before it
+            if (event.protocol, event.host, event.port) in saved:
+                continue
+            checkpoint.record(event)
+            yield event
+        checkpoint.save(complete=True)
+        complete = True
+    finally:
+        if not complete:
+            # interrupted: the last progress of every shard with all results recorded so far,
+            # results found after that progress are skipped when the scan is resumed
+            checkpoint.save()
+        checkpoint.close()
+
+
+def _scan_events(args: DataArguments, workers: int, info: List[str], resume: Dict[int, Progress] = None,
+                 on_progress: Callable[[int, Progress], None] = None,
+                 on_sample: Callable[[int, Sample], None] = None) -> Iterator[ScanEvent]:
+    resume = resume or {}
+    if workers <= 1:
+        yield from scan_events(args, info=info, resume=resume.get(0), on_progress=on_progress, on_sample=on_sample)
+        return
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_worker,
+                                         args=(args, (i, workers), queue, resume.get(i), on_sample is not None),
+                                         daemon=True)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        running = set(range(workers))
+        while running:
+            try:
+                worker, kind, payload = queue.get(timeout=LIVENESS_INTERVAL)
+            except queue_module.Empty:
+                _check_workers(processes, running, queue)
+                continue
+            if kind == 'events':
+                yield from payload
+                continue
+            if kind == 'progress':
+                if on_progress is not None:
+                    on_progress(worker, payload)
+                continue
+            if kind == 'sample':
+                on_sample(worker, payload)
+                continue
+            running.discard(worker)
+            if kind == 'error':
+                info.append(f'[worker {worker}] failed: {payload}')
+            else:
+                info.extend(payload)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+
+def _check_workers(processes: List[multiprocessing.Process], running: set, queue: multiprocessing.Queue):
+    """
+    Raise error if a worker that has not reported its end is no longer alive (e.g. killed by the OOM killer),
+    its shard would never finish and the scan would wait forever
+    """
+    for worker in sorted(running):
+        process = processes[worker]
+        if process.is_alive() or process.exitcode is None:
+            continue
+        # a worker puts its last messages into the queue before it exits, they may still be on the way
+        if not queue.empty():
+            return
+        raise RuntimeError(f'Worker of shard {worker + 1}/{len(processes)} exited with code {process.exitcode} '
+                           f'before finishing its scan')
+
+
+def scan_parallel(args: DataArguments, workers: int) -> ScanResults:
+    """
+    Scan with worker processes and collect sorted results
+    """
+    results = ScanResults()
+    for event in scan_events_parallel(args, workers, results.info):
+        results.add(event)
+    results.sort()
+    return results
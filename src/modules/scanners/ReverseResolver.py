@@ -0,0 +1,298 @@
+import json
+import os
+import random
+import selectors
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Set, Tuple
+from src.modules.protocols.DNS import PtrAnswer, RCODE_NOERROR, RCODE_NXDOMAIN, parse_ptr_answer, ptr_query, \
+    reverse_pointer
+from src.modules.structures.TimerWheel import TimerWheel
+from src.modules.transport.BatchSocket import BatchSocket
+
+RESOLV_CONF = '/etc/resolv.conf'
+DNS_PORT = 53
+CACHE_VERSION = 1
+MAX_TTL = 7 * 24 * 3600
+""" cached answers are kept at most a week whatever their TTL """
+
+
+def default_server(path: str = RESOLV_CONF) -> Optional[str]:
+    """
+    First IPv4 nameserver of the system resolver, None if there is none
+    """
+    try:
+        with open(path) as conf:
+            for line in conf:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == 'nameserver' and fields[1].count('.') == 3:
+                    return fields[1]
+    except OSError:
+        pass
+    return None
+
+
+def parse_server(spec: str) -> Tuple[str, int]:
+    """
+    Parse DNS server address: IP or IP:PORT
+    """
+    ip, _, port = spec.partition(':')
+    try:
+        # inet_aton() also takes short forms like 10.1
+        address = socket.inet_ntoa(socket.inet_aton(ip)), int(port) if port else DNS_PORT
+    except (OSError, ValueError):
+        raise ValueError(f'DNS server {spec} is not correct.')
+    if address[0] != ip or not 0 < address[1] < 65536:
+        raise ValueError(f'DNS server {spec} is not correct.')
+    return address
+
+
+def default_cache_path() -> str:
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'portscanner',
+                        'ptr-cache.json')
+
+
+class PtrCache:
+    """
+    Reverse names kept between runs as json {ip: [name or null, expiry unix time]}, a missing name
+    is a cached negative answer. Expired entries are not used and are dropped on save,
+    the file is replaced atomically and entries written by other runs meanwhile are kept
+    """
+    def __init__(self, path: Optional[str]):
+        """
+        :param path: cache file, None keeps the cache in memory only
+        """
+        self.path = path
+        self.entries: Dict[str, Tuple[Optional[str], float]] = self._read() if path else {}
+        self.changed = False
+
+    def _read(self) -> Dict[str, Tuple[Optional[str], float]]:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != CACHE_VERSION:
+                return {}
+            now = time.time()
+            return {ip: (name, expires) for ip, (name, expires) in data['names'].items() if expires > now}
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            return {}
+
+    def get(self, ip: str) -> Tuple[bool, Optional[str]]:
+        """
+        :return: whether ip is cached and its name
+        """
+        entry = self.entries.get(ip)
+        if entry is None or entry[1] <= time.time():
+            return False, None
+        return True, entry[0]
+
+    def put(self, ip: str, name: Optional[str], ttl: int):
+        if ttl > 0:
+            self.entries[ip] = (name, time.time() + min(ttl, MAX_TTL))
+            self.changed = True
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        entries = self._read()
+        for ip, entry in self.entries.items():
+            if entry[1] > entries.get(ip, (None, 0.0))[1]:
+                entries[ip] = entry
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': CACHE_VERSION, 'names': entries}, f)
+            os.replace(temp_path, self.path)
+            self.changed = False
+        except OSError:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+
+
+class ReverseResolver:
+    """
+    Reverse DNS of scanned hosts while the scan runs. Submitted hosts are answered from the cache or
+    queried in a daemon thread: PTR queries are sent to one DNS server from a single non-blocking
+    UDP socket in sendmmsg batches, up to max_in_flight at once, and replies are matched by query ID
+    and question. Unanswered queries are retransmitted with the same ID, a late reply still counts.
+    Answers are cached for their TTL, failures are not cached
+    """
+    def __init__(self, server: Tuple[str, int], cache: PtrCache, timeout: float = 1.0, retries: int = 2,
+                 max_in_flight: int = 256, batch_size: int = 64):
+        """
+        :param server: DNS server (ip, port)
+        :param timeout: seconds to wait for a reply before the query is sent again
+        :param retries: retransmissions of unanswered queries
+        """
+        self.server = server
+        self.cache = cache
+        self.timeout = timeout
+        self.retries = retries
+        self.max_in_flight = max_in_flight
+        self.names: Dict[str, Optional[str]] = {}
+        """ ip -> name, None if it has none or the lookup failed """
+        self.submitted: Set[str] = set()
+        self.incoming: Deque[str] = deque()
+        self.waiting: Deque[str] = deque()
+        self.in_flight: TimerWheel = TimerWheel(timeout, self._expired)
+        """ query id -> (ip, attempt) """
+        self.retry: 'OrderedDict[int, Tuple[str, int]]' = OrderedDict()
+        """ timed out queries to send again """
+        self.queries = 0
+        self.done = threading.Condition()
+        self.closed = False
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.batch = BatchSocket(self.sock, batch_size, 1024)
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.thread = threading.Thread(target=self._run, name='resolver', daemon=True)
+        self.thread.start()
+
+    def submit(self, ip: str):
+        """
+        Look up the name of ip unless it was submitted before, does not block
+        """
+        if ip in self.submitted:
+            return
+        cached, name = self.cache.get(ip)
+        with self.done:
+            self.submitted.add(ip)
+            if cached:
+                self.names[ip] = name
+                return
+            self.incoming.append(ip)
+        try:
+            self.wake_writer.send(b'\0')
+        except BlockingIOError:
+            # the thread has not read earlier wake ups yet, it will see this host as well
+            pass
+
+    def _run(self):
+        sel = selectors.DefaultSelector()
+        sel.register(self.sock, selectors.EVENT_READ)
+        sel.register(self.wake_reader, selectors.EVENT_READ)
+        writing = False
+        try:
+            while not self.closed:
+                with self.done:
+                    self.waiting.extend(self.incoming)
+                    self.incoming.clear()
+                self._send()
+                pending = self.batch.free < self.batch.batch_size
+                if pending != writing:
+                    sel.modify(self.sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if pending else 0))
+                    writing = pending
+                for key, mask in sel.select(timeout=self.in_flight.next_timeout()):
+                    if key.fileobj is self.wake_reader:
+                        try:
+                            while self.wake_reader.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                    elif mask & selectors.EVENT_READ:
+                        self._receive()
+                self.in_flight.expire()
+        except OSError:
+            # the socket was closed, lookups that did not finish have no name
+            pass
+        finally:
+            sel.close()
+
+    def _send(self):
+        while self.retry and self.batch.free > 0:
+            query_id, (ip, attempt) = self.retry.popitem(last=False)
+            self._query(query_id, ip, attempt)
+        while self.waiting and len(self.in_flight) + len(self.retry) < self.max_in_flight and self.batch.free > 0:
+            query_id = random.getrandbits(16)
+            while query_id in self.in_flight or query_id in self.retry:
+                query_id = random.getrandbits(16)
+            self._query(query_id, self.waiting.popleft(), 0)
+        self.batch.flush()
+
+    def _query(self, query_id: int, ip: str, attempt: int):
+        self.batch.queue(ptr_query(query_id, ip), self.server)
+        self.in_flight.set(query_id, (ip, attempt), self.timeout * 2 ** attempt)
+        self.queries += 1
+
+    def _receive(self):
+        while True:
+            packets = self.batch.recv()
+            for data, address in packets:
+                if address != self.server:
+                    continue
+                answer = parse_ptr_answer(data)
+                if answer is not None:
+                    self._answered(answer)
+            if len(packets) < self.batch.batch_size:
+                return
+
+    def _answered(self, answer: PtrAnswer):
+        # a late reply to an earlier attempt answers a query waiting for retransmission as well
+        query_id = answer.query_id
+        query = self.in_flight[query_id] if query_id in self.in_flight else self.retry.get(query_id)
+        if query is None or answer.question != reverse_pointer(query[0]):
+            return
+        self.in_flight.pop(query_id)
+        self.retry.pop(query_id, None)
+        ip = query[0]
+        if answer.rcode in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            self.cache.put(ip, answer.name, answer.ttl)
+            self._finish(ip, answer.name)
+        else:
+            self._finish(ip, None)
+
+    def _expired(self, query_id: int, query: Tuple[str, int]):
+        ip, attempt = query
+        if attempt < self.retries:
+            # sent again with the same id by the next _send()
+            self.retry[query_id] = (ip, attempt + 1)
+        else:
+            self._finish(ip, None)
+
+    def _finish(self, ip: str, name: Optional[str]):
+        with self.done:
+            self.names[ip] = name
+            self.done.notify_all()
+
+    @property
+    def lookup_timeout(self) -> float:
+        """
+        Seconds until an unanswered query gives up: the timeout doubles with every retransmission
+        """
+        return self.timeout * (2 ** (self.retries + 1) - 1)
+
+    def wait(self, timeout: float) -> Dict[str, str]:
+        """
+        Wait at most timeout seconds for submitted lookups
+        :return: names found so far by ip
+        """
+        deadline = time.perf_counter() + timeout
+        with self.done:
+            while len(self.names) < len(self.submitted):
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    break
+                self.done.wait(left)
+            return {ip: name for ip, name in self.names.items() if name is not None}
+
+    def close(self):
+        """
+        Stop lookups and save the cache
+        """
+        self.closed = True
+        try:
+            self.wake_writer.send(b'\0')
+        except OSError:
+            pass
+        self.thread.join(1.0)
+        self.sock.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
+        self.cache.save()
@@ -0,0 +1,38 @@
+class RttEstimator:
+    """
+    Round trip time estimator of one target (RFC 6298).
+    Retransmission timeout starts at max_rto and follows SRTT + 4 * RTTVAR after the first sample
+    """
+    def __init__(self, max_rto: float, min_rto: float = 0.1, alpha: float = 1 / 8, beta: float = 1 / 4,
+                 granularity: float = 0.001):
+        """
+        :param max_rto: timeout before the first sample and upper bound of timeout
+        :param min_rto: lower bound of timeout
+        """
+        self.max_rto = max_rto
+        self.min_rto = min(min_rto, max_rto)
+        self.alpha = alpha
+        self.beta = beta
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.rto = max_rto
+
+    def sample(self, rtt: float):
+        """
+        Update estimation with measured round trip time in seconds
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        rto = self.srtt + max(self.granularity, 4 * self.rttvar)
+        self.rto = min(self.max_rto, max(self.min_rto, rto))
+
+    def timeout(self, attempt: int = 0) -> float:
+        """
+        Timeout of probe with exponential backoff for retransmissions
+        """
+        return min(self.max_rto, self.rto * (2 ** attempt))
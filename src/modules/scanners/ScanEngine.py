@@ -0,0 +1,124 @@
+import selectors
+from collections import deque
+from typing import Iterator, List, Optional, TYPE_CHECKING
+from src.modules.scanners.Pacer import Pacer
+from src.modules.scanners.ScanEvent import ScanEvent
+from src.modules.scanners.Telemetry import PROBES
+
+if TYPE_CHECKING:
+    from src.modules.scanners.BaseScanner import BaseScanner
+
+
+class ScanEngine:
+    """
+    One selector loop driving the sockets of several scanners (e.g. TCP and UDP) together.
+    Probes of all scanners share one pacer, so they are interleaved under one rate budget
+    and the scan takes about as long as the slowest scanner instead of the sum of them
+    """
+    def __init__(self, scanners: List['BaseScanner'], pacer: Pacer = None):
+        """
+        :param scanners: scanners to run
+        :param pacer: shared pacer, pacer of the first scanner by default
+        """
+        self.scanners = list(scanners)
+        self.pacer = pacer or self.scanners[0].pacer
+        for scanner in self.scanners:
+            scanner.pacer = self.pacer
+        self.sel = None
+        self.writing = {}
+
+    def _in_flight(self) -> int:
+        return sum(len(scanner.port_states) for scanner in self.scanners)
+
+    def _send(self, scanner: 'BaseScanner') -> bool:
+        """
+        Send a batch of scanner probes, as many as pacer allows
+        :return: False if there was nothing to send
+        """
+        batch = scanner.batch(scanner.write_socket)
+        sent = 0
+        while batch.free > 0 and scanner.probe_ready() and self.pacer.can_send(self._in_flight()):
+            scanner.write_package(scanner.write_socket)
+            self.pacer.on_send()
+            sent += 1
+        batch.flush()
+        scanner.counters[PROBES] += sent
+        return sent > 0 or batch.free < batch.batch_size
+
+    def _set_writing(self, scanner: 'BaseScanner', writing: bool):
+        if self.writing[scanner] != writing:
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self.sel.modify(scanner.write_socket, events, scanner)
+            self.writing[scanner] = writing
+
+    def _select_timeout(self, active: List['BaseScanner']) -> Optional[float]:
+        if any(scanner.is_finished() for scanner in active):
+            # a send error may have finished the last probe of a scanner, nothing would wake the loop
+            return 0.0
+        timeouts = [scanner.select_timeout() for scanner in active]
+        for scanner in active:
+            if not self.writing[scanner] and scanner.has_probes():
+                if not scanner.probe_ready():
+                    timeouts.append(scanner.probe_delay())
+                elif not self.pacer.window_full(self._in_flight()):
+                    # a held back probe may have become ready since the last send
+                    timeouts.append(self.pacer.delay() or 0.0)
+        timeouts = [timeout for timeout in timeouts if timeout is not None]
+        return min(timeouts) if timeouts else None
+
+    def steps(self) -> Iterator[None]:
+        """
+        Selector loop, yields after every round until every scanner is finished.
+        Scanners are closed when they finish or when the loop is closed
+        """
+        self.sel = selectors.DefaultSelector()
+        for scanner in self.scanners:
+            scanner.register(self.sel)
+            self.writing[scanner] = True
+        active = list(self.scanners)
+
+        try:
+            while active:
+                for scanner in active:
+                    if not self.writing[scanner] and self._send(scanner):
+                        self._set_writing(scanner, True)
+
+                for key, mask in self.sel.select(timeout=self._select_timeout(active)):
+                    scanner = key.data
+                    if mask & selectors.EVENT_READ:
+                        scanner.read_package(key.fileobj)
+                    if mask & selectors.EVENT_WRITE and self.writing[scanner]:
+                        if not self._send(scanner):
+                            self._set_writing(scanner, False)
+
+                for scanner in list(active):
+                    scanner.port_states.expire()
+                    if scanner.is_finished():
+                        scanner.unregister(self.sel)
+                        scanner.close()
+                        active.remove(scanner)
+                yield
+        finally:
+            for scanner in active:
+                scanner.unregister(self.sel)
+                scanner.close()
+            self.sel.close()
+
+    def run(self):
+        """
+        Run selector loop until every scanner is finished, scanners are closed when they finish
+        """
+        for _ in self.steps():
+            pass
+
+    def events(self, keep_results: bool = False) -> Iterator[ScanEvent]:
+        """
+        Run selector loop yielding result events as soon as port states are final
+        :param keep_results: keep results in scanners for results() as well
+        """
+        pending = deque()
+        for scanner in self.scanners:
+            scanner.add_listener(pending.append, keep_results)
+        for _ in self.steps():
+            while pending:
+                yield pending.popleft()
@@ -0,0 +1,19 @@
+from typing import NamedTuple
+
+OPEN = 'open'
+CLOSED = 'closed'
+FILTERED = 'filtered'
+
+
+class ScanEvent(NamedTuple):
+    """
+    Final state of one probed port, emitted by scanners as soon as it is known
+    """
+    protocol: str
+    host: str
+    port: int
+    state: str
+    rtt: int
+    """ time to answer in ms, 0 for unanswered ports """
+    service: str = ''
+    """ service identified by the answer, if any """
@@ -2,24 +2,78 @@ import time
 import socket
 import sys
 import selectors
+from collections import deque
 from random import randint
-from typing import Set, List, Tuple
-from src.modules.scanners.BaseScanner import BaseScanner
-from src.modules.protocols.TCPPackage import TCPPackage
+from typing import Iterable, List, Set, Tuple, Union
+from src.modules.scanners.BaseScanner import BaseScanner, Probe, sorted_results
+from src.modules.scanners.ScanEvent import ScanEvent, OPEN, CLOSED, FILTERED
+from src.modules.scanners.Telemetry import MATCHED
+from src.modules.structures.TargetSet import TargetSet
+from src.modules.protocols.TCPPackage import TCPPackage, TCPTemplate, TCPData
+from src.modules.protocols.SynCookie import SynCookie
+from src.modules.transport.PacketRing import PacketRing
+from src.modules.transport.Routes import source_address
+from src.modules.transport.BpfFilter import tcp_reply_filter, attach_filter, KernelCounter
 
 
 class TCPScanner(BaseScanner):
     """ Async tcp port scanner """
-    def __init__(self, ip: str, ports: Set[int], timeout: float):
+    PROTOCOL = 'tcp'
+    SOURCE_PORTS = (35000, 40000)
+    MARK_INTERVAL = 0.1
+    """ seconds between (time, position) marks of stateless sending """
+
+    def __init__(self, targets: Union[TargetSet, str], ports: Iterable[int], timeout: float,
+                 stateless: bool = False, rate: float = 0, adaptive: bool = False, retries: int = 0,
+                 seed: int = None, batch_size: int = 64, transport: str = 'socket', interface: str = None,
+                 shard: Tuple[int, int] = (0, 1)):
         """
         Init tcp scanner
-        :param ip: ip address from which you need to scan the ports.
-        :param ports: ports to scan.
+        :param targets: hosts from which you need to scan the ports.
+        :param ports: ports to scan on every host.
         :param timeout: Timeout waiting for a response from (ip, port)
+        :param stateless: Match replies by SYN cookie instead of keeping state for every port
+        :param rate: Maximum probes per second, 0 is unlimited
+        :param adaptive: Limit probes in flight by congestion window
+        :param retries: Number of retransmissions of unanswered probes (stateful mode only)
+        :param seed: Seed of the host x port scan order
+        :param batch_size: Maximum number of packets per system call
+        :param transport: 'socket' for raw IPPROTO_TCP socket, 'packet' for AF_PACKET rings on interface
+        :param interface: Network interface of 'packet' transport
+        :param shard: (index, count) of the part of the scan, every part gets its own source ports
         """
-        super().__init__(ip, ports, timeout)
-        self.tcp_socket = self.create_raw_tcp_socket()
-        self.tcp_socket.setblocking(False)
+        super().__init__(targets, ports, timeout, rate, adaptive, 0 if stateless else retries, seed, batch_size,
+                         shard)
+        first, last = self.SOURCE_PORTS
+        width = (last - first + 1) // shard[1]
+        if width == 0:
+            raise ValueError(f'Shard count {shard[1]} is not correct, at most {last - first + 1} shards '
+                             f'get their own source ports.')
+        self.source_ports = (first + shard[0] * width, first + (shard[0] + 1) * width - 1)
+        self.ring = None
+        if transport == 'packet':
+            self.ring = self.create_packet_ring(interface, batch_size)
+            self.localhost = self.ring.source_ip
+            self.tcp_socket = self.ring.sock
+            self.batches[self.tcp_socket] = self.ring
+        else:
+            self.tcp_socket = self.create_raw_tcp_socket()
+            self.tcp_socket.setblocking(False)
+        self.write_socket = self.tcp_socket
+        self.kernel_counter = KernelCounter(socket.IPPROTO_TCP)
+        self.update_filter()
+        self.templates = {}
+        """ source address -> SYN template, the target is patched into every package """
+        self.stateless = stateless
+        self.cookie = SynCookie(timeout) if stateless else None
+        self.last_send = time.perf_counter()
+        self.marks = deque(maxlen=4096)
+        # replies are matched by cookie for max_age after the probe, duplicates are dropped with two
+        # sets swapped every max_age, so an answer is remembered at least that long and memory stays
+        # bounded by the answers of the last two windows
+        self.answered: Set[Probe] = set()
+        self.answered_before: Set[Probe] = set()
+        self.answered_since = time.perf_counter()
         self.answer = set()
 
     def create_raw_tcp_socket(self):
@@ -34,53 +88,163 @@ class TCPScanner(BaseScanner):
         except Exception as e:
             print(e)
             sys.exit()
+        # whole networks are usually given, sending to their broadcast address must not fail the scan
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         return sock
 
+    def update_filter(self):
+        """
+        Pass only SYN-ACK and RST from targets to our source ports
+        """
+        program = tcp_reply_filter(self.targets.intervals, self.source_ports, 14 if self.ring else 0)
+        self.filtered = attach_filter(self.tcp_socket, program)
+
+    def filter_stats(self) -> str:
+        received = self.kernel_counter.received()
+        delivered = self.batch(self.tcp_socket).packets_received
+        if not self.filtered or received is None:
+            return f'TCP: {delivered} packets delivered, kernel filter is not available'
+        return f'TCP: {delivered} of {received} packets delivered, {max(0, received - delivered)} filtered in kernel'
+
+    def create_packet_ring(self, interface: str, batch_size: int) -> PacketRing:
+        """
+        Create AF_PACKET transport for tcp on interface
+        """
+        try:
+            return PacketRing(interface, socket.IPPROTO_TCP, batch_size=batch_size, on_error=self.on_send_error)
+        except PermissionError:
+            print('Requires root privileges')
+            sys.exit()
+        except OSError as e:
+            print(f'Can not open packet ring on {interface}: {e}')
+            sys.exit()
+
     def write_package(self, sock: selectors.SelectorKey.fileobj):
         """
-        Send package to (ip, port)
+        Queue package to (ip, port)
         :param sock: Socket
         """
-        if len(self.ports) > 0:
-            cur_port = self.ports.pop()
-            package = TCPPackage(self.localhost, randint(35000, 40000), self.ip, cur_port, 2).build()
-            sock.sendto(package, (self.ip, cur_port))
-            self.port_states[cur_port] = time.perf_counter()
+        if self.has_probes():
+            (ip, cur_port), attempt = self.next_probe()
+            source = self.localhost or source_address(ip)
+            template = self.templates.get(source)
+            if template is None:
+                template = self.templates[source] = TCPTemplate(source, ip, 2)
+            from_port = randint(*self.source_ports)
+            if self.stateless:
+                package = template.build(from_port, cur_port, self.cookie.make(ip, cur_port, from_port), ip)
+                self.batch(sock).queue(package, (ip, cur_port))
+                self.last_send = time.perf_counter()
+                if not self.marks or self.last_send - self.marks[-1][0] >= self.MARK_INTERVAL:
+                    self.marks.append((self.last_send, self.position))
+            else:
+                package = template.build(from_port, cur_port, to_host=ip)
+                self.batch(sock).queue(package, (ip, cur_port))
+                self.probe_sent((ip, cur_port), attempt)
 
-    def read_package(self, sock: selectors.SelectorKey.fileobj):
+    def handle_package(self, sock: selectors.SelectorKey.fileobj, data: bytes, address: Tuple[str, int],
+                       finish: float):
         """
-        Recv package from (ip, port)
+        Handle package from (ip, port)
         """
-        data, address = sock.recvfrom(1024)
-        finish = time.perf_counter()
-        if address[0] == self.ip:
+        if address[0] in self.targets:
             tcp_package = TCPPackage.tcp_head_parse(data[20:])
-            if tcp_package.from_port in self.port_states:
+            probe = (address[0], tcp_package.from_port)
+            if self.stateless:
+                self.check_cookie(address[0], tcp_package, finish)
+            elif probe in self.port_states:
                 if tcp_package.flag_syn and tcp_package.flag_ack:
-                    time_to_answer = finish - self.port_states[tcp_package.from_port]
-                    if self.timeout - time_to_answer > 0:
-                        self.answer.add((tcp_package.from_port, round(time_to_answer * 1000)))
-                        self.port_states.__delitem__(tcp_package.from_port)
+                    self.emit(probe, OPEN, self.probe_answered(probe, finish))
                 elif tcp_package.flag_rst and tcp_package.flag_ack:
-                    self.port_states.__delitem__(tcp_package.from_port)
+                    self.emit(probe, CLOSED, self.probe_answered(probe, finish))
+
+    def check_cookie(self, ip: str, tcp_package: TCPData, finish: float):
+        """
+        Match reply by SYN cookie, replies without valid acknowledgment are dropped
+        """
+        probe = (ip, tcp_package.from_port)
+        if finish - self.answered_since >= self.cookie.max_age:
+            windows = int((finish - self.answered_since) // self.cookie.max_age)
+            self.answered_before = self.answered if windows == 1 else set()
+            self.answered = set()
+            self.answered_since += windows * self.cookie.max_age
+        if not tcp_package.flag_ack or probe in self.answered or probe in self.answered_before:
+            return
+        if tcp_package.flag_syn:
+            state = OPEN
+        elif tcp_package.flag_rst:
+            state = CLOSED
+        else:
+            return
+        time_to_answer = self.cookie.check(ip, tcp_package.from_port, tcp_package.to_port,
+                                           tcp_package.acknowledgment)
+        if time_to_answer is not None:
+            self.counters[MATCHED] += 1
+            self.pacer.on_reply()
+            self.rtt_estimator(ip).sample(time_to_answer)
+            self.answered.add(probe)
+            self.emit(probe, state, time_to_answer)
+
+    def snapshot(self) -> dict:
+        """
+        Stateless probes are not tracked: the position is taken from before the last timeout,
+        so probes that might still be answered are sent again on restore
+        """
+        if not self.stateless:
+            return super().snapshot()
+        answered_before = time.perf_counter() - self.max_timeout()
+        if self.last_send <= answered_before:
+            return {'position': self.position, 'pending': []}
+        position = self.shard[0]
+        for sent, mark in reversed(self.marks):
+            if sent <= answered_before:
+                position = mark
+                break
+        return {'position': position, 'pending': []}
+
+    def store_result(self, event: ScanEvent):
+        if event.state == OPEN:
+            self.answer.add((event.host, event.port, event.rtt))
+
+    def on_no_answer(self, probe: Probe):
+        """
+        Port without any answer is filtered
+        """
+        self.emit(probe, FILTERED)
+
+    def is_finished(self) -> bool:
+        """
+        All ports are sent and answered or timed out
+        """
+        if not self.stateless:
+            return super().is_finished()
+        if self.has_probes():
+            return False
+        return time.perf_counter() - self.last_send >= self.max_timeout()
 
-    def start_scan(self) -> List[Tuple[int, float]]:
+    def select_timeout(self):
         """
-        Start scan tcp ports.
-        :return: List of open ports and time to answer.
+        Time until the next in-flight probe expires or the packet ring looks at frames waiting for a neighbor
         """
-        sel = selectors.DefaultSelector()
-        sel.register(self.tcp_socket, selectors.EVENT_READ | selectors.EVENT_WRITE)
+        if self.stateless and not self.has_probes():
+            timeout = max(0.0, self.last_send + self.max_timeout() - time.perf_counter())
+        else:
+            timeout = super().select_timeout()
+        ring_timeout = self.ring.next_timeout() if self.ring is not None else None
+        if ring_timeout is not None and (timeout is None or ring_timeout < timeout):
+            return ring_timeout
+        return timeout
 
-        while True:
-            events = sel.select()
-            for key, mask in events:
-                if mask & selectors.EVENT_READ:
-                    self.read_package(key.fileobj)
-                elif mask & selectors.EVENT_WRITE:
-                    self.write_package(key.fileobj)
+    def sockets(self) -> List[socket.socket]:
+        return [self.tcp_socket]
 
-                if len(self.ports) == 0 and len(self.port_states) == 0:
-                    self.port_states.destroy()
-                    self.tcp_socket.close()
-                    return sorted(list(self.answer))
+    def close(self):
+        super().close()
+        if self.ring is not None:
+            self.ring.close()
+
+    def results(self) -> List[Tuple[str, int, int]]:
+        """
+        :return: List of open (host, port, time to answer in ms).
+        """
+        return sorted_results(self.answer)
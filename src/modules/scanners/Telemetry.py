@@ -0,0 +1,171 @@
+import json
+import os
+import sys
+import time
+from array import array
+from typing import Dict, List, TextIO, Tuple
+from src.modules.scanners.ScanEvent import OPEN, CLOSED, FILTERED
+
+PROBES, RETRANSMITS, RECEIVED, MATCHED, TIMEOUTS, OPEN_PORTS, CLOSED_PORTS, FILTERED_PORTS = range(8)
+COUNTERS = ('probes_sent', 'retransmits', 'packets_received', 'replies_matched', 'timeouts',
+            'open', 'closed', 'filtered')
+""" counters kept by scanners, incremented in place on the hot path """
+KERNEL_DROPS, PORTS_STARTED = range(len(COUNTERS), len(COUNTERS) + 2)
+GAUGES = ('kernel_drops', 'ports_started')
+""" values read from the sockets and the permutation when a sample is taken """
+STATE_COUNTERS = {OPEN: OPEN_PORTS, CLOSED: CLOSED_PORTS, FILTERED: FILTERED_PORTS}
+
+_HELP = {
+    'probes_sent': 'Probes sent, retransmissions included',
+    'retransmits': 'Probes sent again after a timeout',
+    'packets_received': 'Packets read from the scanner sockets',
+    'replies_matched': 'Packets that answered a probe in flight',
+    'timeouts': 'Probes that were not answered in time',
+    'open': 'Ports found open',
+    'closed': 'Ports found closed',
+    'filtered': 'Ports found filtered',
+    'kernel_drops': 'Packets dropped by the kernel because a socket receive queue was full',
+    'ports_started': 'Ports taken from the scan order',
+}
+
+Sample = Dict[str, List[int]]
+""" protocol -> counters and gauges of the scanner """
+
+
+def new_counters() -> array:
+    """
+    Zeroed counters of a scanner, indexed by the COUNTERS constants
+    """
+    return array('Q', [0]) * len(COUNTERS)
+
+
+class Telemetry:
+    """
+    Counters of a running scan: scanners count into fixed arrays without allocating, samples of them
+    are sent here by every shard a few times a second. Prints a progress line with probes per second
+    and ETA to stderr and writes the totals as json or Prometheus text to a file, which is replaced
+    atomically so that a scraper never reads a partial file
+    """
+    SMOOTHING = 0.3
+    """ weight of the last interval in the probes per second estimate """
+
+    def __init__(self, ports: Dict[str, int], interval: float = 1.0, progress: bool = True,
+                 metrics: str = None, metrics_format: str = 'json', stream: TextIO = sys.stderr):
+        """
+        :param ports: protocol -> ports to scan, hosts x ports
+        :param interval: seconds between progress lines and metrics file updates
+        :param progress: print progress lines
+        :param metrics: file to write metrics to
+        :param metrics_format: 'json' or 'prometheus'
+        """
+        self.ports = ports
+        self.interval = interval
+        self.progress = progress
+        self.metrics = metrics
+        self.metrics_format = metrics_format
+        self.stream = stream
+        self.samples: Dict[Tuple[int, str], List[int]] = {}
+        self.start = self.last_report = time.perf_counter()
+        self.last_started = 0
+        self.last_sent = 0
+        self.rate = None
+        """ ports started per second, smoothed """
+
+    def update(self, shard: int, sample: Sample):
+        """
+        Take the latest sample of a shard, reports are written when interval has passed
+        """
+        for protocol, values in sample.items():
+            self.samples[shard, protocol] = values
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.report(now)
+
+    def totals(self) -> Dict[str, Dict[str, int]]:
+        """
+        protocol -> counter and gauge name -> value summed over shards
+        """
+        totals = {}
+        for (_, protocol), values in self.samples.items():
+            total = totals.setdefault(protocol, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+        return {protocol: dict(zip(COUNTERS + GAUGES, values)) for protocol, values in sorted(totals.items())}
+
+    def report(self, now: float = None, final: bool = False):
+        """
+        Print progress line and write metrics file
+        """
+        now = time.perf_counter() if now is None else now
+        totals = self.totals()
+        if self.progress:
+            print(self.progress_line(totals, now, final), file=self.stream, flush=True)
+        if self.metrics:
+            self.write(totals, now)
+        self.last_report = now
+
+    def progress_line(self, totals: Dict[str, Dict[str, int]], now: float, final: bool = False) -> str:
+        """
+        Probes per second over the last interval, over the whole scan in the final line
+        """
+        started = sum(values['ports_started'] for values in totals.values())
+        sent = sum(values['probes_sent'] for values in totals.values())
+        ports = sum(self.ports.values())
+        elapsed = now - self.last_report
+        if final:
+            probe_rate = sent / (now - self.start) if now > self.start else 0.0
+        else:
+            probe_rate = (sent - self.last_sent) / elapsed if elapsed > 0 else 0.0
+        if elapsed > 0:
+            rate = (started - self.last_started) / elapsed
+            self.rate = rate if self.rate is None else self.SMOOTHING * rate + (1 - self.SMOOTHING) * self.rate
+        self.last_started, self.last_sent = started, sent
+        eta = ''
+        if self.rate and started < ports:
+            eta = f', ETA {_duration((ports - started) / self.rate)}'
+        found = sum(values['open'] for values in totals.values())
+        drops = sum(values['kernel_drops'] for values in totals.values())
+        percent = started / ports * 100 if ports else 100.0
+        return (f'[{_duration(now - self.start)}] {percent:.1f}% of {ports} ports, {sent} probes, '
+                f'{probe_rate:.0f} probes/s, {found} open, {drops} kernel drops{eta}')
+
+    def finish(self):
+        """
+        Final report at the end of the scan
+        """
+        self.report(final=True)
+
+    def to_json(self, totals: Dict[str, Dict[str, int]], now: float) -> dict:
+        protocols = {protocol: dict(values, ports_total=self.ports.get(protocol, 0))
+                     for protocol, values in totals.items()}
+        return {'elapsed_seconds': round(now - self.start, 3), 'protocols': protocols}
+
+    def to_prometheus(self, totals: Dict[str, Dict[str, int]], now: float) -> str:
+        lines = []
+        for name in COUNTERS + GAUGES:
+            metric = f'portscanner_{name}' if name == 'ports_started' else f'portscanner_{name}_total'
+            lines.append(f'# HELP {metric} {_HELP[name]}')
+            lines.append(f'# TYPE {metric} {"gauge" if name == "ports_started" else "counter"}')
+            lines.extend(f'{metric}{{protocol="{protocol}"}} {values[name]}' for protocol, values in totals.items())
+        lines.append('# HELP portscanner_ports Ports to scan, hosts x ports')
+        lines.append('# TYPE portscanner_ports gauge')
+        lines.extend(f'portscanner_ports{{protocol="{protocol}"}} {ports}' for protocol, ports in self.ports.items())
+        lines.append('# HELP portscanner_elapsed_seconds Time since the scan started')
+        lines.append('# TYPE portscanner_elapsed_seconds gauge')
+        lines.append(f'portscanner_elapsed_seconds {now - self.start:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, totals: Dict[str, Dict[str, int]], now: float):
+        if self.metrics_format == 'prometheus':
+            text = self.to_prometheus(totals, now)
+        else:
+            text = json.dumps(self.to_json(totals, now), indent=2) + '\n'
+        temp_path = f'{self.metrics}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, self.metrics)
+
+
+def _duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}'
@@ -1,34 +1,78 @@
+import heapq
 import socket
 import selectors
 import time
-from src.modules.scanners.BaseScanner import BaseScanner
-from typing import Set, List, Tuple
+from collections import deque
+from src.modules.scanners.BaseScanner import BaseScanner, Probe, sorted_results
+from src.modules.scanners.ScanEvent import ScanEvent, OPEN, CLOSED, FILTERED
+from src.modules.structures.TargetSet import TargetSet
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import sys
 from src.modules.protocols.ICMP import ICMP
-from src.modules.helpers import get_port_from_data
+from src.modules.scanners.IcmpRateLimit import IcmpRateLimit
+from src.modules.structures.LruDict import LruDict
+from src.modules.guess.FingerprintDB import default_db
+from src.modules.transport.BpfFilter import icmp_unreachable_filter, attach_filter, KernelCounter
 
 
 class UDPScanner(BaseScanner):
-    """Async udp port scanner """
-    def __init__(self, ip: str, ports: Set[int], timeout: float):
+    """
+    Async udp port scanner. Targets that rate limit ICMP errors are detected and paced to
+    their ICMP budget (see IcmpRateLimit), probes to a paced target wait in a queue of their own
+    """
+    PROTOCOL = 'udp'
+    MAX_HELD = 4096
+    """ probes held back for paced targets before the permutation stops advancing """
+    MAX_LIMITS = 65536
+    """ rate limited targets, beyond it the least recently used one without held probes is forgotten """
+
+    def __init__(self, targets: Union[TargetSet, str], ports: Iterable[int], timeout: float, rate: float = 0,
+                 adaptive: bool = False, retries: int = 0, seed: int = None, batch_size: int = 64,
+                 shard: Tuple[int, int] = (0, 1)):
         """
         Init udp scanner
-        :param ip: ip address from which you need to scan the ports.
-        :param ports: ports to scan.
+        :param targets: hosts from which you need to scan the ports.
+        :param ports: ports to scan on every host.
         :param timeout: Timeout waiting for a response from (ip, port)
+        :param rate: Maximum probes per second, 0 is unlimited
+        :param adaptive: Limit probes in flight by congestion window
+        :param retries: Number of retransmissions of unanswered probes
+        :param seed: Seed of the host x port scan order
+        :param batch_size: Maximum number of packets per system call
+        :param shard: (index, count) of the part of the scan
         """
-        super().__init__(ip, ports, timeout)
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        super().__init__(targets, ports, timeout, rate, adaptive, retries, seed, batch_size, shard)
+        self.udp_socket = self.create_udp_socket()
         self.udp_socket.setblocking(False)
+        self.write_socket = self.udp_socket
 
         self.icmp_socket = self.create_raw_icmp_socket()
         self.icmp_socket.setblocking(False)
+        self.kernel_counter = KernelCounter(socket.IPPROTO_ICMP)
+        self.update_filter()
 
+        self.fingerprints = default_db()
+        self.payloads = self.fingerprints.payloads('udp')
         self.closed_ports = set()
         self.open_ports = set()
+        self.filtered_ports = set()
+        self.services = {}
+
+        self.limits: LruDict = LruDict(self.MAX_LIMITS, keep=lambda host: host in self.held)
+        """ host -> IcmpRateLimit, limits of hosts with held probes are not evicted """
+        self.held: Dict[str, Deque[Tuple[Probe, int]]] = {}
+        self.held_count = 0
+        self.wakeups: List[Tuple[float, str]] = []
+        self.ready: Optional[Tuple[Probe, int]] = None
 
-        self.answer = set((port, 0) for port in self.ports)
-        self.result = set()
+    def create_udp_socket(self):
+        """
+        Create udp socket
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # whole networks are usually given, sending to their broadcast address must not fail the scan
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        return sock
 
     def create_raw_icmp_socket(self):
         """
@@ -41,54 +85,161 @@ class UDPScanner(BaseScanner):
             sys.exit()
         return sock
 
-    def read_package(self, sock: selectors.SelectorKey.fileobj):
+    def update_filter(self):
+        """
+        Pass only ICMP destination unreachable from targets
+        """
+        self.filtered = attach_filter(self.icmp_socket, icmp_unreachable_filter(self.targets.intervals))
+
+    def filter_stats(self) -> str:
+        received = self.kernel_counter.received()
+        delivered = self.batch(self.icmp_socket).packets_received
+        if not self.filtered or received is None:
+            stats = f'ICMP: {delivered} packets delivered, kernel filter is not available'
+        else:
+            stats = f'ICMP: {delivered} of {received} packets delivered, ' \
+                    f'{max(0, received - delivered)} filtered in kernel'
+        rates = sorted(limit.rate for limit in self.limits.values() if limit.limited)
+        if rates:
+            stats += f', {len(rates)} targets rate limit ICMP errors (median {rates[len(rates) // 2]:.1f}/s)'
+        return stats
+
+    def handle_package(self, sock: selectors.SelectorKey.fileobj, data: bytes, address: Tuple[str, int],
+                       finish: float):
         """
-        Recv package from (ip, port)
+        Handle package from (ip, port)
         """
-        data, address = sock.recvfrom(1024)
-        finish = time.perf_counter()
-        if address[0] == self.ip:
+        if address[0] in self.targets:
             if sock == self.udp_socket:
-                port = get_port_from_data(data)
-                if port in self.port_states:
-                    time_delta = finish - self.port_states[port]
-                    self.open_ports.add((port, round(time_delta * 1000)))
+                probe = address[:2]
+                if probe in self.port_states:
+                    self.emit(probe, OPEN, self.probe_answered(probe, finish), self.classify(probe[1], data))
             elif sock == self.icmp_socket:
                 icmp = ICMP(data)
                 icmp_type = icmp.decode_icmp_type()
-                port = icmp.get_destination_port()
-                if icmp_type == 3 and port in self.port_states:
-                    time_delta = finish - self.port_states[port]
-                    self.closed_ports.add((port, round(time_delta * 1000)))
+                probe = (address[0], icmp.get_destination_port())
+                if icmp_type == 3 and probe in self.port_states:
+                    time_to_answer = self.probe_answered(probe, finish)
+                    limit = self.limits.get(probe[0])
+                    if limit is None:
+                        limit = self.limits[probe[0]] = IcmpRateLimit()
+                    limit.on_error(probe[1], finish - time_to_answer, finish)
+                    self.emit(probe, CLOSED, time_to_answer)
+
+    def classify(self, port: int, data: bytes) -> str:
+        """
+        Service that answered the payload of port
+        """
+        payload = self.payloads.get(port)
+        if data == (payload.payload if payload is not None else b''):
+            return 'ECHO'
+        fingerprint = self.fingerprints.match(data, payload.name if payload is not None else None)
+        return str(fingerprint) if fingerprint is not None else ''
 
     def write_package(self, sock: selectors.SelectorKey.fileobj):
         """
-        Send package to (ip, port)
-        """
-        if len(self.ports) > 0:
-            cur_port = self.ports.pop()
-            sock.sendto(b'', (self.ip, cur_port))
-            self.port_states[cur_port] = time.perf_counter()
-
-    def start_scan(self) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
-        """
-        Start scan udp ports.
-        :returns: Filtered and Open ports.
-        """
-        sel = selectors.DefaultSelector()
-        sel.register(self.udp_socket, selectors.EVENT_WRITE | selectors.EVENT_READ)
-        sel.register(self.icmp_socket, selectors.EVENT_READ)
-
-        while True:
-            events = sel.select()
-            for key, mask in events:
-                if mask & selectors.EVENT_READ:
-                    self.read_package(key.fileobj)
-                elif mask & selectors.EVENT_WRITE:
-                    self.write_package(key.fileobj)
-                if len(self.ports) == 0 and len(self.port_states) == 0:
-                    self.port_states.destroy()
-                    self.udp_socket.close()
-                    self.icmp_socket.close()
-                    return sorted(list(self.answer - self.closed_ports - self.open_ports)), \
-                           sorted(list(self.open_ports))
+        Queue package to (ip, port), well-known ports get a payload their service answers
+        """
+        if self.probe_ready():
+            probe, attempt = self.next_probe()
+            payload = self.payloads.get(probe[1])
+            self.batch(sock).queue(payload.payload if payload is not None else b'', probe)
+            self.probe_sent(probe, attempt)
+
+    def has_probes(self) -> bool:
+        return super().has_probes() or self.held_count > 0 or self.ready is not None
+
+    def _hold(self, probe: Probe, attempt: int, now: float):
+        """
+        Queue probe until its target allows it
+        """
+        queue = self.held.get(probe[0])
+        if queue is None:
+            queue = self.held[probe[0]] = deque()
+            heapq.heappush(self.wakeups, (now + self.limits[probe[0]].delay(), probe[0]))
+        queue.append((probe, attempt))
+        self.held_count += 1
+
+    def probe_ready(self) -> bool:
+        """
+        Take the next probe its target allows: held probes of targets with ICMP budget first,
+        then retransmissions and the permutation, probes to paced targets are held back
+        """
+        if self.ready is not None:
+            return True
+        now = time.perf_counter()
+        while self.wakeups and self.wakeups[0][0] <= now:
+            _, host = heapq.heappop(self.wakeups)
+            limit = self.limits[host]
+            queue = self.held[host]
+            if not limit.admit():
+                heapq.heappush(self.wakeups, (now + max(limit.delay(), 0.001), host))
+                continue
+            self.ready = queue.popleft()
+            self.held_count -= 1
+            if queue:
+                heapq.heappush(self.wakeups, (now + limit.delay(), host))
+            else:
+                del self.held[host]
+            return True
+        while self.held_count < self.MAX_HELD and super().has_probes():
+            probe, attempt = super().next_probe()
+            limit = self.limits.get(probe[0])
+            # probes to a paced target keep their order
+            if limit is not None and (probe[0] in self.held or not limit.admit()):
+                self._hold(probe, attempt, now)
+            else:
+                self.ready = probe, attempt
+                return True
+        return False
+
+    def probe_delay(self) -> Optional[float]:
+        if not self.wakeups:
+            return None
+        return max(0.0, self.wakeups[0][0] - time.perf_counter())
+
+    def next_probe(self) -> Tuple[Probe, int]:
+        if self.ready is None and not self.probe_ready():
+            raise IndexError('no probe can be sent now')
+        probe, self.ready = self.ready, None
+        return probe
+
+    def pending_probes(self) -> Iterator[Probe]:
+        yield from super().pending_probes()
+        if self.ready is not None:
+            yield self.ready[0]
+        for queue in self.held.values():
+            for probe, _ in queue:
+                yield probe
+
+    def on_timeout(self, key: Probe, value):
+        """
+        Silent probe to a target limiting ICMP errors is sent again at the rate of the target
+        """
+        limit = self.limits.get(key[0])
+        now = time.perf_counter()
+        if limit is not None and limit.on_silent(key[1], value.time, now, value.value, self.retries):
+            self._hold(key, value.value + 1, now)
+        else:
+            super().on_timeout(key, value)
+
+    def on_no_answer(self, probe: Probe):
+        """
+        Port without any answer is open or filtered
+        """
+        self.emit(probe, FILTERED)
+
+    def store_result(self, event: ScanEvent):
+        ports = {OPEN: self.open_ports, CLOSED: self.closed_ports, FILTERED: self.filtered_ports}[event.state]
+        ports.add((event.host, event.port, event.rtt))
+        if event.service:
+            self.services[event.host, event.port] = event.service
+
+    def sockets(self) -> List[socket.socket]:
+        return [self.udp_socket, self.icmp_socket]
+
+    def results(self) -> Tuple[List[Tuple[str, int, int]], List[Tuple[str, int, int]]]:
+        """
+        :returns: Filtered and Open (host, port, time to answer in ms).
+        """
+        return sorted_results(self.filtered_ports), sorted_results(self.open_ports)
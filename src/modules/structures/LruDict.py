@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from typing import Any, Callable, Iterator
+
+
+class LruDict:
+    """
+    Dictionary of at most maxsize items for state kept per target: reading or writing an item makes
+    it the most recently used, inserting into a full dictionary evicts the least recently used
+    item that keep() does not protect, so the memory of a scan does not grow with the number of targets.
+    Class PARTIALLY implements dictionary interface:
+        d[key] = value, d[key], d.get(key), key in d, d.pop(key), len(d), d.values(), iter(d)
+    """
+    def __init__(self, maxsize: int, keep: Callable[[Any], bool] = None):
+        """
+        :param maxsize: maximum number of items, more are kept only while keep() protects them
+        :param keep: items whose key it returns True for are not evicted
+        """
+        self.maxsize = maxsize
+        self.keep = keep
+        self.data: 'OrderedDict[Any, Any]' = OrderedDict()
+
+    def __getitem__(self, key) -> Any:
+        value = self.data[key]
+        self.data.move_to_end(key)
+        return value
+
+    def get(self, key, default=None) -> Any:
+        value = self.data.get(key, default)
+        if value is not default:
+            self.data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self._evict()
+
+    def _evict(self):
+        for _ in range(len(self.data) - 1):
+            key = next(iter(self.data))
+            if self.keep is None or not self.keep(key):
+                del self.data[key]
+                return
+            # protected items go to the end, the next oldest one is tried
+            self.data.move_to_end(key)
+
+    def pop(self, key, default=None) -> Any:
+        return self.data.pop(key, default)
+
+    def __contains__(self, key) -> bool:
+        return key in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.data)
+
+    def values(self):
+        return self.data.values()
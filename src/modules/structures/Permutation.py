@@ -0,0 +1,49 @@
+import random
+from typing import Iterator
+
+
+class Permutation:
+    """
+    Pseudo-random permutation of range(size) computed on the fly.
+    A 4-round balanced Feistel network permutes the smallest power of four domain that covers size,
+    indexes that fall outside of range(size) are walked through the cipher again (cycle walking),
+    so nothing proportional to size is stored. Same seed gives the same order
+    """
+    ROUNDS = 4
+
+    def __init__(self, size: int, seed: int = None):
+        self.size = size
+        self.seed = random.getrandbits(64) if seed is None else seed
+        bits = max(2, (size - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        generator = random.Random(self.seed)
+        self.keys = [generator.getrandbits(32) for _ in range(self.ROUNDS)]
+
+    def _round(self, value: int, key: int) -> int:
+        value = ((value ^ key) * 0x9e3779b1) & 0xffffffff
+        value ^= value >> 15
+        value = (value * 0x85ebca6b) & 0xffffffff
+        value ^= value >> 13
+        return value & self.half_mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < self.size:
+            raise IndexError('permutation index out of range')
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[int]:
+        for index in range(self.size):
+            yield self[index]
@@ -0,0 +1,140 @@
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable, Iterator, List, Tuple
+
+MAX_PORT = 65535
+DEFAULT_PORTS = (1, 1000)
+""" ports scanned when only the protocol is given """
+
+
+class PortSet:
+    """
+    Set of ports stored as merged inclusive intervals, ports are never materialized.
+    Membership is tested in an 8 KiB bitmap with one bit per port, indexing follows port order,
+    so index i of a scan always maps to the same port. Supports len(), indexing, iteration,
+    membership test, union and difference
+    """
+    def __init__(self, intervals: Iterable[Tuple[int, int]] = ()):
+        merged: List[List[int]] = []
+        last = 0
+        for start, end in sorted(intervals):
+            if not merged or start > last + 1:
+                merged.append([start, end])
+                last = end
+            elif end > last:
+                merged[-1][1] = last = end
+        if merged and (merged[0][0] < 1 or last > MAX_PORT or any(start > end for start, end in merged)):
+            raise ValueError('Port should be less 65536 and more 0')
+        self.intervals = [(start, end) for start, end in merged]
+        # _offsets[i] is the index of the first port of interval i
+        self._offsets = [0] + list(accumulate(end - start + 1 for start, end in self.intervals))
+        # port at index is _bases[i] + index for index in interval i
+        self._bases = [start - offset for (start, _), offset in zip(self.intervals, self._offsets)]
+        self._bitmap = bytearray((MAX_PORT + 1) // 8)
+        for start, end in self.intervals:
+            if start == end:
+                self._bitmap[start >> 3] |= 1 << (start & 7)
+            else:
+                self._set_bits(start, end)
+
+    def _set_bits(self, start: int, end: int):
+        first, last = start >> 3, end >> 3
+        if first == last:
+            self._bitmap[first] |= (0xff << (start & 7)) & (0xff >> (7 - (end & 7)))
+            return
+        self._bitmap[first] |= (0xff << (start & 7)) & 0xff
+        self._bitmap[first + 1:last] = b'\xff' * (last - first - 1)
+        self._bitmap[last] |= 0xff >> (7 - (end & 7))
+
+    @classmethod
+    def from_ports(cls, ports: Iterable[int]) -> 'PortSet':
+        """
+        Set of single ports, consecutive ones are merged
+        """
+        if isinstance(ports, PortSet):
+            return ports
+        if isinstance(ports, range) and ports.step == 1:
+            return cls([(ports.start, ports.stop - 1)] if ports else [])
+        return cls((port, port) for port in ports)
+
+    @staticmethod
+    def parse_spec(spec: str) -> Tuple[int, int]:
+        """
+        Parse one port or range: 80 or 1000-2000
+        """
+        try:
+            if '-' in spec:
+                first, last = map(int, spec.split('-', 1))
+            else:
+                first = last = int(spec)
+        except ValueError:
+            raise ValueError(f'Port {spec} is not correct.')
+        if not (0 < first <= MAX_PORT and 0 < last <= MAX_PORT):
+            raise ValueError('Port should be less 65536 and more 0')
+        if last < first:
+            raise ValueError(f'Range {spec} is not correct.')
+        return first, last
+
+    @classmethod
+    def parse(cls, spec: str) -> 'PortSet':
+        """
+        Parse comma separated ports and ranges: 22,80,8000-8100
+        """
+        intervals = []
+        for part in spec.split(','):
+            part = part.strip()
+            if part.isdigit():
+                # single ports are checked when the set is built
+                port = int(part)
+                intervals.append((port, port))
+            elif part:
+                intervals.append(cls.parse_spec(part))
+        return cls(intervals)
+
+    def union(self, other: 'PortSet') -> 'PortSet':
+        return PortSet(self.intervals + other.intervals)
+
+    def difference(self, other: 'PortSet') -> 'PortSet':
+        """
+        Ports of this set that are not in other
+        """
+        intervals = []
+        removed = other.intervals
+        i = 0
+        for start, end in self.intervals:
+            # both lists are sorted, intervals of other that end before this one are not needed again
+            while i < len(removed) and removed[i][1] < start:
+                i += 1
+            j = i
+            while j < len(removed) and removed[j][0] <= end and start <= end:
+                if removed[j][0] > start:
+                    intervals.append((start, removed[j][0] - 1))
+                start = max(start, removed[j][1] + 1)
+                j += 1
+            if start <= end:
+                intervals.append((start, end))
+        return PortSet(intervals)
+
+    __or__ = union
+    __sub__ = difference
+
+    def __len__(self) -> int:
+        return self._offsets[-1]
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < self._offsets[-1]:
+            raise IndexError('port index out of range')
+        return self._bases[bisect_right(self._offsets, index) - 1] + index
+
+    def __contains__(self, port: int) -> bool:
+        return 0 < port <= MAX_PORT and self._bitmap[port >> 3] >> (port & 7) & 1 == 1
+
+    def __iter__(self) -> Iterator[int]:
+        for start, end in self.intervals:
+            yield from range(start, end + 1)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PortSet) and self.intervals == other.intervals
+
+    def __repr__(self):
+        return ','.join(str(start) if start == end else f'{start}-{end}' for start, end in self.intervals)
@@ -0,0 +1,303 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from socket import inet_aton
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+from src.modules.scanners.ScanEvent import ScanEvent, OPEN, CLOSED, FILTERED
+from src.modules.structures.TargetSet import ip_to_int, int_to_ip
+
+MAGIC = b'PSRS'
+STORE_VERSION = 1
+LOG = 0
+""" layout of a store being written: rows in arrival order """
+SORTED = 1
+""" layout of a closed store: sorted key column, rtt column and host index """
+
+_HEADER = struct.Struct('>4sHHQQ')
+""" magic, version, layout, records, hosts """
+_ROW = struct.Struct('>QI')
+""" log row: key (host << 32 | protocol << 24 | port << 8 | state) and rtt """
+_PORT = struct.Struct('>BHBI')
+""" log row after the host """
+_KEY = struct.Struct('>Q')
+_RTT = struct.Struct('>I')
+_HOST = struct.Struct('>III')
+""" index entry: host, first record, records """
+
+PROTOCOLS = {'tcp': 6, 'udp': 17}
+STATES = {OPEN: 1, FILTERED: 2, CLOSED: 3}
+_PROTOCOL_NAMES = {code: name for name, code in PROTOCOLS.items()}
+_STATE_NAMES = {code: name for name, code in STATES.items()}
+
+
+class StoreRecord(NamedTuple):
+    host: str
+    protocol: str
+    port: int
+    state: str
+    rtt: int
+
+
+class Change(NamedTuple):
+    """
+    Port whose state differs between two stores, None if the port is not in the store
+    """
+    host: str
+    protocol: str
+    port: int
+    old: Optional[str]
+    new: Optional[str]
+
+    def __str__(self):
+        target = f'{self.host} {self.protocol}/{self.port}'
+        if self.old is None:
+            return f'+ {target} {self.new}'
+        if self.new is None:
+            return f'- {target} {self.old}'
+        return f'~ {target} {self.old} -> {self.new}'
+
+
+def _big_endian(values: array) -> bytes:
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _decode(key: int) -> Tuple[str, str, int, str]:
+    return (int_to_ip(key >> 32), _PROTOCOL_NAMES[key >> 24 & 0xff], key >> 8 & 0xffff,
+            _STATE_NAMES[key & 0xff])
+
+
+def _read_header(f) -> Tuple[int, int, int]:
+    """
+    :return: layout, records and hosts of the store, raises ValueError if it is not a store
+    """
+    magic, version, layout, records, hosts = _HEADER.unpack(f.read(_HEADER.size).ljust(_HEADER.size, b'\0'))
+    if magic != MAGIC:
+        raise ValueError('not a result store')
+    if version != STORE_VERSION:
+        raise ValueError(f'unsupported version {version}')
+    return layout, records, hosts
+
+
+def sort_store(path: str):
+    """
+    Convert store from LOG to SORTED layout, the file is replaced atomically.
+    Rows of a port written more than once keep the last one, a trailing partial row is dropped
+    """
+    with open(path, 'rb') as f:
+        layout, _, _ = _read_header(f)
+        if layout == SORTED:
+            return
+        rows = (os.fstat(f.fileno()).st_size - _HEADER.size) // _ROW.size
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end = _HEADER.size + rows * _ROW.size
+            # port, row number, state and rtt: the last row of every port sorts last among its rows
+            order = [key >> 8 << 72 | row << 40 | (key & 0xff) << 32 | rtt
+                     for row, (key, rtt) in enumerate(_ROW.iter_unpack(data[_HEADER.size:end]))]
+        finally:
+            data.close()
+    order.sort()
+    order.append(0)
+    keys, rtts, index = array('Q'), array('I'), array('I')
+    host = None
+    for item, following in zip(order, order[1:]):
+        port = item >> 72
+        if following >> 72 == port:
+            continue
+        if port >> 24 != host:
+            host = port >> 24
+            index.extend((host, len(keys), 0))
+        index[-1] += 1
+        keys.append(port << 8 | item >> 32 & 0xff)
+        rtts.append(item & 0xffffffff)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, STORE_VERSION, SORTED, len(keys), len(index) // 3))
+        f.write(_big_endian(keys))
+        f.write(_big_endian(rtts))
+        f.write(_big_endian(index))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class StoreWriter:
+    """
+    Writes scan results to a store as they arrive: every result is appended as a fixed size row,
+    so a store interrupted at any point keeps the results written before. Closing sorts the store
+    """
+    def __init__(self, path: str):
+        """
+        :param path: store file, an existing file is replaced
+        """
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(_HEADER.pack(MAGIC, STORE_VERSION, LOG, 0, 0))
+
+    def add(self, event: ScanEvent):
+        """
+        Append result event, closed ports are not kept
+        """
+        protocol, host, port, state, rtt = event[:5]
+        if state != CLOSED:
+            self.file.write(inet_aton(host) + _PORT.pack(PROTOCOLS[protocol], port, STATES[state], rtt))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            sort_store(self.path)
+
+
+class ResultStore:
+    """
+    Read only view of a store mapped into memory. Records are sorted by host, protocol and port,
+    the key and state of a record is one 8 byte big-endian column value, so records of a host compare
+    as a byte range and the host index is searched in place. Records are only unpacked on access.
+    File layout: header, key column, rtt column, index of (host, first record, records)
+    """
+    def __init__(self, path: str):
+        """
+        :param path: store file, a store left in LOG layout is sorted first.
+                     Raises ValueError if it can not be read
+        """
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                layout, _, _ = _read_header(f)
+            if layout == LOG:
+                sort_store(path)
+            with open(path, 'rb') as f:
+                layout, self.records, self.hosts = _read_header(f)
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, struct.error, ValueError) as e:
+            raise ValueError(f'Can not read store {path}: {e}')
+        self.keys_offset = _HEADER.size
+        self.rtts_offset = self.keys_offset + self.records * _KEY.size
+        self.index_offset = self.rtts_offset + self.records * _RTT.size
+        if len(self.data) < self.index_offset + self.hosts * _HOST.size:
+            self.close()
+            raise ValueError(f'Can not read store {path}: file is truncated')
+
+    def __len__(self):
+        return self.records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    def host_entry(self, i: int) -> Tuple[int, int, int]:
+        """
+        :return: host, first record and number of records of i-th host of the index
+        """
+        return _HOST.unpack_from(self.data, self.index_offset + i * _HOST.size)
+
+    def entries(self) -> Iterator[Tuple[int, int, int]]:
+        """
+        Index entries in host order
+        """
+        return _HOST.iter_unpack(self.data[self.index_offset:self.index_offset + self.hosts * _HOST.size])
+
+    def find_host(self, host: str) -> Tuple[int, int]:
+        """
+        :return: first record and number of records of host, binary search of the index
+        """
+        value = ip_to_int(host)
+        low, high = 0, self.hosts
+        while low < high:
+            middle = (low + high) // 2
+            if self.host_entry(middle)[0] < value:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.hosts:
+            found, first, count = self.host_entry(low)
+            if found == value:
+                return first, count
+        return 0, 0
+
+    def key_bytes(self, first: int, count: int) -> bytes:
+        """
+        Key column of records first to first + count, equal for equal port states
+        """
+        return self.data[self.keys_offset + first * _KEY.size:self.keys_offset + (first + count) * _KEY.size]
+
+    def read(self, first: int = 0, count: int = None) -> Iterator[StoreRecord]:
+        """
+        Records first to first + count, all by default
+        """
+        if count is None:
+            count = self.records - first
+        rtts = self.data[self.rtts_offset + first * _RTT.size:self.rtts_offset + (first + count) * _RTT.size]
+        for (key,), (rtt,) in zip(_KEY.iter_unpack(self.key_bytes(first, count)), _RTT.iter_unpack(rtts)):
+            yield StoreRecord(*_decode(key), rtt)
+
+    def host_records(self, host: str) -> List[StoreRecord]:
+        return list(self.read(*self.find_host(host)))
+
+    def __iter__(self) -> Iterator[StoreRecord]:
+        return self.read()
+
+
+def _diff_keys(old: bytes, new: bytes) -> Iterator[Change]:
+    """
+    Changes between key columns of one host, merge of the sorted keys
+    """
+    old_keys = [key for key, in _KEY.iter_unpack(old)]
+    new_keys = [key for key, in _KEY.iter_unpack(new)]
+    i = j = 0
+    while i < len(old_keys) or j < len(new_keys):
+        old_port = old_keys[i] >> 8 if i < len(old_keys) else None
+        new_port = new_keys[j] >> 8 if j < len(new_keys) else None
+        if old_port == new_port:
+            if old_keys[i] != new_keys[j]:
+                host, protocol, port, state = _decode(old_keys[i])
+                yield Change(host, protocol, port, state, _STATE_NAMES[new_keys[j] & 0xff])
+            i += 1
+            j += 1
+        elif new_port is None or old_port is not None and old_port < new_port:
+            host, protocol, port, state = _decode(old_keys[i])
+            yield Change(host, protocol, port, state, None)
+            i += 1
+        else:
+            host, protocol, port, state = _decode(new_keys[j])
+            yield Change(host, protocol, port, None, state)
+            j += 1
+
+
+def diff(old: ResultStore, new: ResultStore, host: str = None) -> Iterator[Change]:
+    """
+    Ports whose state differs between stores, sorted by host, protocol and port.
+    The host indexes are merged; records of a host present in both stores are compared as one byte
+    range, so only hosts that changed are unpacked
+    :param host: compare only this host
+    """
+    if host is not None:
+        yield from _diff_keys(old.key_bytes(*old.find_host(host)), new.key_bytes(*new.find_host(host)))
+        return
+    old_entries, new_entries = old.entries(), new.entries()
+    old_entry, new_entry = next(old_entries, None), next(new_entries, None)
+    while old_entry is not None or new_entry is not None:
+        if new_entry is None or old_entry is not None and old_entry[0] < new_entry[0]:
+            yield from _diff_keys(old.key_bytes(*old_entry[1:]), b'')
+            old_entry = next(old_entries, None)
+        elif old_entry is None or new_entry[0] < old_entry[0]:
+            yield from _diff_keys(b'', new.key_bytes(*new_entry[1:]))
+            new_entry = next(new_entries, None)
+        else:
+            old_keys, new_keys = old.key_bytes(*old_entry[1:]), new.key_bytes(*new_entry[1:])
+            if old_keys != new_keys:
+                yield from _diff_keys(old_keys, new_keys)
+            old_entry, new_entry = next(old_entries, None), next(new_entries, None)
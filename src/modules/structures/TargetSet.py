@@ -0,0 +1,119 @@
+import socket
+import struct
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable, List, Tuple, Iterator
+
+
+def ip_to_int(ip: str) -> int:
+    """
+    Convert dotted IPv4 address to integer
+    """
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except OSError:
+        raise ValueError(f'IP address {ip} is not correct.')
+
+
+def int_to_ip(value: int) -> str:
+    """
+    Convert integer to dotted IPv4 address
+    """
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+class TargetSet:
+    """
+    Set of IPv4 targets stored as merged inclusive intervals, hosts are never materialized.
+    Supports len(), indexing in address order, iteration and membership test
+    """
+    def __init__(self, intervals: Iterable[Tuple[int, int]] = ()):
+        merged: List[List[int]] = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.intervals = [(start, end) for start, end in merged]
+        self._starts = [start for start, _ in self.intervals]
+        # _offsets[i] is the index of the first host of interval i
+        self._offsets = [0] + list(accumulate(end - start + 1 for start, end in self.intervals))
+
+    @staticmethod
+    def parse_spec(spec: str) -> Tuple[int, int]:
+        """
+        Parse one target: 10.0.0.1, 10.0.0.0/24, 10.0.0.1-10.0.0.50 or 10.0.0.1-50
+        """
+        if '/' in spec:
+            address, prefix = spec.split('/', 1)
+            if not prefix.isdigit() or not 0 <= int(prefix) <= 32:
+                raise ValueError(f'Network {spec} is not correct.')
+            mask = (0xffffffff << (32 - int(prefix))) & 0xffffffff
+            start = ip_to_int(address) & mask
+            return start, start | (~mask & 0xffffffff)
+        if '-' in spec:
+            first, last = spec.split('-', 1)
+            start = ip_to_int(first)
+            if last.isdigit():
+                if not 0 <= int(last) <= 255:
+                    raise ValueError(f'Range {spec} is not correct.')
+                end = (start & 0xffffff00) | int(last)
+            else:
+                end = ip_to_int(last)
+            if end < start:
+                raise ValueError(f'Range {spec} is not correct.')
+            return start, end
+        if spec.count('.') != 3:
+            raise ValueError(f'IP address {spec} is not correct.')
+        address = ip_to_int(spec)
+        return address, address
+
+    @classmethod
+    def parse(cls, specs: Iterable[str]) -> 'TargetSet':
+        """
+        Parse targets, every spec can hold several comma separated targets
+        """
+        intervals = []
+        for spec in specs:
+            for part in spec.split(','):
+                part = part.strip()
+                if part:
+                    intervals.append(cls.parse_spec(part))
+        return cls(intervals)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'TargetSet':
+        """
+        Read targets from file, one or more per line, '#' starts a comment
+        """
+        with open(path) as file:
+            return cls.parse(line.split('#', 1)[0].replace(' ', ',') for line in file)
+
+    def union(self, other: 'TargetSet') -> 'TargetSet':
+        return TargetSet(self.intervals + other.intervals)
+
+    def __len__(self) -> int:
+        return self._offsets[-1]
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < len(self):
+            raise IndexError('target index out of range')
+        interval = bisect_right(self._offsets, index) - 1
+        return int_to_ip(self.intervals[interval][0] + index - self._offsets[interval])
+
+    def __contains__(self, ip: str) -> bool:
+        try:
+            value = ip_to_int(ip)
+        except ValueError:
+            return False
+        interval = bisect_right(self._starts, value) - 1
+        return interval >= 0 and value <= self.intervals[interval][1]
+
+    def __iter__(self) -> Iterator[str]:
+        for start, end in self.intervals:
+            for value in range(start, end + 1):
+                yield int_to_ip(value)
+
+    def __repr__(self):
+        return ', '.join(int_to_ip(start) if start == end else f'{int_to_ip(start)}-{int_to_ip(end)}'
+                         for start, end in self.intervals)
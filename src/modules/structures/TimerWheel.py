@@ -0,0 +1,158 @@
+import time
+from typing import Callable, Any, Optional, Dict, Iterator, List
+
+
+class TimerWheel:
+    """
+    Single-threaded replacement of TimeDict based on a hashed timer wheel.
+    Objects are assigned a deadline at insertion, expired objects are removed and passed to
+    the optional action function when expire() is called, usually right after
+    selector.select(timeout=wheel.next_timeout()), so no thread and no locks are needed.
+    Insert, delete and expire are O(1) per object, deadlines are kept in time.monotonic_ns()
+    and fire with `resolution` precision (1 ms by default).
+    EXAMPLE USAGE:
+        wheel = TimerWheel(action_time=2)
+        wheel['1'] = 1
+        while wheel:
+            selector.select(timeout=wheel.next_timeout())
+            wheel.expire()
+    Class PARTIALLY implements dictionary interface, same as TimeDict:
+    insertion:
+        d[key] = value
+    updating:
+        NOTE: updating only changes the value, deadline remains unchanged
+        d[key] = value
+    deletion (timer cancel):
+        del d[key]
+    testing for membership:
+        key in d
+    checking length:
+        len(d)
+    iteration over keys:
+        for key in d
+    """
+
+    def __init__(self, action_time: float, action: Callable[[Any, Any], None] = None,
+                 resolution: float = 0.001, slots: int = 4096):
+        """
+        :param action_time: is the age in seconds of object has to be (since insertion) for action to be taken
+        :param action: action to be taken on object expiration, object is already removed when it is called
+                - `def action(key, value) -> None`
+        :param resolution: wheel tick in seconds
+        :param slots: number of wheel slots, deadlines further than slots * resolution wait for several rounds
+        """
+        self.action_ns = int(action_time * 1e9)
+        self.action = action
+        self.tick_ns = max(1, int(resolution * 1e9))
+        self.slots: List[Dict[Any, None]] = [{} for _ in range(slots)]
+        # key -> [deadline_ns, value, slot]
+        self.data: Dict[Any, list] = {}
+        self.current_tick = time.monotonic_ns() // self.tick_ns
+
+    def __setitem__(self, key, value) -> None:
+        """
+        Set or update item. Deadline is calculated since the insertion, updating the objects does not change it
+        """
+        entry = self.data.get(key)
+        if entry is not None:
+            entry[1] = value
+            return
+        self._insert(key, value, self.action_ns)
+
+    def set(self, key, value, timeout: float = None) -> None:
+        """
+        Set item with its own timeout in seconds (action_time by default), existing item is rescheduled
+        """
+        if key in self.data:
+            del self[key]
+        self._insert(key, value, self.action_ns if timeout is None else int(timeout * 1e9))
+
+    def _insert(self, key, value, timeout_ns: int) -> None:
+        deadline = time.monotonic_ns() + timeout_ns
+        tick = max(deadline // self.tick_ns, self.current_tick)
+        slot = tick % len(self.slots)
+        self.slots[slot][key] = None
+        self.data[key] = [deadline, value, slot]
+
+    def __getitem__(self, key) -> Any:
+        return self.data[key][1]
+
+    def __contains__(self, key) -> bool:
+        return key in self.data
+
+    def __delitem__(self, key) -> None:
+        entry = self.data.pop(key)
+        del self.slots[entry[2]][key]
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.data)
+
+    def __repr__(self):
+        return repr({key: entry[1] for key, entry in self.data.items()})
+
+    def pop(self, key, default=None) -> Any:
+        """
+        Remove item and return its value, default if there is no such item
+        """
+        entry = self.data.pop(key, None)
+        if entry is None:
+            return default
+        del self.slots[entry[2]][key]
+        return entry[1]
+
+    def next_timeout(self) -> Optional[float]:
+        """
+        Seconds until the next slot with objects is due, None if the structure is empty
+        """
+        if not self.data:
+            return None
+        slots = self.slots
+        size = len(slots)
+        for offset in range(size):
+            if slots[(self.current_tick + offset) % size]:
+                due = (self.current_tick + offset) * self.tick_ns
+                return max(0.0, (due - time.monotonic_ns()) / 1e9)
+        return None
+
+    def expire(self) -> int:
+        """
+        Remove due objects and call action on them
+        :return: number of expired objects
+        """
+        now = time.monotonic_ns()
+        target_tick = now // self.tick_ns
+        slots = self.slots
+        size = len(slots)
+        expired = []
+        for tick in range(self.current_tick, min(target_tick, self.current_tick + size - 1) + 1):
+            slot = slots[tick % size]
+            if not slot:
+                continue
+            for key in list(slot):
+                entry = self.data[key]
+                if entry[0] <= now:
+                    del slot[key]
+                    del self.data[key]
+                    expired.append((key, entry[1]))
+        self.current_tick = target_tick
+        if self.action:
+            for key, value in expired:
+                self.action(key, value)
+        return len(expired)
+
+    def clear(self) -> None:
+        """
+        Clear all data in the structure
+        """
+        self.data.clear()
+        for slot in self.slots:
+            slot.clear()
+
+    def destroy(self) -> None:
+        """
+        Kept for compatibility with TimeDict, there is no thread to stop
+        """
+        self.clear()
@@ -0,0 +1,284 @@
+import ctypes
+import ctypes.util
+import errno
+import socket
+import struct
+import sys
+from typing import Callable, List, Optional, Tuple
+
+MSG_DONTWAIT = 0x40
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+# control message with the drop counter of the socket: cmsghdr and a 32 bit value
+_CONTROL_SIZE = socket.CMSG_SPACE(4) if hasattr(socket, 'CMSG_SPACE') else 24
+_CMSG_HEADER = struct.Struct('@Nii')
+_DROPS = struct.Struct('@I')
+UNREACHABLE_ERRORS = (errno.EACCES, errno.EPERM, errno.EHOSTUNREACH, errno.EHOSTDOWN, errno.ENETUNREACH)
+""" send errors of one destination, e.g. a broadcast address or a host without a route """
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IoVec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort),
+                ('sin_port', ctypes.c_uint16),
+                ('sin_addr', ctypes.c_uint8 * 4),
+                ('sin_zero', ctypes.c_uint8 * 8)]
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int,
+                                  ctypes.c_void_p]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+class BatchSocket:
+    """
+    Batched I/O over a non-blocking IPv4 socket: queued packets are sent with one sendmmsg call,
+    all waiting packets are received with one recvmmsg call. Packets are copied into preallocated
+    buffers, so queued data may be reused right after queue() returns.
+    Falls back to sendto/recvfrom per packet when sendmmsg/recvmmsg are unavailable or batch_size is 1.
+    Packets dropped by the kernel because the receive queue was full are counted with SO_RXQ_OVFL:
+    the kernel attaches the drop counter of the socket to received packets, only the last packet
+    of a batch is looked at. A packet its destination can not be sent to (UNREACHABLE_ERRORS) is dropped
+    and reported to on_error, the packets after it are still sent
+    """
+    def __init__(self, sock: socket.socket, batch_size: int = 64, buffer_size: int = 2048,
+                 on_error: Optional[Callable[[Tuple[str, int], int], None]] = None):
+        """
+        :param sock: non-blocking AF_INET socket
+        :param batch_size: maximum number of packets per system call
+        :param buffer_size: maximum size of one packet
+        :param on_error: called with the destination and errno of every dropped packet
+        """
+        self.sock = sock
+        self.on_error = on_error
+        self.batch_size = max(1, batch_size)
+        self.buffer_size = buffer_size
+        self.batched = _libc is not None and self.batch_size > 1
+        self.pending: List[Tuple[bytes, Tuple[str, int]]] = []
+        self.queued = 0
+        self.syscalls = 0
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.send_errors = 0
+        self.drops = 0
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            self.track_drops = True
+        except OSError:
+            self.track_drops = False
+        if self.batched:
+            self._send = self._make_vector()
+            self._recv = self._make_vector()
+            # headers filled by the last recvmmsg, the kernel changed their lengths
+            self._received = self.batch_size
+            if self.track_drops:
+                self._controls = ctypes.create_string_buffer(self.batch_size * _CONTROL_SIZE)
+                base = ctypes.addressof(self._controls)
+                for i, header in enumerate(self._recv[3]):
+                    header.msg_hdr.msg_control = base + i * _CONTROL_SIZE
+
+    def _make_vector(self):
+        count, size = self.batch_size, self.buffer_size
+        buffers = ctypes.create_string_buffer(count * size)
+        addresses = (_SockAddrIn * count)()
+        iovecs = (_IoVec * count)()
+        headers = (_MMsgHdr * count)()
+        base = ctypes.addressof(buffers)
+        for i in range(count):
+            iovecs[i].iov_base = base + i * size
+            iovecs[i].iov_len = size
+            header = headers[i].msg_hdr
+            header.msg_name = ctypes.addressof(addresses[i])
+            header.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            header.msg_iov = ctypes.pointer(iovecs[i])
+            header.msg_iovlen = 1
+        return buffers, addresses, iovecs, headers
+
+    @property
+    def free(self) -> int:
+        """
+        Number of packets that can be queued before flush
+        """
+        return self.batch_size - (self.queued if self.batched else len(self.pending))
+
+    def queue(self, data, address: Tuple[str, int]):
+        """
+        Queue packet to be sent by flush()
+        """
+        if len(data) > self.buffer_size:
+            raise ValueError(f'Packet of {len(data)} bytes does not fit into the {self.buffer_size} bytes buffer')
+        if self.free <= 0:
+            raise BlockingIOError(errno.EAGAIN, 'send queue is full')
+        if not self.batched:
+            self.pending.append((bytes(data), address))
+            return
+        buffers, addresses, iovecs, _ = self._send
+        i = self.queued
+        ctypes.memmove(ctypes.addressof(buffers) + i * self.buffer_size, bytes(data), len(data))
+        iovecs[i].iov_len = len(data)
+        addresses[i].sin_family = socket.AF_INET
+        addresses[i].sin_port = socket.htons(address[1])
+        addresses[i].sin_addr[:] = socket.inet_aton(address[0])
+        self.queued += 1
+
+    def flush(self) -> int:
+        """
+        Send queued packets, packets that did not fit into the socket buffer stay queued
+        :return: number of sent packets
+        """
+        if not self.batched:
+            return self._flush_single()
+        _, addresses, _, headers = self._send
+        total = 0
+        while self.queued:
+            self.syscalls += 1
+            sent = _libc.sendmmsg(self.sock.fileno(), headers, self.queued, MSG_DONTWAIT)
+            if sent < 0:
+                code = ctypes.get_errno()
+                if code in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    break
+                if code not in UNREACHABLE_ERRORS:
+                    raise OSError(code, 'sendmmsg: ' + errno.errorcode.get(code, str(code)))
+                # sendmmsg stops at the packet that failed, it is the first queued one
+                address = (socket.inet_ntoa(bytes(addresses[0].sin_addr)), socket.ntohs(addresses[0].sin_port))
+                self._shift(1)
+                self._dropped(address, code)
+                continue
+            # a short count is a full socket buffer or an error of the next packet, the next call tells which
+            self._shift(sent)
+            total += sent
+        self.packets_sent += total
+        return total
+
+    def _shift(self, count: int):
+        """
+        Move packets after the first count queued ones to the beginning of the vector
+        """
+        buffers, addresses, iovecs, _ = self._send
+        left = self.queued - count
+        if left:
+            size = self.buffer_size
+            base = ctypes.addressof(buffers)
+            ctypes.memmove(base, base + count * size, left * size)
+            for i in range(left):
+                iovecs[i].iov_len = iovecs[count + i].iov_len
+                addresses[i] = addresses[count + i]
+        self.queued = left
+
+    def _dropped(self, address: Tuple[str, int], code: int):
+        self.send_errors += 1
+        if self.on_error is not None:
+            self.on_error(address, code)
+
+    def _flush_single(self) -> int:
+        sent = 0
+        done = 0
+        for data, address in self.pending:
+            self.syscalls += 1
+            try:
+                self.sock.sendto(data, address)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno not in UNREACHABLE_ERRORS:
+                    raise
+                self._dropped(address, e.errno)
+            else:
+                sent += 1
+            done += 1
+        del self.pending[:done]
+        self.packets_sent += sent
+        return sent
+
+    def recv(self) -> List[Tuple[bytes, Tuple[str, int]]]:
+        """
+        Receive all waiting packets, at most batch_size
+        :return: list of (data, (host, port))
+        """
+        if not self.batched:
+            return self._recv_single()
+        buffers, addresses, iovecs, headers = self._recv
+        control_size = _CONTROL_SIZE if self.track_drops else 0
+        for i in range(self._received):
+            header = headers[i].msg_hdr
+            header.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            header.msg_controllen = control_size
+        self.syscalls += 1
+        count = _libc.recvmmsg(self.sock.fileno(), headers, self.batch_size, MSG_DONTWAIT, None)
+        if count < 0:
+            self._received = 0
+            code = ctypes.get_errno()
+            if code in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise OSError(code, 'recvmmsg: ' + errno.errorcode.get(code, str(code)))
+        self._received = count
+        if count and self.track_drops and headers[count - 1].msg_hdr.msg_controllen:
+            self._read_drops(ctypes.string_at(ctypes.addressof(self._controls) + (count - 1) * _CONTROL_SIZE,
+                                              _CONTROL_SIZE))
+        packets = []
+        base = ctypes.addressof(buffers)
+        size = self.buffer_size
+        for i in range(count):
+            data = ctypes.string_at(base + i * size, headers[i].msg_len)
+            address = addresses[i]
+            packets.append((data, (socket.inet_ntoa(bytes(address.sin_addr)), socket.ntohs(address.sin_port))))
+        self.packets_received += count
+        return packets
+
+    def _recv_single(self) -> List[Tuple[bytes, Tuple[str, int]]]:
+        packets = []
+        while len(packets) < self.batch_size:
+            self.syscalls += 1
+            try:
+                if self.track_drops:
+                    data, control, _, address = self.sock.recvmsg(self.buffer_size, _CONTROL_SIZE)
+                    for level, kind, value in control:
+                        if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                            self.drops = max(self.drops, _DROPS.unpack(value[:_DROPS.size])[0])
+                    packets.append((data, address))
+                else:
+                    packets.append(self.sock.recvfrom(self.buffer_size))
+            except BlockingIOError:
+                break
+        self.packets_received += len(packets)
+        return packets
+
+    def _read_drops(self, control: bytes):
+        length, level, kind = _CMSG_HEADER.unpack_from(control)
+        if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and length >= _CMSG_HEADER.size + _DROPS.size:
+            self.drops = max(self.drops, _DROPS.unpack_from(control, _CMSG_HEADER.size)[0])
+
+    def dropped(self) -> int:
+        """
+        Packets dropped by the kernel from the receive queue, as reported with the received packets
+        """
+        return self.drops
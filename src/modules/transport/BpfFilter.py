@@ -0,0 +1,226 @@
+import ctypes
+import socket
+from typing import List, Tuple, Union, Dict, Optional
+
+"""
+Classic BPF programs attached with SO_ATTACH_FILTER, so that only replies to the scan reach Python.
+
+TCP program (offsets are relative to the IP header, +14 on AF_PACKET sockets):
+
+    ldb  [9]                ; protocol
+    jeq  #6, next, drop
+    ld   [12]               ; source address
+    jge  #start0, next, range1      (one pair of jumps for every target interval)
+    jgt  #end0, range1, src_ok
+    ...
+    ldxb 4 * ([0] & 0xf)    ; IP header length
+    ldh  [x + 2]            ; destination port
+    jge  #port_min, next, drop
+    jgt  #port_max, drop, next
+    ldb  [x + 13]           ; flags
+    jset #RST, accept, next
+    and  #(SYN | ACK)
+    jeq  #(SYN | ACK), accept, drop
+"""
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+MAX_INTERVALS = 100
+
+BPF_LD_W_ABS = 0x20
+BPF_LD_H_ABS = 0x28
+BPF_LD_B_ABS = 0x30
+BPF_LDX_B_MSH = 0xb1
+BPF_LD_H_IND = 0x48
+BPF_LD_B_IND = 0x50
+BPF_JEQ_K = 0x15
+BPF_JGT_K = 0x25
+BPF_JGE_K = 0x35
+BPF_JSET_K = 0x45
+BPF_AND_K = 0x54
+BPF_RET_K = 0x06
+
+ACCEPT = 0x40000
+IPPROTO_TCP = 6
+IPPROTO_ICMP = 1
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACHABLE = 3
+TCP_SYN_ACK = 0x12
+TCP_RST = 0x04
+
+Label = Union[int, str]
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_uint16),
+                ('jt', ctypes.c_uint8),
+                ('jf', ctypes.c_uint8),
+                ('k', ctypes.c_uint32)]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [('len', ctypes.c_ushort),
+                ('filter', ctypes.POINTER(_SockFilter))]
+
+
+class BpfProgram:
+    """
+    Tiny classic BPF assembler: jump targets are labels resolved to relative offsets by assemble()
+    """
+    def __init__(self):
+        self.code: List[Tuple[int, Label, Label, int]] = []
+        self.labels: Dict[str, int] = {}
+
+    def label(self, name: str):
+        self.labels[name] = len(self.code)
+
+    def op(self, code: int, k: int = 0):
+        self.code.append((code, 0, 0, k))
+
+    def jump(self, code: int, k: int, jt: Label, jf: Label):
+        """ Conditional jump, label 0 is the next instruction """
+        self.code.append((code, jt, jf, k))
+
+    def assemble(self) -> List[Tuple[int, int, int, int]]:
+        program = []
+        for index, (code, jt, jf, k) in enumerate(self.code):
+            offsets = []
+            for target in (jt, jf):
+                offset = 0 if target == 0 else self.labels[target] - index - 1
+                if not 0 <= offset <= 255:
+                    raise ValueError('BPF jump is too long')
+                offsets.append(offset)
+            program.append((code, offsets[0], offsets[1], k))
+        return program
+
+
+def _source_check(program: BpfProgram, base: int, intervals: List[Tuple[int, int]]):
+    """
+    Jump to 'drop' unless source address is inside one of intervals
+    """
+    if len(intervals) > MAX_INTERVALS:
+        # too many jumps for 8 bit offsets, check the covering range instead
+        intervals = [(intervals[0][0], intervals[-1][1])]
+    program.op(BPF_LD_W_ABS, base + 12)
+    for i, (start, end) in enumerate(intervals):
+        next_interval = f'interval{i + 1}' if i + 1 < len(intervals) else 'drop'
+        program.jump(BPF_JGE_K, start, 0, next_interval)
+        program.jump(BPF_JGT_K, end, next_interval, 'source_ok')
+        if i + 1 < len(intervals):
+            program.label(next_interval)
+    program.label('source_ok')
+
+
+def tcp_reply_filter(intervals: List[Tuple[int, int]], ports: Tuple[int, int],
+                     base: int = 0) -> List[Tuple[int, int, int, int]]:
+    """
+    Accept tcp SYN-ACK or RST from target intervals to destination ports in [ports[0], ports[1]]
+    :param base: offset of IP header in the packet
+    """
+    program = BpfProgram()
+    program.op(BPF_LD_B_ABS, base + 9)
+    program.jump(BPF_JEQ_K, IPPROTO_TCP, 0, 'drop')
+    _source_check(program, base, intervals)
+    program.op(BPF_LDX_B_MSH, base)
+    program.op(BPF_LD_H_IND, base + 2)
+    program.jump(BPF_JGE_K, ports[0], 0, 'drop')
+    program.jump(BPF_JGT_K, ports[1], 'drop', 0)
+    program.op(BPF_LD_B_IND, base + 13)
+    program.jump(BPF_JSET_K, TCP_RST, 'accept', 0)
+    program.op(BPF_AND_K, TCP_SYN_ACK)
+    program.jump(BPF_JEQ_K, TCP_SYN_ACK, 'accept', 'drop')
+    program.label('accept')
+    program.op(BPF_RET_K, ACCEPT)
+    program.label('drop')
+    program.op(BPF_RET_K, 0)
+    return program.assemble()
+
+
+def icmp_unreachable_filter(intervals: List[Tuple[int, int]], base: int = 0) -> List[Tuple[int, int, int, int]]:
+    """
+    Accept ICMP destination unreachable from target intervals
+    """
+    program = BpfProgram()
+    program.op(BPF_LD_B_ABS, base + 9)
+    program.jump(BPF_JEQ_K, IPPROTO_ICMP, 0, 'drop')
+    _source_check(program, base, intervals)
+    program.op(BPF_LDX_B_MSH, base)
+    program.op(BPF_LD_B_IND, base)
+    program.jump(BPF_JEQ_K, ICMP_DEST_UNREACHABLE, 'accept', 'drop')
+    program.label('accept')
+    program.op(BPF_RET_K, ACCEPT)
+    program.label('drop')
+    program.op(BPF_RET_K, 0)
+    return program.assemble()
+
+
+def icmp_echo_reply_filter(intervals: List[Tuple[int, int]], identifier: int,
+                           base: int = 0) -> List[Tuple[int, int, int, int]]:
+    """
+    Accept ICMP echo replies with identifier from target intervals
+    """
+    program = BpfProgram()
+    program.op(BPF_LD_B_ABS, base + 9)
+    program.jump(BPF_JEQ_K, IPPROTO_ICMP, 0, 'drop')
+    _source_check(program, base, intervals)
+    program.op(BPF_LDX_B_MSH, base)
+    program.op(BPF_LD_B_IND, base)
+    program.jump(BPF_JEQ_K, ICMP_ECHO_REPLY, 0, 'drop')
+    program.op(BPF_LD_H_IND, base + 4)
+    program.jump(BPF_JEQ_K, identifier, 'accept', 'drop')
+    program.label('accept')
+    program.op(BPF_RET_K, ACCEPT)
+    program.label('drop')
+    program.op(BPF_RET_K, 0)
+    return program.assemble()
+
+
+def attach_filter(sock: socket.socket, program: List[Tuple[int, int, int, int]]) -> bool:
+    """
+    Attach (or replace) socket filter
+    :return: False if the platform does not support socket filters
+    """
+    instructions = (_SockFilter * len(program))(*program)
+    fprog = _SockFprog(len(program), instructions)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, bytes(fprog))
+    except OSError:
+        return False
+    return True
+
+
+def _read_snmp() -> Dict[str, Dict[str, int]]:
+    counters = {}
+    with open('/proc/net/snmp') as snmp:
+        lines = snmp.read().splitlines()
+    for names, values in zip(lines[::2], lines[1::2]):
+        group, names = names.split(':', 1)
+        counters[group] = dict(zip(names.split(), map(int, values.split(':', 1)[1].split())))
+    return counters
+
+
+class KernelCounter:
+    """
+    Packets of one protocol received by the host since creation (/proc/net/snmp), used to tell how
+    many packets the kernel filter dropped: received by host - delivered to the scanner
+    """
+    FIELDS = {IPPROTO_TCP: ('Tcp', 'InSegs'), IPPROTO_ICMP: ('Icmp', 'InMsgs')}
+
+    def __init__(self, protocol: int):
+        self.group, self.field = self.FIELDS[protocol]
+        self.start = self._value()
+
+    def _value(self) -> Optional[int]:
+        try:
+            return _read_snmp()[self.group][self.field]
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def received(self) -> Optional[int]:
+        """
+        Packets received by the host since creation, None if the counter is unavailable
+        """
+        value = self._value()
+        if value is None or self.start is None:
+            return None
+        return value - self.start
@@ -0,0 +1,364 @@
+import errno
+import itertools
+import mmap
+import os
+import socket
+import struct
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Tuple, Optional
+from src.modules.structures.LruDict import LruDict
+from src.modules.transport.Routes import SIOCGIFADDR, interface_ioctl, next_hop
+
+"""
+AF_PACKET transport with TPACKET_V3 RX and TX rings (PACKET_MMAP).
+
+RX ring is a sequence of blocks filled by the kernel, every block holds several frames:
+
+   +----------------------+---------------------+------+---------------------+------+---
+   | tpacket_block_desc   | tpacket3_hdr        | data | tpacket3_hdr        | data | ...
+   | status, num_pkts,    | next_offset, snaplen,      | (tp_next_offset = 0 |
+   | offset_to_first_pkt  | status, tp_mac, tp_net     |  for the last one)  |
+   +----------------------+---------------------+------+---------------------+------+---
+
+TX ring is a sequence of fixed size frames: tpacket3_hdr (tp_len, tp_status) and ethernet frame
+at offset TPACKET_ALIGN(sizeof(tpacket3_hdr)). Frames marked TP_STATUS_SEND_REQUEST are sent
+by one send() call.
+
+Neighbors are resolved without blocking: a frame to a next hop missing from the neighbor table waits
+while the kernel resolves it, the table is polled from flush(). Frames to a next hop that is not
+resolved in time are dropped and reported to on_error.
+
+Example of a test setup with a veth pair and a network namespace:
+    ip netns add scan
+    ip link add veth0 type veth peer name veth1
+    ip link set veth1 netns scan
+    ip addr add 10.10.0.1/24 dev veth0 && ip link set veth0 up
+    ip netns exec scan ip addr add 10.10.0.2/24 dev veth1
+    ip netns exec scan ip link set veth1 up
+    ip netns exec scan python3 -m http.server 8080 &
+    sudo python3 portscanner.py 10.10.0.2 tcp/8000-8100 --transport packet --interface veth0
+"""
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+PACKET_TX_RING = 13
+PACKET_IGNORE_OUTGOING = 23
+TPACKET_V3 = 2
+ETH_P_IP = 0x0800
+PACKET_OUTGOING = 4
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+TP_STATUS_AVAILABLE = 0
+TP_STATUS_SEND_REQUEST = 1
+TP_STATUS_SENDING = 2
+TP_STATUS_WRONG_FORMAT = 4
+
+SIOCGIFHWADDR = 0x8927
+NEIGHBOR_TABLE = '/proc/net/arp'
+ATF_COM = 0x2
+MAX_NEIGHBORS = 65536
+NEIGHBOR_POLL_INTERVAL = 0.01
+
+_TPACKET_REQ3 = struct.Struct('IIIIIII')
+_BLOCK_HEADER = struct.Struct('IIIII')  # version, offset_to_priv, block_status, num_pkts, offset_to_first_pkt
+_FRAME_HEADER = struct.Struct('IIIIIIHH')  # next_offset, sec, nsec, snaplen, len, status, mac, net
+_TX_STATUS = struct.Struct('I')
+_STATISTICS = struct.Struct('III')  # tp_packets, tp_drops, tp_freeze_q_cnt
+_TX_HEADER_LEN = 48  # TPACKET_ALIGN(sizeof(struct tpacket3_hdr))
+_SLL_PKTTYPE_OFFSET = _TX_HEADER_LEN + 10
+_IP_HEADER = struct.Struct('!BBHHHBBH4s4s')
+_ETH_HEADER = struct.Struct('!6s6sH')
+_UNRESOLVED = object()
+
+
+def interface_address(interface: str) -> Tuple[str, bytes]:
+    """
+    IPv4 address and MAC address of interface
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        ip = socket.inet_ntoa(interface_ioctl(sock, SIOCGIFADDR, interface)[20:24])
+        mac = interface_ioctl(sock, SIOCGIFHWADDR, interface)[18:24]
+    return ip, mac
+
+
+def read_neighbors(interface: str, path: str = NEIGHBOR_TABLE) -> Dict[str, bytes]:
+    """
+    MAC addresses of resolved neighbors on interface by IP
+    """
+    neighbors = {}
+    with open(path) as table:
+        for line in itertools.islice(table, 1, None):
+            fields = line.split()
+            if len(fields) >= 6 and fields[5] == interface and int(fields[2], 16) & ATF_COM:
+                neighbors[fields[0]] = bytes.fromhex(fields[3].replace(':', ''))
+    return neighbors
+
+
+def ip_checksum(header: bytes) -> int:
+    """
+    Internet checksum of IPv4 header
+    """
+    total = sum(struct.unpack(f'!{len(header) // 2}H', header))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+class PacketRing:
+    """
+    Zero-copy transport for one IP protocol over AF_PACKET rings.
+    Has the same interface as BatchSocket: queue() writes ethernet + IPv4 headers and the given
+    transport segment straight into the TX ring, flush() sends all queued frames with one system call,
+    recv() returns IP packets as memoryviews into the RX ring, valid until the next recv() call
+    """
+    def __init__(self, interface: str, protocol: int, block_size: int = 1 << 20, block_count: int = 8,
+                 frame_size: int = 2048, tx_frames: int = 1024, block_timeout_ms: int = 10,
+                 batch_size: int = 64, neighbor_timeout: float = 1.0,
+                 on_error: Optional[Callable[[Tuple[str, int], int], None]] = None):
+        """
+        :param interface: network interface to send and receive on
+        :param protocol: IP protocol of sent segments and received packets, e.g. socket.IPPROTO_TCP
+        :param block_size: RX ring block size, multiple of page size
+        :param block_count: number of RX ring blocks
+        :param frame_size: maximum frame size
+        :param tx_frames: number of TX ring frames
+        :param block_timeout_ms: time after which the kernel retires a partly filled RX block
+        :param batch_size: maximum number of frames per flush
+        :param neighbor_timeout: seconds to wait for a next hop to be resolved
+        :param on_error: called with the destination and errno of every frame dropped for an unresolved next hop
+        """
+        self.interface = interface
+        self.protocol = protocol
+        self.source_ip, self.source_mac = interface_address(interface)
+        self.source = socket.inet_aton(self.source_ip)
+        self.neighbor_timeout = neighbor_timeout
+        self.on_error = on_error
+        self.macs = LruDict(MAX_NEIGHBORS)
+        """ next hop -> MAC address, None if it was not resolved in time """
+        self.resolving: Dict[str, Tuple[float, List[Tuple[bytes, Tuple[str, int]]]]] = {}
+        """ next hop -> (deadline, frames waiting for it) """
+        self.resolved: Deque[Tuple[bytes, Tuple[str, int], bytes]] = deque()
+        """ frames whose next hop was resolved, waiting for a free TX frame """
+        self.next_poll = 0.0
+        self.trigger = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.trigger.setblocking(False)
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_IP))
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        try:
+            self.sock.setsockopt(SOL_PACKET, PACKET_IGNORE_OUTGOING, 1)
+        except OSError:
+            pass
+
+        self.block_size = block_size
+        self.block_count = block_count
+        self.frame_size = frame_size
+        self.tx_frames = tx_frames
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, _TPACKET_REQ3.pack(
+            block_size, block_count, frame_size, block_size * block_count // frame_size, block_timeout_ms, 0, 0))
+        tx_block_size = max(mmap.PAGESIZE, frame_size)
+        tx_blocks = tx_frames * frame_size // tx_block_size
+        self.sock.setsockopt(SOL_PACKET, PACKET_TX_RING, _TPACKET_REQ3.pack(
+            tx_block_size, tx_blocks, frame_size, tx_frames, 0, 0, 0))
+        self.rx_size = block_size * block_count
+        self.ring = mmap.mmap(self.sock.fileno(), self.rx_size + tx_frames * frame_size,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.view = memoryview(self.ring)
+        self.sock.bind((interface, ETH_P_IP))
+        self.sock.setblocking(False)
+
+        self.rx_block = 0
+        self.held_block: Optional[int] = None
+        self.tx_head = 0
+        self.queued = 0
+        self.ip_id = 0
+        self.batch_size = min(batch_size, tx_frames)
+        self.syscalls = 0
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.send_errors = 0
+        self.drops = 0
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def _resolve(self, hop: str, data: bytes, address: Tuple[str, int]):
+        """
+        Keep frame to address until hop is resolved, the first frame to a hop starts the resolution
+        """
+        waiting = self.resolving.get(hop)
+        if waiting is None:
+            deadline = time.perf_counter() + self.neighbor_timeout
+            try:
+                # the kernel resolves the neighbor to send the datagram
+                self.trigger.sendto(b'', (hop, 9))
+            except OSError:
+                # a broadcast address or no route, it is not going to be resolved
+                deadline = 0.0
+            waiting = self.resolving[hop] = (deadline, [])
+            self.next_poll = 0.0
+        waiting[1].append((data, address))
+
+    def _poll_neighbors(self):
+        """
+        Move frames of resolved next hops to the resolved queue, drop frames of next hops past their deadline
+        """
+        now = time.perf_counter()
+        if now < self.next_poll:
+            return
+        self.next_poll = now + NEIGHBOR_POLL_INTERVAL
+        neighbors = read_neighbors(self.interface)
+        for hop in list(self.resolving):
+            deadline, frames = self.resolving[hop]
+            mac = neighbors.get(hop)
+            if mac is None and now < deadline:
+                continue
+            del self.resolving[hop]
+            self.macs[hop] = mac
+            for data, address in frames:
+                if mac is None:
+                    self._dropped(address, errno.EHOSTUNREACH)
+                else:
+                    self.resolved.append((data, address, mac))
+
+    def _dropped(self, address: Tuple[str, int], code: int):
+        self.send_errors += 1
+        if self.on_error is not None:
+            self.on_error(address, code)
+
+    def next_timeout(self) -> Optional[float]:
+        """
+        Time until frames waiting for their next hop should be looked at by flush(), None if there are none
+        """
+        if self.resolved:
+            return 0.0
+        if not self.resolving:
+            return None
+        return max(0.0, self.next_poll - time.perf_counter())
+
+    def _tx_offset(self, frame: int) -> int:
+        return self.rx_size + frame * self.frame_size
+
+    @property
+    def free(self) -> int:
+        """
+        Number of frames that can be queued before flush, 0 while the next TX frame is still in use
+        """
+        frame = (self.tx_head + self.queued) % self.tx_frames
+        status = _TX_STATUS.unpack_from(self.ring, self._tx_offset(frame) + 20)[0]
+        if status & (TP_STATUS_SEND_REQUEST | TP_STATUS_SENDING):
+            return 0
+        return self.batch_size - self.queued
+
+    def queue(self, data, address: Tuple[str, int]):
+        """
+        Write ethernet frame with IPv4 header and segment data to (ip, port) into the TX ring,
+        frames to a next hop that is not resolved yet wait for it
+        """
+        if self.free <= 0:
+            raise BlockingIOError('TX ring is full')
+        hop = next_hop(address[0], self.interface)
+        mac = self.macs.get(hop, _UNRESOLVED)
+        if mac is _UNRESOLVED:
+            self._resolve(hop, bytes(data), address)
+        elif mac is None:
+            self._dropped(address, errno.EHOSTUNREACH)
+        else:
+            self._write(data, address, mac)
+
+    def _write(self, data, address: Tuple[str, int], mac: bytes):
+        frame = (self.tx_head + self.queued) % self.tx_frames
+        offset = self._tx_offset(frame)
+        ring = self.ring
+        data_offset = offset + _TX_HEADER_LEN
+        length = 20 + len(data)
+        self.ip_id = (self.ip_id + 1) & 0xffff
+        _ETH_HEADER.pack_into(ring, data_offset, mac, self.source_mac, ETH_P_IP)
+        ip_offset = data_offset + _ETH_HEADER.size
+        destination = socket.inet_aton(address[0])
+        _IP_HEADER.pack_into(ring, ip_offset, 0x45, 0, length, self.ip_id, 0x4000, 64, self.protocol, 0,
+                             self.source, destination)
+        struct.pack_into('!H', ring, ip_offset + 10, ip_checksum(ring[ip_offset:ip_offset + 20]))
+        ring[ip_offset + 20:ip_offset + length] = bytes(data)
+        # tp_len, then tp_status last, so the kernel never sees a half written frame
+        struct.pack_into('I', ring, offset + 16, _ETH_HEADER.size + length)
+        _TX_STATUS.pack_into(ring, offset + 20, TP_STATUS_SEND_REQUEST)
+        self.queued += 1
+
+    def flush(self) -> int:
+        """
+        Send all queued frames with one system call, frames whose next hop was resolved since go first
+        :return: number of sent frames
+        """
+        if self.resolving:
+            self._poll_neighbors()
+        while self.resolved and self.free > 0:
+            self._write(*self.resolved.popleft())
+        if self.queued == 0:
+            return 0
+        self.syscalls += 1
+        try:
+            self.sock.send(b'', socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            pass
+        sent = self.queued
+        self.tx_head = (self.tx_head + sent) % self.tx_frames
+        self.queued = 0
+        self.packets_sent += sent
+        return sent
+
+    def _release(self):
+        if self.held_block is not None:
+            struct.pack_into('I', self.ring, self.held_block * self.block_size + 8, TP_STATUS_KERNEL)
+            self.held_block = None
+
+    def recv(self) -> List[Tuple[memoryview, Tuple[str, int]]]:
+        """
+        Packets of one filled RX block, the previous block is given back to the kernel
+        :return: list of (IP packet, (source ip, 0))
+        """
+        self._release()
+        offset = self.rx_block * self.block_size
+        _, _, status, count, first = _BLOCK_HEADER.unpack_from(self.ring, offset)
+        if not status & TP_STATUS_USER:
+            return []
+        packets = []
+        view = self.view
+        frame = offset + first
+        for _ in range(count):
+            next_offset, _, _, snaplen, _, _, mac, net = _FRAME_HEADER.unpack_from(self.ring, frame)
+            if self.ring[frame + _SLL_PKTTYPE_OFFSET] != PACKET_OUTGOING:
+                start = frame + net
+                packet = view[start:start + snaplen - (net - mac)]
+                if len(packet) >= 20 and packet[9] == self.protocol:
+                    packets.append((packet, (socket.inet_ntoa(bytes(packet[12:16])), 0)))
+            frame += next_offset
+        self.held_block = self.rx_block
+        self.rx_block = (self.rx_block + 1) % self.block_count
+        self.packets_received += len(packets)
+        return packets
+
+    def dropped(self) -> int:
+        """
+        Frames dropped by the kernel because the RX ring was full, the kernel counter is reset on every read
+        """
+        try:
+            _, drops, _ = _STATISTICS.unpack(self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, _STATISTICS.size))
+            self.drops += drops
+        except OSError:
+            pass
+        return self.drops
+
+    def close(self):
+        self._release()
+        self.trigger.close()
+        self.sock.close()
+        try:
+            self.view.release()
+            self.ring.close()
+        except BufferError:
+            # packets returned by recv() are still referenced, the ring is unmapped when they are gone
+            pass
@@ -0,0 +1,131 @@
+import fcntl
+import itertools
+import socket
+import struct
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+
+"""
+IPv4 routing table of the kernel from /proc/net/route, read once per process.
+Source addresses are chosen like the kernel does for a connected socket without a bound address:
+the most specific route to the target, lowest metric first, gives the interface, and the address
+of the interface is the source. Nothing is sent and no name is resolved
+"""
+
+ROUTE_TABLE = '/proc/net/route'
+SIOCGIFADDR = 0x8915
+RTF_UP = 0x1
+LOOPBACK_INTERFACE = 'lo'
+
+_ADDRESS = struct.Struct('=I')  # addresses in /proc/net/route are network order read as a host integer
+
+
+class Route(NamedTuple):
+    destination: int
+    mask: int
+    gateway: int
+    interface: str
+    metric: int
+
+    @property
+    def prefix(self) -> int:
+        return bin(self.mask).count('1')
+
+
+def interface_ioctl(sock: socket.socket, request: int, interface: str) -> bytes:
+    return fcntl.ioctl(sock.fileno(), request, struct.pack('256s', interface.encode()[:15]))
+
+
+def _to_int(ip: str) -> int:
+    return _ADDRESS.unpack(socket.inet_aton(ip))[0]
+
+
+def _to_ip(value: int) -> str:
+    return socket.inet_ntoa(_ADDRESS.pack(value))
+
+
+def read_routes(path: str = ROUTE_TABLE) -> List[Route]:
+    """
+    Routes that are up, most specific first, then by metric
+    """
+    routes = []
+    with open(path) as table:
+        for line in itertools.islice(table, 1, None):
+            fields = line.split()
+            if len(fields) < 8 or not int(fields[3], 16) & RTF_UP:
+                continue
+            destination, gateway, mask = (int(fields[i], 16) for i in (1, 2, 7))
+            routes.append(Route(destination, mask, gateway, fields[0], int(fields[6])))
+    routes.sort(key=lambda route: (-route.prefix, route.metric))
+    return routes
+
+
+@lru_cache(maxsize=None)
+def routes() -> List[Route]:
+    """
+    Routing table of the process, empty when it can not be read
+    """
+    try:
+        return read_routes()
+    except OSError:
+        return []
+
+
+def lookup(ip: str, interface: str = None) -> Optional[Route]:
+    """
+    Route the kernel takes to ip, only routes through interface if it is given
+    """
+    target = _to_int(ip)
+    for route in routes():
+        if target & route.mask == route.destination and interface in (None, route.interface):
+            return route
+    return None
+
+
+def next_hop(ip: str, interface: str) -> str:
+    """
+    Gateway for ip on interface, ip itself if it is on link
+    """
+    route = lookup(ip, interface)
+    return _to_ip(route.gateway) if route is not None and route.gateway else ip
+
+
+@lru_cache(maxsize=None)
+def interface_ip(interface: str) -> Optional[str]:
+    """
+    IPv4 address of interface, None if it has none
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            return socket.inet_ntoa(interface_ioctl(sock, SIOCGIFADDR, interface)[20:24])
+        except OSError:
+            return None
+
+
+def source_address(ip: str) -> str:
+    """
+    Local address of packets to ip. Nothing is kept per target: the route is looked up every time
+    and only addresses of interfaces are cached, so a scan of many hosts does not grow the memory
+    """
+    # loopback and other local routes are in the local table, which /proc/net/route does not show
+    if ip.startswith('127.'):
+        interface = LOOPBACK_INTERFACE
+    else:
+        route = lookup(ip)
+        interface = route.interface if route is not None else None
+    source = interface_ip(interface) if interface is not None else None
+    return source if source is not None else _connected_address(ip)
+
+
+@lru_cache(maxsize=4096)
+def _connected_address(ip: str) -> str:
+    """
+    Address the kernel picks for a udp socket connected to ip, used without /proc/net/route.
+    connect() of a udp socket only looks up the route, no packet is sent
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect((ip, 9))
+            return sock.getsockname()[0]
+        except OSError:
+            return '0.0.0.0'
@@ -0,0 +1,189 @@
+import asyncio
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.modules.structures.TargetSet import TargetSet
+from src.modules.transport.BatchSocket import BatchSocket
+from src.modules.transport.BpfFilter import attach_filter
+
+FilterFactory = Callable[[List[Tuple[int, int]]], List[Tuple[int, int, int, int]]]
+# scans of at most this many hosts are indexed by address, larger ones are checked by range
+INDEXED_HOSTS = 256
+
+
+class SharedSocket:
+    """
+    Non-blocking socket of an event loop shared by concurrent scanners.
+    Received packets are demultiplexed to the scanners by source address,
+    the kernel filter passes packets from the union of scanner targets
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, sock: socket.socket, batch_size: int = 64,
+                 make_filter: FilterFactory = None):
+        """
+        :param loop: event loop of the socket
+        :param sock: socket, it is switched to non-blocking mode
+        :param batch_size: maximum number of packets per system call
+        :param make_filter: builds kernel filter program from target intervals
+        """
+        self.loop = loop
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.batch = BatchSocket(sock, batch_size)
+        self.make_filter = make_filter
+        self.scanners: Dict[Any, Optional[Callable[[], None]]] = {}
+        self.hosts: Dict[str, List[Any]] = {}
+        self.ranges: List[Any] = []
+        self.writers: Dict[Any, Callable[[], bool]] = {}
+        loop.add_reader(sock.fileno(), self._on_readable)
+
+    def add(self, scanner):
+        """
+        Deliver packets from scanner targets to scanner.handle_package
+        """
+        self.scanners[scanner] = None
+        if len(scanner.targets) <= INDEXED_HOSTS:
+            for ip in scanner.targets:
+                self.hosts.setdefault(ip, []).append(scanner)
+        else:
+            self.ranges.append(scanner)
+
+    def remove(self, scanner) -> bool:
+        """
+        Stop delivering packets to scanner
+        :return: True if no scanners are left
+        """
+        if scanner not in self.scanners:
+            return not self.scanners
+        del self.scanners[scanner]
+        if scanner in self.ranges:
+            self.ranges.remove(scanner)
+        else:
+            for ip in scanner.targets:
+                receivers = self.hosts[ip]
+                receivers.remove(scanner)
+                if not receivers:
+                    del self.hosts[ip]
+        self.stop_writing(scanner)
+        if self.scanners:
+            self.update_filter()
+        return not self.scanners
+
+    def watch(self, scanner, callback: Callable[[], None]):
+        """
+        Call callback after packets were delivered to scanner
+        """
+        self.scanners[scanner] = callback
+
+    def update_filter(self) -> bool:
+        """
+        Attach kernel filter for the targets of all scanners
+        :return: False if there is no filter
+        """
+        if self.make_filter is None or not self.scanners:
+            return False
+        targets = TargetSet()
+        for scanner in self.scanners:
+            targets = targets.union(scanner.targets)
+        return attach_filter(self.sock, self.make_filter(targets.intervals))
+
+    def want_write(self, scanner, send: Callable[[], bool]):
+        """
+        Call send when the socket is writable until it returns False
+        """
+        if not self.writers:
+            self.loop.add_writer(self.sock.fileno(), self._on_writable)
+        self.writers[scanner] = send
+
+    def stop_writing(self, scanner):
+        if self.writers.pop(scanner, None) is not None and not self.writers:
+            self.loop.remove_writer(self.sock.fileno())
+
+    def _on_writable(self):
+        for scanner, send in list(self.writers.items()):
+            if scanner in self.writers and not send():
+                self.stop_writing(scanner)
+
+    def _on_readable(self):
+        packages = self.batch.recv()
+        finish = time.perf_counter()
+        receivers = {}
+        for data, address in packages:
+            for scanner in self.hosts.get(address[0], ()):
+                scanner.handle_package(self.sock, data, address, finish)
+                receivers[scanner] = True
+            for scanner in self.ranges:
+                if address[0] in scanner.targets:
+                    scanner.handle_package(self.sock, data, address, finish)
+                    receivers[scanner] = True
+        for scanner in receivers:
+            callback = self.scanners.get(scanner)
+            if callback is not None:
+                callback()
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        if self.writers:
+            self.loop.remove_writer(self.sock.fileno())
+        self.sock.close()
+
+
+class SocketPool:
+    """
+    Shared sockets of one event loop by kind ('tcp', 'udp', 'icmp'). A socket is opened by the
+    first scanner that acquires it and closed when the last one releases it
+    """
+    _pools: Dict[asyncio.AbstractEventLoop, 'SocketPool'] = {}
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, batch_size: int = 64):
+        self.loop = loop
+        self.batch_size = batch_size
+        self.sockets: Dict[str, SharedSocket] = {}
+        self.by_socket: Dict[socket.socket, SharedSocket] = {}
+
+    @classmethod
+    def for_loop(cls, loop: asyncio.AbstractEventLoop = None, batch_size: int = 64) -> 'SocketPool':
+        """
+        Pool of the running event loop
+        """
+        loop = loop or asyncio.get_running_loop()
+        pool = cls._pools.get(loop)
+        if pool is None:
+            pool = cls._pools[loop] = cls(loop, batch_size)
+        return pool
+
+    def acquire(self, scanner, kind: str, create: Callable[[], socket.socket],
+                make_filter: FilterFactory = None) -> socket.socket:
+        """
+        Shared socket of kind for scanner, it is opened by create if there is none
+        """
+        shared = self.sockets.get(kind)
+        if shared is None:
+            shared = SharedSocket(self.loop, create(), self.batch_size, make_filter)
+            self.sockets[kind] = shared
+            self.by_socket[shared.sock] = shared
+        shared.add(scanner)
+        scanner.batches[shared.sock] = shared.batch
+        return shared.sock
+
+    def shared(self, sock: socket.socket) -> SharedSocket:
+        return self.by_socket[sock]
+
+    def watch(self, scanner, callback: Callable[[], None]):
+        """
+        Call callback after packets were delivered to scanner on any of its sockets
+        """
+        for shared in self.sockets.values():
+            if scanner in shared.scanners:
+                shared.watch(scanner, callback)
+
+    def release(self, scanner):
+        """
+        Remove scanner from its sockets, sockets without scanners are closed
+        """
+        for kind, shared in list(self.sockets.items()):
+            if scanner in shared.scanners and shared.remove(scanner):
+                shared.close()
+                del self.sockets[kind]
+                del self.by_socket[shared.sock]
+        if not self.sockets:
+            SocketPool._pools.pop(self.loop, None)
@@ -0,0 +1,49 @@
+import errno
+import socket
+
+import pytest
+
+from src.modules.transport import BatchSocket as batch_module
+from src.modules.transport.BatchSocket import BatchSocket
+
+BROADCAST = ('255.255.255.255', 9)
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(1.0)
+    yield sock
+    sock.close()
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_failed_destination_is_reported_and_others_are_sent(receiver, batch_size):
+    # without SO_BROADCAST the kernel refuses packets to a broadcast address with EACCES
+    errors = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        batch = BatchSocket(sock, batch_size, 64, on_error=lambda address, code: errors.append((address, code)))
+        target = receiver.getsockname()
+        for data, address in [(b'a', target), (b'b', BROADCAST), (b'c', target)]:
+            if batch.free == 0:
+                batch.flush()
+            batch.queue(data, address)
+        batch.flush()
+        assert errors == [(BROADCAST, errno.EACCES)]
+        assert batch.send_errors == 1
+        assert batch.packets_sent == 2
+        assert batch.free == batch.batch_size
+    assert [receiver.recv(64), receiver.recv(64)] == [b'a', b'c']
+
+
+def test_other_send_errors_are_raised(monkeypatch):
+    monkeypatch.setattr(batch_module, 'UNREACHABLE_ERRORS', ())
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        batch = BatchSocket(sock, 8, 64)
+        batch.queue(b'b', BROADCAST)
+        with pytest.raises(OSError):
+            batch.flush()
+
@@ -0,0 +1,140 @@
+import dataclasses
+import json
+import os
+import selectors
+import socket
+import threading
+
+import pytest
+
+from src.modules.console.DataArguments import DataArguments
+from src.modules.scanners.Checkpoint import Checkpoint, args_from_dict, args_to_dict
+from src.modules.scanners.ParallelScan import scan_events_parallel
+from src.modules.scanners.ScanEvent import ScanEvent, OPEN, CLOSED, FILTERED
+from src.modules.structures.PortSet import PortSet
+from src.modules.structures.TargetSet import TargetSet
+
+PROGRESS = {'udp': {'position': 12, 'pending': [['10.0.0.1', 53]]}}
+
+
+def _args(**changes) -> DataArguments:
+    args = DataArguments(TargetSet.parse(['10.0.0.0/30', '10.0.1.7']), {'udp': PortSet.parse('53,100-200')},
+                         0.5, False, False, 1, seed=1234)
+    return dataclasses.replace(args, **changes)
+
+
+def _event(port: int, state: str = OPEN) -> ScanEvent:
+    return ScanEvent('udp', '10.0.0.1', port, state, 3)
+
+
+def test_args_round_trip():
+    args = _args(rate=100.0, retries=2, checkpoint='scan.ckpt')
+    restored = args_from_dict(json.loads(json.dumps(args_to_dict(args))))
+    assert restored.targets.intervals == args.targets.intervals
+    assert restored.ports['udp'].intervals == args.ports['udp'].intervals
+    assert dataclasses.replace(restored, targets=args.targets, ports=args.ports) == args
+
+
+def test_save_and_restore(tmp_path):
+    path = str(tmp_path / 'scan.ckpt')
+    checkpoint = Checkpoint(path, _args())
+    checkpoint.open()
+    checkpoint.record(_event(53))
+    checkpoint.record(_event(54, CLOSED))
+    checkpoint.record(_event(55, FILTERED))
+    checkpoint.update(0, PROGRESS)
+    checkpoint.close()
+    # the temporary file was renamed over the checkpoint
+    assert sorted(os.listdir(tmp_path)) == ['scan.ckpt', 'scan.ckpt.results']
+
+    loaded = Checkpoint.load(path)
+    assert loaded.args.seed == 1234
+    assert loaded.shards == {0: PROGRESS}
+    assert not loaded.complete
+    # closed ports are not kept
+    assert list(loaded.results()) == [_event(53), _event(55, FILTERED)]
+
+
+def test_results_after_checkpoint_are_dropped(tmp_path):
+    path = str(tmp_path / 'scan.ckpt')
+    checkpoint = Checkpoint(path, _args())
+    checkpoint.open()
+    checkpoint.record(_event(53))
+    checkpoint.save()
+    # recorded after the last checkpoint, e.g. by a scan that crashed before saving again
+    checkpoint.record(_event(100))
+    checkpoint.log.flush()
+    checkpoint.close()
+
+    loaded = Checkpoint.load(path)
+    assert list(loaded.results()) == [_event(53)]
+    loaded.open()
+    loaded.record(_event(101))
+    loaded.save(complete=True)
+    loaded.close()
+    loaded = Checkpoint.load(path)
+    assert loaded.complete
+    assert list(loaded.results()) == [_event(53), _event(101)]
+
+
+@pytest.mark.parametrize('content', [None, '{"version": 1', '{"version": 99}', '{"version": 1, "args": {}}'])
+def test_unreadable_checkpoint(tmp_path, content):
+    path = tmp_path / 'scan.ckpt'
+    if content is not None:
+        path.write_text(content)
+    with pytest.raises(ValueError, match='Can not read checkpoint'):
+        Checkpoint.load(str(path))
+
+
+class EchoPorts:
+    """
+    Open udp ports on 127.0.0.1 answering every datagram with its copy, closed ports would wait
+    for the icmp rate limit of the host
+    """
+    def __init__(self, count: int):
+        self.sel = selectors.DefaultSelector()
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', 0))
+            self.sel.register(sock, selectors.EVENT_READ)
+        self.ports = [key.fileobj.getsockname()[1] for key in self.sel.get_map().values()]
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while self.running:
+            for key, _ in self.sel.select(timeout=0.05):
+                data, address = key.fileobj.recvfrom(2048)
+                key.fileobj.sendto(data, address)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        for key in list(self.sel.get_map().values()):
+            key.fileobj.close()
+        self.sel.close()
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason='raw icmp socket requires root')
+def test_interrupted_scan_is_resumed(tmp_path):
+    echo = EchoPorts(20)
+    try:
+        ports = PortSet((port, port) for port in echo.ports)
+        args = DataArguments(TargetSet.parse(['127.0.0.1']), {'udp': ports}, 0.3, False, False, 1,
+                             rate=200.0, checkpoint=str(tmp_path / 'scan.ckpt'), checkpoint_interval=0.0)
+        events = scan_events_parallel(args, 1)
+        first = [next(events) for _ in range(5)]
+        events.close()
+        checkpoint = Checkpoint.load(args.checkpoint)
+        assert not checkpoint.complete
+        assert 0 < checkpoint.shards[0]['udp']['position'] < len(echo.ports)
+
+        resumed = list(scan_events_parallel(dataclasses.replace(checkpoint.args, resume=True), 1))
+    finally:
+        echo.close()
+    # results saved before the interruption come first, every port is reported once
+    assert resumed[:5] == first
+    assert sorted(event.port for event in resumed) == sorted(echo.ports)
+    assert all(event.state == OPEN for event in resumed)
+    assert Checkpoint.load(args.checkpoint).complete
@@ -0,0 +1,217 @@
+import dataclasses
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from src.modules import helpers
+from src.modules.guess.FingerprintDB import DEFAULT_PATH, FingerprintDB, _first_bytes, default_db, sre_parse
+
+READ_TIMEOUT = 0.3
+SSH_BANNER = b'SSH-2.0-OpenSSH_8.9p1 Ubuntu-3ubuntu0.1\r\n'
+HTTP_ANSWER = b'HTTP/1.0 200 OK\r\nServer: nginx/1.18.0\r\nContent-Length: 0\r\n\r\n'
+DNS_STATUS_REQUEST = b'\0' * 12
+DNS_STATUS_ANSWER = b'\x00\x00\x80\x01' + b'\0' * 8
+DNS_VERSION_ANSWER = b'\x00\x06\x81\x80\x00\x01\x00\x00\x00\x00\x00\x00'
+
+
+def _ssh(conn: socket.socket, data: bytes) -> bytes:
+    return b''
+
+
+def _http(conn: socket.socket, data: bytes) -> bytes:
+    return HTTP_ANSWER if data.startswith(b'GET ') else b''
+
+
+def _dns(conn: socket.socket, data: bytes) -> bytes:
+    return DNS_STATUS_ANSWER if data == DNS_STATUS_REQUEST else b''
+
+
+def _echo(conn: socket.socket, data: bytes) -> bytes:
+    return data
+
+
+class TcpServer:
+    """
+    Loopback tcp stand-in: optional banner on connect, then answer() of every received chunk
+    """
+    def __init__(self, answer, banner: bytes = b''):
+        self.answer = answer
+        self.banner = banner
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        with conn:
+            try:
+                if self.banner:
+                    conn.sendall(self.banner)
+                while True:
+                    data = conn.recv(1024)
+                    if not data:
+                        return
+                    answer = self.answer(conn, data)
+                    if answer:
+                        conn.sendall(answer)
+            except OSError:
+                pass
+
+    def close(self):
+        self.sock.close()
+
+
+class UdpServer:
+    """
+    Loopback udp stand-in answering every datagram with answer(data), nothing if it is empty
+    """
+    def __init__(self, answer):
+        self.answer = answer
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except OSError:
+                return
+            answer = self.answer(data)
+            if answer:
+                self.sock.sendto(answer, address)
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def tcp_server():
+    servers = []
+
+    def start(answer, banner: bytes = b'') -> int:
+        servers.append(TcpServer(answer, banner))
+        return servers[-1].port
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def udp_server():
+    servers = []
+
+    def start(answer) -> int:
+        servers.append(UdpServer(answer))
+        return servers[-1].port
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.mark.parametrize('answer, banner, expected', [
+    (_ssh, SSH_BANNER, 'SSH (OpenSSH 8.9p1, protocol 2.0)'),
+    (_http, b'', 'HTTP (nginx 1.18.0)'),
+    (_echo, b'', 'ECHO'),
+    (_dns, b'', 'DNS'),
+    (_ssh, b'', ''),
+])
+def test_tcp_protocol(tcp_server, answer, banner, expected):
+    port = tcp_server(answer, banner)
+    assert helpers.get_protocols_to_tcp_port(port, '127.0.0.1', 1.0, READ_TIMEOUT) == expected
+
+
+def test_tcp_closed_port():
+    with socket.create_server(('127.0.0.1', 0)) as sock:
+        port = sock.getsockname()[1]
+    assert helpers.get_protocols_to_tcp_port(port, '127.0.0.1', 1.0, READ_TIMEOUT) == ''
+
+
+def test_udp_echo(udp_server):
+    port = udp_server(lambda data: data)
+    assert helpers.get_protocols_to_udp_port(port, '127.0.0.1', READ_TIMEOUT) == 'ECHO'
+
+
+def test_udp_silent(udp_server):
+    port = udp_server(lambda data: b'')
+    assert helpers.get_protocols_to_udp_port(port, '127.0.0.1', READ_TIMEOUT) == ''
+
+
+def test_udp_dns(udp_server, monkeypatch):
+    # the DNS probe is sent only to its ports, the stand-in listens on a free one
+    port = udp_server(lambda data: DNS_VERSION_ANSWER if data[2:4] == b'\x01\x00' else b'')
+    db = default_db()
+    probes = [dataclasses.replace(probe, ports=(port,)) if probe.name == 'DNSVersionBindReq' else probe
+              for probe in db.probes]
+    monkeypatch.setattr(helpers, 'default_db', lambda: FingerprintDB(probes, db.rules))
+    assert helpers.get_protocols_to_udp_port(port, '127.0.0.1', READ_TIMEOUT) == 'DNS'
+
+
+@pytest.mark.parametrize('pattern, ignore_case, expected', [
+    (rb'^SSH-', False, {ord('S')}),
+    (rb'^http', True, {ord('h'), ord('H')}),
+    (rb'^(?:GET|POST) ', False, {ord('G'), ord('P')}),
+    (rb'^[a-c]x', False, {ord('a'), ord('b'), ord('c')}),
+    (rb'^(x)+y', False, {ord('x')}),
+    (rb'^\x00\x06[\x80-\xff]', False, {0}),
+    (rb'^.', False, None),
+    (rb'^a*b', False, None),
+    (rb'^\d{3}', False, None),
+])
+def test_first_bytes(pattern, ignore_case, expected):
+    first = _first_bytes(sre_parse.parse(pattern), ignore_case)
+    assert first == (frozenset(expected) if expected is not None else None)
+
+
+def test_prefilter_combines_only_candidate_rules():
+    db = FingerprintDB.compile({'probes': [], 'matches': [
+        {'service': 'A', 'pattern': '^abc'},
+        {'service': 'B', 'pattern': '^x(\\d+)', 'version': '$1', 'flags': 'i'},
+        {'service': 'C', 'pattern': '.*any'},
+        {'service': 'D', 'pattern': '^abcd', 'probes': ['Probe']},
+    ]})
+    assert str(db.match(b'X12')) == 'B (12)'
+    assert sorted(rule.service for _, rule in db.combined[None, ord('X')][1].values()) == ['B', 'C']
+    # the first rule in file order wins, rules restricted to other probes are skipped
+    assert str(db.match(b'abcd')) == 'A'
+    assert str(db.match(b'zz any')) == 'C'
+    assert db.match(b'zzz') is None
+    assert sorted(rule.service for _, rule in db.combined[None, ord('a')][1].values()) == ['A', 'C']
+    assert str(db.match(b'abcd', 'Probe')) == 'A'
+    assert sorted(rule.service for _, rule in db.combined['Probe', ord('a')][1].values()) == ['A', 'C', 'D']
+
+
+def test_cache_reload(tmp_path, monkeypatch):
+    compiled = FingerprintDB.load(DEFAULT_PATH, cache_dir=str(tmp_path))
+    cached_files = os.listdir(tmp_path)
+    assert len(cached_files) == 1 and cached_files[0].endswith('.json')
+
+    def no_compile(cls, data):
+        raise AssertionError('database was parsed again')
+    monkeypatch.setattr(FingerprintDB, 'compile', classmethod(no_compile))
+    cached = FingerprintDB.load(DEFAULT_PATH, cache_dir=str(tmp_path))
+    assert cached.probes == compiled.probes
+    assert cached.rules == compiled.rules
+    assert str(cached.match(SSH_BANNER)) == 'SSH (OpenSSH 8.9p1, protocol 2.0)'
+
+
+def test_broken_cache_is_rebuilt(tmp_path):
+    FingerprintDB.load(DEFAULT_PATH, cache_dir=str(tmp_path))
+    cache_path = tmp_path / os.listdir(tmp_path)[0]
+    cache_path.write_text('{"probes": [["broken"]]')
+    db = FingerprintDB.load(DEFAULT_PATH, cache_dir=str(tmp_path))
+    assert str(db.match(SSH_BANNER)) == 'SSH (OpenSSH 8.9p1, protocol 2.0)'
+    assert FingerprintDB._from_cache(json.loads(cache_path.read_text())).rules == db.rules
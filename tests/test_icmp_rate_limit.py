@@ -0,0 +1,185 @@
+import heapq
+import os
+import selectors
+import socket
+import threading
+
+import pytest
+
+from src.modules.protocols.ICMP import ICMP
+from src.modules.scanners import Pacer as pacer_module
+from src.modules.scanners.IcmpRateLimit import IcmpRateLimit
+from src.modules.scanners.Pacer import TokenBucket
+from src.modules.scanners.ScanEvent import OPEN, CLOSED, FILTERED
+from src.modules.scanners.UDPScanner import UDPScanner
+
+BURST = 6
+""" unreachables a Linux host sends before its icmp_ratelimit token bucket runs dry """
+
+
+class Clock:
+    now = 0.0
+
+    def perf_counter(self) -> float:
+        return self.now
+
+
+def emulate(monkeypatch, rate: float, ports: int, filtered=(), timeout: float = 0.05, rtt: float = 0.002,
+            send_interval: float = 0.0005):
+    """
+    Scan of closed ports of a target limiting unreachables to rate per second, with simulated time:
+    probes are sent every send_interval while the limiter admits them, silent probes are handed to
+    on_silent() after timeout and re-probed when the target allows, like UDPScanner does
+    :param filtered: ports that never answer
+    :return: limiter, attempt that got an unreachable by port, send times
+    """
+    clock = Clock()
+    monkeypatch.setattr(pacer_module, 'time', clock)
+    target = TokenBucket(rate, BURST)
+    limit = IcmpRateLimit()
+    waiting = [(port, 0) for port in range(ports)]
+    held = []
+    events = []
+    closed = {}
+    sends = []
+    while waiting or held or events:
+        probes = held or waiting
+        if probes and limit.admit():
+            port, attempt = probes.pop(0)
+            sends.append(clock.now)
+            if port not in filtered and target.consume():
+                heapq.heappush(events, (clock.now + rtt, True, port, clock.now, attempt))
+            else:
+                heapq.heappush(events, (clock.now + timeout, False, port, clock.now, attempt))
+            clock.now += send_interval
+        else:
+            wakeups = [events[0][0]] if events else []
+            if probes:
+                wakeups.append(clock.now + max(limit.delay(), 0.0001))
+            clock.now = min(wakeups)
+        while events and events[0][0] <= clock.now:
+            now, unreachable, port, sent, attempt = heapq.heappop(events)
+            if unreachable:
+                limit.on_error(port, sent, now)
+                closed[port] = attempt
+            elif limit.on_silent(port, sent, now, attempt, 0):
+                held.append((port, attempt + 1))
+    return limit, closed, sends
+
+
+@pytest.mark.parametrize('rate', [20.0, 100.0])
+def test_rate_is_detected(monkeypatch, rate):
+    limit, _, _ = emulate(monkeypatch, rate, 300)
+    assert limit.limited
+    assert 0.8 * rate <= limit.rate <= 1.25 * rate
+
+
+@pytest.mark.parametrize('rate', [20.0, 100.0])
+def test_held_probes_are_released_at_the_detected_rate(monkeypatch, rate):
+    limit, _, sends = emulate(monkeypatch, rate, 300)
+    end = sends[-1]
+    window = 2.0
+    sent = sum(1 for time in sends if time > end - window)
+    assert 0.8 * limit.rate <= sent / window <= 1.25 * limit.rate
+
+
+def test_closed_ports_with_suppressed_unreachables_are_found(monkeypatch):
+    _, closed, _ = emulate(monkeypatch, 20.0, 300)
+    assert sorted(closed) == list(range(300))
+    # most ports needed a re-probe after their unreachable was suppressed
+    assert sum(1 for attempt in closed.values() if attempt > 0) > 100
+
+
+def test_silent_ports_are_not_closed(monkeypatch):
+    filtered = set(range(5, 300, 30))
+    _, closed, _ = emulate(monkeypatch, 20.0, 300, filtered)
+    assert not filtered & set(closed)
+    assert set(closed) == set(range(300)) - filtered
+
+
+def test_filtered_target_is_not_paced(monkeypatch):
+    # a few unreachables and then only silence: the ports are filtered, not rate limited
+    filtered = set(range(10, 200))
+    limit, closed, _ = emulate(monkeypatch, 1000.0, 200, filtered)
+    assert sorted(closed) == list(range(10))
+    assert not limit.limited
+
+
+class EchoServer(threading.Thread):
+    """
+    Open udp ports on 127.0.0.1 answering every datagram with its copy
+    """
+    def __init__(self, ports):
+        super().__init__(daemon=True)
+        self.sel = selectors.DefaultSelector()
+        for port in ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', port))
+            sock.setblocking(False)
+            self.sel.register(sock, selectors.EVENT_READ)
+        self.running = True
+
+    def run(self):
+        while self.running:
+            for key, _ in self.sel.select(timeout=0.1):
+                try:
+                    data, address = key.fileobj.recvfrom(2048)
+                    key.fileobj.sendto(data, address)
+                except OSError:
+                    pass
+
+    def stop(self):
+        self.running = False
+        self.join()
+        for key in list(self.sel.get_map().values()):
+            key.fileobj.close()
+        self.sel.close()
+
+
+class LimitedScanner(UDPScanner):
+    """
+    UDP scanner of 127.0.0.1 dropping unreachables beyond the token bucket of an emulated target
+    and of filtered ports
+    """
+    target: TokenBucket = None
+    silent_ports = frozenset()
+
+    def handle_package(self, sock, data, address, finish):
+        if sock is self.icmp_socket:
+            port = ICMP(data).get_destination_port()
+            if port in self.silent_ports or not self.target.consume():
+                return
+        super().handle_package(sock, data, address, finish)
+
+
+def _free_udp_ports(count: int):
+    sockets = []
+    for _ in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        sockets.append(sock)
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason='raw icmp socket requires root')
+def test_udp_scan_of_rate_limited_target():
+    ports = _free_udp_ports(60)
+    open_ports = set(ports[::20])
+    filtered = set(ports[7::20])
+    echo = EchoServer(open_ports)
+    echo.start()
+    try:
+        LimitedScanner.target = TokenBucket(50.0, BURST)
+        LimitedScanner.silent_ports = frozenset(filtered)
+        scanner = LimitedScanner('127.0.0.1', ports, 0.3)
+        states = {}
+        scanner.add_listener(lambda event: states.__setitem__(event.port, event.state), keep_results=False)
+        scanner.start_scan()
+    finally:
+        echo.stop()
+    truth = {port: OPEN if port in open_ports else FILTERED if port in filtered else CLOSED for port in ports}
+    assert states == truth
+    assert scanner.limits.get('127.0.0.1').limited
@@ -0,0 +1,17 @@
+from src.modules.transport.PacketRing import read_neighbors
+
+TABLE = """IP address       HW type     Flags       HW address            Mask     Device
+10.10.0.2        0x1         0x2         9e:1a:d4:6d:73:b1     *        veth0
+10.10.0.3        0x1         0x0         00:00:00:00:00:00     *        veth0
+192.0.2.1        0x1         0x2         02:fc:00:00:00:05     *        eth0
+10.10.0.4        0x1         0x6         02:00:00:00:00:04     *        veth0
+"""
+
+
+def test_read_neighbors_takes_complete_entries_of_interface(tmp_path):
+    path = tmp_path / 'arp'
+    path.write_text(TABLE)
+    assert read_neighbors('veth0', str(path)) == {'10.10.0.2': bytes.fromhex('9e1ad46d73b1'),
+                                                  '10.10.0.4': bytes.fromhex('020000000004')}
+    assert read_neighbors('eth0', str(path)) == {'192.0.2.1': bytes.fromhex('02fc00000005')}
+    assert read_neighbors('eth1', str(path)) == {}
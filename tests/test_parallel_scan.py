@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from src.modules.console.ArgParser import ArgParser
+from src.modules.console.DataArguments import DataArguments
+from src.modules.scanners import ParallelScan
+from src.modules.scanners.ScanEvent import ScanEvent, OPEN
+from src.modules.structures.PortSet import PortSet
+from src.modules.structures.TargetSet import TargetSet
+
+
+def _args() -> DataArguments:
+    return DataArguments(TargetSet.parse(['127.0.0.1']), {'udp': PortSet.parse('1-10')}, 0.1, False, False, 1)
+
+
+def _worker(args, shard, queue, resume, samples):
+    queue.put((shard[0], 'events', [ScanEvent('udp', '127.0.0.1', shard[0] + 1, OPEN, 1)]))
+    queue.put((shard[0], 'done', []))
+
+
+def _killed_worker(args, shard, queue, resume, samples):
+    # shard 2 dies without reporting, like a worker killed by the OOM killer
+    if shard[0] == 1:
+        os._exit(9)
+    _worker(args, shard, queue, resume, samples)
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(ParallelScan, 'LIVENESS_INTERVAL', 0.05)
+
+
+def test_workers_exiting_after_their_report(monkeypatch, fast_polling):
+    monkeypatch.setattr(ParallelScan, '_worker', _worker)
+    events = list(ParallelScan.scan_events_parallel(_args(), 3))
+    assert sorted(event.port for event in events) == [1, 2, 3]
+
+
+def test_dead_worker_names_its_shard(monkeypatch, fast_polling):
+    monkeypatch.setattr(ParallelScan, '_worker', _killed_worker)
+    with pytest.raises(RuntimeError, match='shard 2/3 exited with code 9'):
+        list(ParallelScan.scan_events_parallel(_args(), 3))
+
+
+def test_workers_beyond_source_ports_are_rejected():
+    assert ArgParser(['127.0.0.1', 'tcp/80', '-j', str(ParallelScan.MAX_WORKERS)]).parse().threads == \
+        ParallelScan.MAX_WORKERS
+    with pytest.raises(ValueError, match='at most'):
+        ArgParser(['127.0.0.1', 'tcp/80', '-j', str(ParallelScan.MAX_WORKERS + 1)]).parse()
@@ -0,0 +1,32 @@
+import pytest
+
+from src.modules.structures.Permutation import Permutation
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 16, 17, 1000, 4097])
+def test_permutation_is_bijection(size):
+    for seed in range(5):
+        assert sorted(Permutation(size, seed)) == list(range(size))
+
+
+@pytest.mark.parametrize('size', [5, 17, 1000])
+def test_cycle_walking(size):
+    permutation = Permutation(size, 1)
+    domain = 1 << (2 * permutation.half_bits)
+    assert domain > size
+    # the cipher permutes the whole domain, some indexes leave range(size) and are walked back into it
+    assert sorted(permutation._encrypt(value) for value in range(domain)) == list(range(domain))
+    assert any(permutation._encrypt(index) >= size for index in range(size))
+
+
+def test_same_seed_gives_same_order():
+    assert list(Permutation(1000, 7)) == list(Permutation(1000, 7))
+    assert list(Permutation(1000, 7)) != list(Permutation(1000, 8))
+    assert list(Permutation(1000)) != list(range(1000))
+
+
+def test_index_out_of_range():
+    permutation = Permutation(10, 1)
+    for index in (-1, 10):
+        with pytest.raises(IndexError):
+            permutation[index]
@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from src.modules.console.ArgParser import ArgParser
+from src.modules.structures.PortSet import MAX_PORT, PortSet
+
+
+def _random_ports(generator: random.Random) -> PortSet:
+    intervals = []
+    for _ in range(generator.randrange(1, 20)):
+        start = generator.randrange(1, 400)
+        intervals.append((start, min(start + generator.randrange(30), 400)))
+    return PortSet(intervals)
+
+
+@pytest.mark.parametrize('spec, ports', [
+    ('80', [80]),
+    ('22,80,8000-8003', [22, 80, 8000, 8001, 8002, 8003]),
+    ('5-7, 1-5,6 ,,', [1, 2, 3, 4, 5, 6, 7]),
+    ('65534-65535', [65534, 65535]),
+])
+def test_parse(spec, ports):
+    port_set = PortSet.parse(spec)
+    assert list(port_set) == ports
+    assert [port_set[i] for i in range(len(port_set))] == ports
+    assert repr(PortSet.parse(repr(port_set))) == repr(port_set)
+
+
+@pytest.mark.parametrize('spec', ['0', '65536', '1-65536', '9-3', 'http', '1-x', '-5'])
+def test_wrong_spec(spec):
+    with pytest.raises(ValueError):
+        PortSet.parse(spec)
+
+
+def test_membership_and_indexing():
+    ports = PortSet.parse('1,7-9,16,65535')
+    assert [port for port in range(-1, MAX_PORT + 2) if port in ports] == [1, 7, 8, 9, 16, 65535]
+    assert len(ports) == 6 and ports[5] == 65535
+    for index in (-1, 6):
+        with pytest.raises(IndexError):
+            ports[index]
+
+
+def test_from_ports():
+    assert PortSet.from_ports(range(5, 10)) == PortSet([(5, 9)])
+    assert PortSet.from_ports([9, 5, 6, 7, 8]) == PortSet([(5, 9)])
+    assert len(PortSet.from_ports(range(5, 5))) == 0
+
+
+def test_union_and_difference():
+    ports = PortSet.parse('1-100,200-300')
+    assert ports | PortSet.parse('101-150,250-400') == PortSet.parse('1-150,200-400')
+    assert ports - PortSet.parse('1-10,50,95-205,300-400') == PortSet.parse('11-49,51-94,206-299')
+    assert ports - ports == PortSet()
+    assert ports - PortSet() == ports
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_operations_match_sets(seed):
+    generator = random.Random(seed)
+    first, second = _random_ports(generator), _random_ports(generator)
+    assert set(first | second) == set(first) | set(second)
+    assert set(first - second) == set(first) - set(second)
+    assert list(first - second) == sorted(set(first) - set(second))
+    assert {port for port in range(1, 500) if port in first - second} == set(first) - set(second)
+
+
+def test_excluded_ports():
+    args = ArgParser(['10.0.0.1', 'tcp/1-100', 'udp/53,161', '--exclude-ports', 'tcp/20-30',
+                      '--exclude-ports', 'udp/161']).parse()
+    assert args.ports['tcp'] == PortSet.parse('1-19,31-100')
+    assert args.ports['udp'] == PortSet.parse('53')
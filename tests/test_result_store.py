@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from src.modules.scanners.ScanEvent import ScanEvent, OPEN, CLOSED, FILTERED
+from src.modules.structures.ResultStore import Change, ResultStore, StoreRecord, StoreWriter, diff
+
+
+def _write(path, events, close: bool = True) -> str:
+    writer = StoreWriter(str(path))
+    for event in events:
+        writer.add(ScanEvent(*event))
+    if close:
+        writer.close()
+    else:
+        writer.flush()
+    return str(path)
+
+
+def _random_results(generator: random.Random):
+    results = {}
+    for _ in range(300):
+        key = (generator.choice(['tcp', 'udp']), f'10.0.{generator.randrange(3)}.{generator.randrange(20)}',
+               generator.randrange(1, 200))
+        results[key] = generator.choice([OPEN, FILTERED])
+    return results
+
+
+def test_records_are_sorted(tmp_path):
+    path = _write(tmp_path / 'a.store', [
+        ('udp', '10.0.0.2', 53, OPEN, 4),
+        ('tcp', '10.0.0.10', 22, OPEN, 1),
+        ('tcp', '10.0.0.2', 443, OPEN, 2),
+        ('tcp', '10.0.0.2', 80, CLOSED, 0),
+        ('tcp', '10.0.0.2', 22, FILTERED, 0),
+    ])
+    with ResultStore(path) as store:
+        assert len(store) == 4 and store.hosts == 2
+        assert list(store) == [
+            StoreRecord('10.0.0.2', 'tcp', 22, FILTERED, 0),
+            StoreRecord('10.0.0.2', 'tcp', 443, OPEN, 2),
+            StoreRecord('10.0.0.2', 'udp', 53, OPEN, 4),
+            StoreRecord('10.0.0.10', 'tcp', 22, OPEN, 1),
+        ]
+        assert store.host_records('10.0.0.10') == [StoreRecord('10.0.0.10', 'tcp', 22, OPEN, 1)]
+        assert store.host_records('10.0.0.3') == []
+        assert store.host_records('10.0.0.1') == [] and store.host_records('10.0.0.11') == []
+
+
+def test_last_row_of_a_port_wins(tmp_path):
+    path = _write(tmp_path / 'a.store', [('tcp', '10.0.0.1', 80, FILTERED, 0), ('tcp', '10.0.0.1', 80, OPEN, 3)])
+    with ResultStore(path) as store:
+        assert list(store) == [StoreRecord('10.0.0.1', 'tcp', 80, OPEN, 3)]
+
+
+def test_interrupted_store_is_readable(tmp_path):
+    path = _write(tmp_path / 'a.store', [('tcp', '10.0.0.2', 80, OPEN, 1), ('tcp', '10.0.0.1', 80, OPEN, 2)],
+                  close=False)
+    with open(path, 'ab') as f:
+        f.write(b'\x0a\x00')
+    with ResultStore(path) as store:
+        assert [record.host for record in store] == ['10.0.0.1', '10.0.0.2']
+
+
+@pytest.mark.parametrize('content', [b'', b'JUNK' + bytes(20), b'PSRS\x00\x09' + bytes(18),
+                                     b'PSRS\x00\x01\x00\x01' + (5).to_bytes(8, 'big') + bytes(8)])
+def test_unreadable_store(tmp_path, content):
+    path = tmp_path / 'a.store'
+    path.write_bytes(content)
+    with pytest.raises(ValueError, match='Can not read store'):
+        ResultStore(str(path))
+
+
+def test_diff(tmp_path):
+    old = _write(tmp_path / 'old.store', [
+        ('tcp', '10.0.0.1', 22, OPEN, 1),
+        ('tcp', '10.0.0.1', 80, OPEN, 1),
+        ('udp', '10.0.0.1', 53, FILTERED, 0),
+        ('tcp', '10.0.0.2', 22, OPEN, 1),
+        ('tcp', '10.0.0.5', 22, OPEN, 1),
+    ])
+    new = _write(tmp_path / 'new.store', [
+        ('tcp', '10.0.0.1', 22, OPEN, 7),
+        ('udp', '10.0.0.1', 53, OPEN, 2),
+        ('tcp', '10.0.0.1', 443, OPEN, 1),
+        ('tcp', '10.0.0.2', 22, OPEN, 1),
+        ('tcp', '10.0.0.3', 25, FILTERED, 0),
+    ])
+    with ResultStore(old) as old_store, ResultStore(new) as new_store:
+        changes = list(diff(old_store, new_store))
+        # a changed round trip time is not a change of the port
+        assert changes == [
+            Change('10.0.0.1', 'tcp', 80, OPEN, None),
+            Change('10.0.0.1', 'tcp', 443, None, OPEN),
+            Change('10.0.0.1', 'udp', 53, FILTERED, OPEN),
+            Change('10.0.0.3', 'tcp', 25, None, FILTERED),
+            Change('10.0.0.5', 'tcp', 22, OPEN, None),
+        ]
+        assert [str(change) for change in changes[:3]] == ['- 10.0.0.1 tcp/80 open', '+ 10.0.0.1 tcp/443 open',
+                                                           '~ 10.0.0.1 udp/53 filtered -> open']
+        assert list(diff(old_store, new_store, '10.0.0.5')) == [Change('10.0.0.5', 'tcp', 22, OPEN, None)]
+        assert list(diff(old_store, new_store, '10.0.0.2')) == []
+        assert list(diff(old_store, old_store)) == []
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_diff_matches_comparison_of_results(tmp_path, seed):
+    generator = random.Random(seed)
+    old_results, new_results = _random_results(generator), _random_results(generator)
+    old = _write(tmp_path / 'old.store', [(*key, state, 1) for key, state in old_results.items()])
+    new = _write(tmp_path / 'new.store', [(*key, state, 1) for key, state in new_results.items()])
+    expected = {(host, protocol, port): (old_results.get((protocol, host, port)),
+                                         new_results.get((protocol, host, port)))
+                for protocol, host, port in old_results.keys() | new_results.keys()
+                if old_results.get((protocol, host, port)) != new_results.get((protocol, host, port))}
+    with ResultStore(old) as old_store, ResultStore(new) as new_store:
+        changes = list(diff(old_store, new_store))
+    assert {(change.host, change.protocol, change.port): (change.old, change.new) for change in changes} == expected
+    assert len(changes) == len(expected)
@@ -0,0 +1,117 @@
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from src.modules.protocols.DNS import RCODE_NXDOMAIN, encode_name, read_name, reverse_pointer
+from src.modules.scanners.ReverseResolver import PtrCache, ReverseResolver
+
+NAMES = {'10.0.0.1': 'host1.example', '10.0.0.3': 'late.example'}
+""" PTR records of the stub, other addresses do not exist """
+LOST = {'10.0.0.3'}
+""" addresses whose first query gets no reply """
+TTL = 300
+NEGATIVE_TTL = 60
+
+
+class StubDns:
+    """
+    PTR responder on 127.0.0.1: answers from NAMES, NXDOMAIN with an SOA record for other addresses
+    """
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+        self.records = {reverse_pointer(ip): name for ip, name in NAMES.items()}
+        self.lost = {reverse_pointer(ip) for ip in LOST}
+        self.queries = Counter()
+        self.ids = {}
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(512)
+            except OSError:
+                return
+            query_id = struct.unpack_from('!H', data)[0]
+            question, end = read_name(data, 12)
+            self.queries[question] += 1
+            self.ids.setdefault(question, set()).add(query_id)
+            if question in self.lost and self.queries[question] == 1:
+                continue
+            self.sock.sendto(self._answer(query_id, data[12:end + 4], question), address)
+
+    def _answer(self, query_id: int, question_section: bytes, question: str) -> bytes:
+        name = self.records.get(question)
+        if name is not None:
+            data = encode_name(name)
+            record = struct.pack('!HHHIH', 0xc00c, 12, 1, TTL, len(data)) + data
+            return struct.pack('!HHHHHH', query_id, 0x8180, 1, 1, 0, 0) + question_section + record
+        soa = encode_name('ns.example') + encode_name('admin.example') + \
+            struct.pack('!IIIII', 1, 3600, 600, 86400, NEGATIVE_TTL)
+        record = encode_name('in-addr.arpa') + struct.pack('!HHIH', 6, 1, TTL, len(soa)) + soa
+        return struct.pack('!HHHHHH', query_id, 0x8180 | RCODE_NXDOMAIN, 1, 0, 1, 0) + question_section + record
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def stub():
+    server = StubDns()
+    yield server
+    server.close()
+
+
+def _resolve(stub: StubDns, cache: PtrCache, ips):
+    resolver = ReverseResolver(stub.address, cache, timeout=0.2, retries=2)
+    try:
+        for ip in ips:
+            resolver.submit(ip)
+        return resolver.wait(resolver.lookup_timeout), resolver.queries
+    finally:
+        resolver.close()
+
+
+def test_name_and_nxdomain(stub):
+    names, queries = _resolve(stub, PtrCache(None), ['10.0.0.1', '10.0.0.2'])
+    assert names == {'10.0.0.1': 'host1.example'}
+    assert queries == 2
+
+
+def test_lost_reply_is_retransmitted_with_the_same_id(stub):
+    names, queries = _resolve(stub, PtrCache(None), ['10.0.0.3'])
+    assert names == {'10.0.0.3': 'late.example'}
+    question = reverse_pointer('10.0.0.3')
+    assert stub.queries[question] == 2
+    assert len(stub.ids[question]) == 1
+    assert queries == 2
+
+
+def test_cached_answers_are_reused(stub, tmp_path):
+    path = str(tmp_path / 'ptr-cache.json')
+    _resolve(stub, PtrCache(path), ['10.0.0.1', '10.0.0.2'])
+    cache = PtrCache(path)
+    assert cache.get('10.0.0.1') == (True, 'host1.example')
+    # negative answers are cached for the SOA minimum
+    assert cache.get('10.0.0.2') == (True, None)
+    assert abs(cache.entries['10.0.0.2'][1] - time.time() - NEGATIVE_TTL) < 5
+    assert abs(cache.entries['10.0.0.1'][1] - time.time() - TTL) < 5
+
+    asked = sum(stub.queries.values())
+    names, queries = _resolve(stub, cache, ['10.0.0.1', '10.0.0.2'])
+    assert names == {'10.0.0.1': 'host1.example'}
+    assert queries == 0
+    assert sum(stub.queries.values()) == asked
+
+
+def test_expired_entries_are_not_used(tmp_path):
+    cache = PtrCache(str(tmp_path / 'ptr-cache.json'))
+    cache.put('10.0.0.1', 'host1.example', TTL)
+    cache.entries['10.0.0.1'] = ('host1.example', 0.0)
+    assert cache.get('10.0.0.1') == (False, None)
@@ -0,0 +1,60 @@
+import pytest
+
+from src.modules.protocols.SynCookie import MAX_AGE, SynCookie
+
+KEY = bytes(range(16))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000]
+    monkeypatch.setattr(SynCookie, '_now_ms', staticmethod(lambda: now[0]))
+    return now
+
+
+def test_round_trip(clock):
+    cookie = SynCookie(2.0, KEY)
+    sequence = cookie.make('10.0.0.1', 443, 35000)
+    clock[0] += 250
+    assert cookie.check('10.0.0.1', 443, 35000, sequence + 1) == 0.25
+
+
+@pytest.mark.parametrize('ip, port, from_port, offset', [
+    ('10.0.0.2', 443, 35000, 1),
+    ('10.0.0.1', 444, 35000, 1),
+    ('10.0.0.1', 443, 35001, 1),
+    ('10.0.0.1', 443, 35000, 0),
+])
+def test_foreign_reply_is_rejected(clock, ip, port, from_port, offset):
+    cookie = SynCookie(2.0, KEY)
+    sequence = cookie.make('10.0.0.1', 443, 35000)
+    assert cookie.check(ip, port, from_port, sequence + offset) is None
+
+
+def test_other_key_is_rejected(clock):
+    sequence = SynCookie(2.0, KEY).make('10.0.0.1', 443, 35000)
+    assert SynCookie(2.0, bytes(16)).check('10.0.0.1', 443, 35000, sequence + 1) is None
+
+
+def test_expiry(clock):
+    cookie = SynCookie(2.0, KEY)
+    sequence = cookie.make('10.0.0.1', 443, 35000)
+    clock[0] += 2000
+    assert cookie.check('10.0.0.1', 443, 35000, sequence + 1) == 2.0
+    clock[0] += 1
+    assert cookie.check('10.0.0.1', 443, 35000, sequence + 1) is None
+
+
+def test_send_time_wraps(clock):
+    # the 16 bit millisecond stamp wraps between the probe and its reply
+    clock[0] = 0x3ffff
+    cookie = SynCookie(2.0, KEY)
+    sequence = cookie.make('10.0.0.1', 443, 35000)
+    clock[0] += 100
+    assert cookie.check('10.0.0.1', 443, 35000, (sequence + 1) & 0xffffffff) == 0.1
+
+
+@pytest.mark.parametrize('max_age', [0, MAX_AGE, -1])
+def test_max_age_is_checked(max_age):
+    with pytest.raises(ValueError):
+        SynCookie(max_age)
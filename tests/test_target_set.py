@@ -0,0 +1,47 @@
+import pytest
+
+from src.modules.structures.TargetSet import TargetSet
+
+
+@pytest.mark.parametrize('spec, first, last, size', [
+    ('10.0.0.7', '10.0.0.7', '10.0.0.7', 1),
+    ('10.0.0.9/24', '10.0.0.0', '10.0.0.255', 256),
+    ('10.0.0.250-10.0.1.5', '10.0.0.250', '10.0.1.5', 12),
+    ('10.0.0.1-50', '10.0.0.1', '10.0.0.50', 50),
+    ('0.0.0.0/0', '0.0.0.0', '255.255.255.255', 1 << 32),
+])
+def test_target_spec(spec, first, last, size):
+    targets = TargetSet.parse([spec])
+    assert len(targets) == size
+    assert targets[0] == first and targets[size - 1] == last
+
+
+@pytest.mark.parametrize('spec', ['10.0.0.1/33', '10.0.0.1/x', '10.0.0.5-3', '10.0.0.5-256', '10.0.0.5-10.0.0.4',
+                                  '10.0.0', '10.0.0.256', 'host.example'])
+def test_wrong_target_spec(spec):
+    with pytest.raises(ValueError):
+        TargetSet.parse([spec])
+
+
+def test_targets_are_merged():
+    targets = TargetSet.parse(['10.0.0.5-10, 10.0.0.1-4', '10.0.0.8-20', '10.0.1.0/31,10.0.0.30'])
+    assert targets.intervals == TargetSet.parse(['10.0.0.1-20', '10.0.0.30', '10.0.1.0-1']).intervals
+    assert len(targets) == 23
+    assert [targets[i] for i in (0, 19, 20, 21, 22)] == ['10.0.0.1', '10.0.0.20', '10.0.0.30', '10.0.1.0',
+                                                         '10.0.1.1']
+    assert list(targets)[19:] == ['10.0.0.20', '10.0.0.30', '10.0.1.0', '10.0.1.1']
+    assert '10.0.0.30' in targets and '10.0.0.21' not in targets and 'x' not in targets
+    with pytest.raises(IndexError):
+        targets[23]
+
+
+def test_target_union():
+    union = TargetSet.parse(['10.0.0.0/30']).union(TargetSet.parse(['10.0.0.4-6', '10.0.0.1']))
+    assert union.intervals == TargetSet.parse(['10.0.0.0-6']).intervals
+    assert repr(TargetSet.parse(['10.0.0.1', '10.0.0.3-4'])) == '10.0.0.1, 10.0.0.3-10.0.0.4'
+
+
+def test_targets_from_file(tmp_path):
+    path = tmp_path / 'targets.txt'
+    path.write_text('# scope\n10.0.0.1 10.0.0.2\n\n10.0.1.0/30  # lab\n')
+    assert TargetSet.from_file(str(path)).intervals == TargetSet.parse(['10.0.0.1-2', '10.0.1.0/30']).intervals
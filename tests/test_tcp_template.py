@@ -0,0 +1,75 @@
+import random
+import socket
+import struct
+
+import pytest
+
+from src.modules.protocols import TCPPackage as tcp_module
+from src.modules.protocols.TCPPackage import TCPPackage, TCPTemplate
+
+FLAGS = (0x02, 0x10, 0x12, 0x04, 0x14, 0x01, 0x3f, 0)
+PACKAGE_LEN = 20
+
+
+def _random_ip(rng: random.Random) -> str:
+    return socket.inet_ntoa(struct.pack('!I', rng.getrandbits(32)))
+
+
+def _random_probes(rng: random.Random, count: int):
+    return [(rng.randint(0, 0xffff), rng.randint(0, 0xffff), rng.getrandbits(32)) for _ in range(count)]
+
+
+def _expected(from_host: str, to_host: str, flags: int, probe) -> bytes:
+    from_port, to_port, sequence = probe
+    return TCPPackage(from_host, from_port, to_host, to_port, flags, sequence).build()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_build_equals_package_build(seed):
+    rng = random.Random(seed)
+    from_host, to_host = _random_ip(rng), _random_ip(rng)
+    for flags in FLAGS:
+        template = TCPTemplate(from_host, to_host, flags)
+        for probe in _random_probes(rng, 50) + [(0, 0, 0), (0xffff, 0xffff, 0xffffffff)]:
+            assert bytes(template.build(*probe)) == _expected(from_host, to_host, flags, probe)
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+@pytest.mark.parametrize('count', [1, 63, 64, 500])
+def test_build_batch_equals_package_build(use_numpy, count):
+    if use_numpy:
+        pytest.importorskip('numpy')
+    rng = random.Random(count)
+    for flags in FLAGS:
+        from_host, to_host = _random_ip(rng), _random_ip(rng)
+        template = TCPTemplate(from_host, to_host, flags)
+        probes = _random_probes(rng, count - 1) + [(0xffff, 0xffff, 0xffffffff)]
+        buffer = template.build_batch(probes, use_numpy=use_numpy)
+        assert len(buffer) == count * PACKAGE_LEN
+        for i, probe in enumerate(probes):
+            package = bytes(buffer[i * PACKAGE_LEN:(i + 1) * PACKAGE_LEN])
+            assert package == _expected(from_host, to_host, flags, probe)
+
+
+def test_build_batch_without_numpy_installed(monkeypatch):
+    # numpy failed to import: large batches take the pure python path
+    monkeypatch.setattr(tcp_module, 'numpy', False)
+    rng = random.Random(7)
+    from_host, to_host = _random_ip(rng), _random_ip(rng)
+    template = TCPTemplate(from_host, to_host, 0x02)
+    probes = _random_probes(rng, 256)
+    buffer = template.build_batch(probes)
+    assert [bytes(buffer[i * PACKAGE_LEN:(i + 1) * PACKAGE_LEN]) for i in range(len(probes))] == \
+        [_expected(from_host, to_host, 0x02, probe) for probe in probes]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_build_to_other_target_equals_package_build(seed):
+    # one template per source builds packages to every target
+    rng = random.Random(seed)
+    from_host = _random_ip(rng)
+    for flags in FLAGS:
+        template = TCPTemplate(from_host, _random_ip(rng), flags)
+        for probe in _random_probes(rng, 50):
+            to_host = _random_ip(rng)
+            assert bytes(template.build(*probe, to_host)) == _expected(from_host, to_host, flags, probe)
@@ -0,0 +1,99 @@
+import pytest
+
+from src.modules.structures import TimerWheel as timer_wheel_module
+from src.modules.structures.TimerWheel import TimerWheel
+
+MS = 1_000_000
+
+
+class Clock:
+    now = 5_000 * MS
+
+    def monotonic_ns(self) -> int:
+        return self.now
+
+    def advance(self, ms: float):
+        self.now += int(ms * MS)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(timer_wheel_module, 'time', clock)
+    return clock
+
+
+def test_objects_expire_after_action_time(clock):
+    expired = []
+    wheel = TimerWheel(0.1, lambda key, value: expired.append((key, value)))
+    wheel['a'] = 1
+    clock.advance(50)
+    wheel['b'] = 2
+    assert wheel.next_timeout() == pytest.approx(0.05)
+    clock.advance(49)
+    assert wheel.expire() == 0
+    clock.advance(1)
+    assert wheel.expire() == 1
+    assert expired == [('a', 1)]
+    assert 'a' not in wheel and len(wheel) == 1
+    clock.advance(50)
+    assert wheel.expire() == 1
+    assert expired == [('a', 1), ('b', 2)]
+    assert wheel.next_timeout() is None
+
+
+def test_update_keeps_deadline_and_set_reschedules(clock):
+    wheel = TimerWheel(0.1)
+    wheel['a'] = 1
+    wheel['b'] = 1
+    clock.advance(60)
+    wheel['a'] = 2
+    wheel.set('b', 2)
+    clock.advance(40)
+    assert wheel.expire() == 1
+    assert list(wheel) == ['b'] and wheel['b'] == 2
+    wheel.set('b', 3, timeout=0.01)
+    clock.advance(10)
+    assert wheel.expire() == 1
+    assert not wheel
+
+
+def test_deleted_objects_do_not_expire(clock):
+    expired = []
+    wheel = TimerWheel(0.1, lambda key, value: expired.append(key))
+    wheel['a'] = 1
+    wheel['b'] = 2
+    del wheel['a']
+    assert wheel.pop('b') == 2
+    assert wheel.pop('b', 'missing') == 'missing'
+    clock.advance(200)
+    assert wheel.expire() == 0
+    assert expired == []
+    assert wheel.next_timeout() is None
+
+
+def test_deadline_beyond_one_round(clock):
+    # 16 slots of 1 ms: the deadline 40 ms ahead shares its slot with earlier ticks
+    wheel = TimerWheel(0.04, slots=16)
+    wheel['a'] = 1
+    for _ in range(39):
+        clock.advance(1)
+        assert wheel.expire() == 0
+    clock.advance(1)
+    assert wheel.expire() == 1
+
+
+def test_long_pause_expires_everything(clock):
+    wheel = TimerWheel(0.01, slots=16)
+    for key in range(100):
+        wheel.set(key, key, timeout=key / 1000)
+    clock.advance(1000)
+    assert wheel.expire() == 100
+    assert not wheel
+
+
+def test_next_timeout_is_never_negative(clock):
+    wheel = TimerWheel(0.01)
+    wheel['a'] = 1
+    clock.advance(30)
+    assert wheel.next_timeout() == 0.0